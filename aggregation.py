@@ -0,0 +1,83 @@
+"""Grouped sums over the columnar expense table.
+
+Dates are held as day numbers (see columnar.py), so a period is just an
+integer key computed from them in one vectorised step: the day itself, the
+week (Monday based), the month or the year, counted from 1970. Grouping by
+period, by category or by both is then a bincount over the keys, or a sort
+and segment sums when the keys are too spread out for a dense count, and
+nothing formats a date until the few resulting groups are labelled.
+"""
+from datetime import date
+
+import numpy as np
+
+from columnar import day_number
+
+PERIODS = ("day", "week", "month", "year")
+
+# Largest key span counted with a dense bincount; wider spans are sorted
+DENSE_LIMIT = 1 << 22
+
+
+def period_keys(days, period):
+    """Integer period of each day number: days, weeks, months or years since 1970"""
+    days = np.asarray(days, dtype=np.int64)
+    if period == "day":
+        return days
+    if period == "week":
+        return (days + 3) // 7  # 1970-01-01 was a Thursday
+    if period == "month":
+        return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    if period == "year":
+        return days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def period_key(value, period):
+    """Period key of a single date or datetime"""
+    return int(period_keys(np.array([day_number(value)]), period)[0])
+
+
+def period_label(key, period):
+    """Display label of a period key: YYYY-MM-DD (days and week starts), YYYY-MM or YYYY"""
+    if period == "month":
+        return f"{1970 + key // 12}-{key % 12 + 1:02d}"
+    if period == "year":
+        return str(1970 + key)
+    day = key * 7 - 3 if period == "week" else key
+    return date.fromordinal(day + date(1970, 1, 1).toordinal()).isoformat()
+
+
+def grouped_sums(keys, values):
+    """(keys, sums, counts) for each distinct key, in key order"""
+    keys = np.asarray(keys, dtype=np.int64)
+    if not len(keys):
+        empty = np.empty(0, np.int64)
+        return empty, empty, empty
+    low = int(keys.min())
+    span = int(keys.max()) - low + 1
+    if span <= max(DENSE_LIMIT, 4 * len(keys)):
+        offsets = keys - low
+        counts = np.bincount(offsets, minlength=span)
+        # float64 sums are exact for totals under 2**53 cents
+        sums = np.bincount(offsets, weights=values, minlength=span)
+        present = np.flatnonzero(counts)
+        return present + low, np.rint(sums[present]).astype(np.int64), counts[present]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    sums = np.add.reduceat(np.asarray(values)[order], starts)
+    counts = np.diff(np.r_[starts, len(keys)])
+    return keys[starts], sums, counts
+
+
+def grouped_sums_by_category(keys, category_codes, category_count, values):
+    """(keys, category codes, sums, counts) for each (key, category) pair present"""
+    combined = np.asarray(keys, dtype=np.int64) * category_count + category_codes
+    combined, sums, counts = grouped_sums(combined, values)
+    return combined // category_count, combined % category_count, sums, counts
+
+
+def sum_between(days, values, start_day, end_day):
+    """Sum of the values whose day number is in [start_day, end_day)"""
+    return int(values[(days >= start_day) & (days < end_day)].sum())
@@ -0,0 +1,281 @@
+"""Asyncio version of the MongoDB storage.
+
+AsyncMongoStorage has the methods of MongoStorage as coroutines. Queries,
+pipelines and documents come from the same helpers in mongo_storage.py, so
+both backends share the change numbers and tombstones, and a script can run
+many users' stats, reports or exports concurrently on one event loop instead
+of a thread per request:
+
+    async def totals(names):
+        db = get_async_database()
+        return await asyncio.gather(*(AsyncMongoStorage(db, name).get_summary(start, end)
+                                      for name in names))
+
+manage.py stats uses it that way. EventLoopThread runs a loop in a daemon
+thread for callers that are not async themselves:
+BackgroundExecutor.submit_async hands it coroutines from the Tk thread, and
+BlockingStorage wraps an AsyncMongoStorage in the plain Storage interface,
+which is how the storage contract tests run against it.
+"""
+import asyncio
+import inspect
+import threading
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from mongo_storage import (CHANGES_FIELDS, COUNTER_FIELDS, CREDENTIAL_FIELDS, EXPENSE_FIELDS,
+                           EXPENSES_COLLECTION, INDEXES, PROFILE_FIELDS, TOMBSTONES_COLLECTION,
+                           USER_FIELDS, USERS_COLLECTION, allocate_pipeline, bump_pipeline,
+                           changes_window, embedded_batch_query, emptied_array, expense_query,
+                           expense_update, ids_query, index_conflict, migration_writes,
+                           new_documents, publish_pipeline, read_changes, read_summary,
+                           reserved, restamp, summary_pipeline, tombstone_documents)
+from storage import DuplicateUserError, UnknownUserError
+
+
+async def ensure_indexes(db):
+    """Create the indexes the collections are queried by"""
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except DuplicateKeyError as e:
+            index_conflict(collection, options, e)
+
+
+async def migrate_user_expenses(db, username, batch_size=500):
+    """Move a user's embedded expenses array into the expenses collection"""
+    users = db[USERS_COLLECTION]
+    moved = 0
+    while True:
+        user = await users.find_one(*embedded_batch_query(username, batch_size))
+        writes = migration_writes(username, user) if user else None
+        if writes is None:
+            break
+        upserts, pull = writes
+        await db[EXPENSES_COLLECTION].bulk_write(upserts, ordered=False)
+        await users.update_one({"_id": user["_id"]}, pull)
+        moved += len(upserts)
+    await users.update_one(*emptied_array(username))
+    return moved
+
+
+class AsyncMongoStorage:
+    """MongoStorage with coroutine methods, for use on an asyncio event loop"""
+    def __init__(self, db, username=None):
+        self.username = username
+        self.db = db
+        self.users_collection = db[USERS_COLLECTION]
+        self.expenses_collection = db[EXPENSES_COLLECTION]
+        self.tombstones_collection = db[TOMBSTONES_COLLECTION]
+
+    async def prepare(self):
+        """Create indexes and move embedded expenses out"""
+        await ensure_indexes(self.db)
+        if self.username:
+            await migrate_user_expenses(self.db, self.username)
+
+    async def close(self):
+        """The shared client is closed by db.close_async_client"""
+
+    async def find_user(self, username):
+        """Get a user's document by name"""
+        return await self.users_collection.find_one({"username": username}, USER_FIELDS)
+
+    async def get_credentials(self, username):
+        """Get just the _id and password hash of a user"""
+        return await self.users_collection.find_one({"username": username}, CREDENTIAL_FIELDS)
+
+    async def create_user(self, user):
+        """Insert a new user document"""
+        try:
+            await self.users_collection.insert_one(dict(user))
+        except DuplicateKeyError:
+            raise DuplicateUserError(user["username"])
+
+    async def update_password(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        await self.users_collection.update_one({"username": username},
+                                               {"$set": {"password": password_hash}})
+
+    async def get_user_data(self):
+        """Get the user's profile: name, creation date, budgets and revision"""
+        return await self.users_collection.find_one({"username": self.username}, PROFILE_FIELDS)
+
+    async def get_expenses(self):
+        """Get the user's expenses, newest first"""
+        cursor = self.expenses_collection.find({"username": self.username}, EXPENSE_FIELDS)
+        return await cursor.sort("date", DESCENDING).to_list()
+
+    async def iter_expenses(self, start=None, end=None, category=None, batch_size=1000):
+        """Stream the user's expenses, oldest first, from a server-side cursor"""
+        query = expense_query(self.username, start, end, category)
+        cursor = self.expenses_collection.find(query, EXPENSE_FIELDS, batch_size=batch_size)
+        async for expense in cursor.sort("date", ASCENDING):
+            yield expense
+
+    async def existing_ids(self, expense_ids):
+        """The ids (as strings) among `expense_ids` that the user still has"""
+        cursor = self.expenses_collection.find(ids_query(self.username, expense_ids), {"_id": 1})
+        return {str(expense["_id"]) async for expense in cursor}
+
+    async def get_budgets(self):
+        """Get the user's budgets"""
+        user_data = await self.users_collection.find_one({"username": self.username},
+                                                         {"budgets": 1})
+        return user_data.get("budgets", {})
+
+    async def get_summary(self, month_start, month_end):
+        """Total, this month's total and top category in one aggregation"""
+        pipeline = summary_pipeline(self.username, month_start, month_end)
+        cursor = await self.expenses_collection.aggregate(pipeline)
+        return read_summary(await cursor.next())
+
+    async def get_revision(self):
+        """Get the user's change counter, bumped by every write"""
+        user = await self.users_collection.find_one({"username": self.username},
+                                                    {"revision": 1})
+        return user.get("revision", 0) if user else 0
+
+    async def changes_since(self, revision):
+        """Expenses changed and deleted after `revision`, or None if nothing changed"""
+        user = await self.users_collection.find_one({"username": self.username}, CHANGES_FIELDS)
+        window = changes_window(self.username, revision, user)
+        if window is None:
+            return None
+        expenses, tombstones = await asyncio.gather(
+            self.expenses_collection.find(window, EXPENSE_FIELDS).to_list(),
+            self.tombstones_collection.find(window, {"expense_id": 1}).to_list()
+        )
+        return read_changes(user, expenses, tombstones)
+
+    async def _allocate_revision(self):
+        """Reserve the next change number for the documents about to be written"""
+        user = await self.users_collection.find_one_and_update(
+            {"username": self.username},
+            allocate_pipeline(),
+            projection=COUNTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            raise UnknownUserError(self.username)
+        return user["seq_counter"]
+
+    async def _publish_revision(self, revision):
+        """Mark `revision` written, moving the changes on if its reservation expired"""
+        while not (await self.users_collection.update_one(
+                reserved(self.username, revision), publish_pipeline(revision))).matched_count:
+            stale, revision = revision, await self._allocate_revision()
+            await self.expenses_collection.update_many(*restamp(self.username, stale, revision))
+            await self.tombstones_collection.update_many(*restamp(self.username, stale, revision))
+        return revision
+
+    async def _bump_revision(self, fields=None):
+        """Take the next change number and publish it in one step, setting `fields` too.
+
+        Returns the number taken; the published revision stays below it while
+        an earlier expense write is still pending.
+        """
+        user = await self.users_collection.find_one_and_update(
+            {"username": self.username},
+            bump_pipeline(fields),
+            projection=COUNTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            raise UnknownUserError(self.username)
+        return user["seq_counter"]
+
+    async def add_expense(self, expense_data):
+        """Insert a new expense"""
+        return await self.insert_expenses([expense_data])
+
+    async def insert_expenses(self, expenses):
+        """Insert a batch of new expenses in one request"""
+        revision = await self._allocate_revision()
+        try:
+            await self.expenses_collection.insert_many(
+                new_documents(self.username, expenses, revision), ordered=False)
+        except BulkWriteError:
+            # Some made it in (sync retries hit duplicates): publish them anyway
+            await self._publish_revision(revision)
+            raise
+        return await self._publish_revision(revision)
+
+    async def update_expense(self, expense_id, new_data):
+        """Update the fields of an existing expense"""
+        return await self.update_expenses([expense_id], new_data)
+
+    async def delete_expense(self, expense_id):
+        """Delete an expense"""
+        return await self.delete_expenses([expense_id])
+
+    async def update_expenses(self, expense_ids, fields):
+        """Set the same fields on several expenses in one request"""
+        revision = await self._allocate_revision()
+        await self.expenses_collection.update_many(ids_query(self.username, expense_ids),
+                                                   expense_update(fields, revision))
+        return await self._publish_revision(revision)
+
+    async def delete_expenses(self, expense_ids):
+        """Delete several expenses in one request, leaving tombstones for sync"""
+        revision = await self._allocate_revision()
+        await self.tombstones_collection.insert_many(
+            tombstone_documents(self.username, expense_ids, revision))
+        await self.expenses_collection.delete_many(ids_query(self.username, expense_ids))
+        return await self._publish_revision(revision)
+
+    async def update_budgets(self, budgets):
+        """Replace the user's budgets"""
+        return await self._bump_revision({"budgets": budgets})
+
+
+class EventLoopThread:
+    """An asyncio event loop running in a daemon thread"""
+    def __init__(self, name="asyncio"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for its result"""
+        return self.submit(coro).result()
+
+    def stop(self):
+        """Stop the loop once the work already scheduled has run"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.loop.close()
+
+
+class BlockingStorage:
+    """The sync Storage interface over an AsyncMongoStorage, run on an EventLoopThread"""
+    def __init__(self, storage, loop_thread):
+        self.storage = storage
+        self.loop_thread = loop_thread
+
+    @property
+    def username(self):
+        return self.storage.username
+
+    def iter_expenses(self, *args, **kwargs):
+        expenses = self.storage.iter_expenses(*args, **kwargs)
+        try:
+            while True:
+                try:
+                    yield self.loop_thread.run(expenses.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.loop_thread.run(expenses.aclose())
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+        return lambda *args, **kwargs: self.loop_thread.run(method(*args, **kwargs))
@@ -1,9 +1,13 @@
+import logging
 import tkinter as tk
-from tkinter import ttk, messagebox
-import hashlib
+from tkinter import ttk, messagebox, font as tkfont
 from datetime import datetime
-from pymongo import MongoClient
-from bson.objectid import ObjectId
+from functools import lru_cache
+import passwords
+import prewarm
+from background import BackgroundExecutor
+from db import close_client
+from storage import DuplicateUserError, open_storage
 
 # Color and Font Themes
 DARK_BG_1 = "#121212"
@@ -15,43 +19,74 @@ TEXT_COLOR = "#FFFFFF"
 TEXT_COLOR_2 = "#E0E0E0"
 ERROR_COLOR = "#CF6679"
 SUCCESS_COLOR = "#03DAC6"
+WARNING_COLOR = "#FFA000"
 
 TITLE_FONT = ("Segoe UI", 24, "bold")
 HEADER_FONT = ("Segoe UI", 16, "bold")
 BODY_FONT = ("Segoe UI", 12)
 SMALL_FONT = ("Segoe UI", 10)
 
+log = logging.getLogger(__name__)
+
+def _hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+@lru_cache(maxsize=16)
+def gradient_rows(color1, color2, height):
+    """Photo data for a one pixel wide vertical gradient: one {#rrggbb} row per line"""
+    r1, g1, b1 = _hex_to_rgb(color1)
+    r2, g2, b2 = _hex_to_rgb(color2)
+    rows = []
+    for i in range(height):
+        ratio = i / height
+        rows.append("{#%02x%02x%02x}" % (int(r1 + (r2 - r1) * ratio),
+                                          int(g1 + (g2 - g1) * ratio),
+                                          int(b1 + (b2 - b1) * ratio)))
+    return " ".join(rows)
+
 class GradientFrame(tk.Canvas):
+    """Canvas with a vertical gradient background.
+
+    The gradient is one image item: a column of row colours (cached per colours
+    and height) tiled across the width by Tk in a single put. Resizes are
+    coalesced with after_idle, so dragging a window edge draws only the size
+    reached when Tk goes idle instead of once per <Configure> event.
+    """
     def __init__(self, parent, color1=DARK_BG_1, color2=DARK_BG_2, **kwargs):
         tk.Canvas.__init__(self, parent, **kwargs)
         self._color1 = color1
         self._color2 = color2
-        self.bind("<Configure>", self._draw_gradient)
-        self._draw_gradient()
-
-    def _draw_gradient(self, event=None):
+        self._image = None
+        self._size = None
+        self._pending = None
+        self.bind("<Configure>", self._schedule_draw)
+        self._schedule_draw()
+
+    def _schedule_draw(self, event=None):
+        if self._pending is None:
+            self._pending = self.after_idle(self._draw_gradient)
+
+    def _draw_gradient(self):
+        self._pending = None
+        size = (max(1, self.winfo_width()), max(1, self.winfo_height()))
+        if size == self._size:
+            return
+        width, height = size
+        image = tk.PhotoImage(master=self, width=width, height=height)
+        image.put(gradient_rows(self._color1, self._color2, height), to=(0, 0, width, height))
         self.delete("gradient")
-        width = self.winfo_width()
-        height = self.winfo_height()
-        for i in range(height):
-            color = self._interpolate(self._color1, self._color2, i/height)
-            self.create_line(0, i, width, i, tags=("gradient",), fill=color)
+        self.create_image(0, 0, anchor="nw", image=image, tags=("gradient",))
         self.lower("gradient")
+        # The canvas only holds the image by name, so keep the object alive
+        self._image = image
+        self._size = size
 
-    def _interpolate(self, color1, color2, ratio):
-        r1, g1, b1 = self._hex_to_rgb(color1)
-        r2, g2, b2 = self._hex_to_rgb(color2)
-        r = int(r1 + (r2 - r1) * ratio)
-        g = int(g1 + (g2 - g1) * ratio)
-        b = int(b1 + (b2 - b1) * ratio)
-        return self._rgb_to_hex(r, g, b)
-
-    def _hex_to_rgb(self, hex_color):
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-
-    def _rgb_to_hex(self, r, g, b):
-        return f'#{r:02x}{g:02x}{b:02x}'
+    def destroy(self):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        tk.Canvas.destroy(self)
 
 class AuthWindow(tk.Tk):
     def __init__(self):
@@ -59,42 +94,77 @@ class AuthWindow(tk.Tk):
         self.title("Expense Tracker - Authentication")
         self.geometry("800x600")
         self.minsize(400, 500)
+        # The window manager's close button calls wm_delete_window, not destroy
+        self.protocol("WM_DELETE_WINDOW", self.destroy)
 
-        self.client = MongoClient("mongodb+srv://<username>:<db-password>@expense-tracker.xvmac2e.mongodb.net/?retryWrites=true&w=majority&appName=expense-tracker")
-        self.db = self.client["expense_tracker"]
-        self.users_collection = self.db["users"]
+        # Configured storage backend, queried off the UI thread
+        self.storage = open_storage()
+        self.io = BackgroundExecutor(self)
 
         self.gradient = GradientFrame(self, color1=DARK_BG_1, color2=DARK_BG_2)
         self.gradient.pack(fill="both", expand=True)
 
+        # Named fonts that the resize handler scales; widgets using them follow
+        self.title_font = tkfont.Font(self, family="Segoe UI", size=24, weight="bold")
+        self.entry_font = tkfont.Font(self, family="Segoe UI", size=12)
+        self.error_font = tkfont.Font(self, family="Segoe UI", size=10)
+
+        self.layout_size = None
+        self.layout_pending = None
         self.create_auth_ui()
         self.bind('<Configure>', self.on_resize)
 
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Load the main window's modules, time the password hash and make sure
+        # the unique username index exists while the user types
+        prewarm.start()
+        self.io.submit(passwords.current_params)
+        self.io.submit(self.storage.prepare)
 
     def on_resize(self, event):
+        # The binding on the toplevel also sees every child's <Configure>
+        if event.widget is not self:
+            return
+        # One layout pass per burst of events, at the final size
+        if self.layout_pending is None:
+            self.layout_pending = self.after_idle(self.layout)
+
+    def layout(self):
+        """Fit the form and its fonts to the window size"""
+        self.layout_pending = None
+        size = (self.winfo_width(), self.winfo_height())
+        if size == self.layout_size:
+            return
+        self.layout_size = size
+
         self.container.place_configure(relx=0.5, rely=0.5, anchor="center",
-                                       width=min(400, self.winfo_width() - 40),
-                                       height=min(500, self.winfo_height() - 40))
-        base_size = min(self.winfo_width(), self.winfo_height())
+                                       width=min(400, size[0] - 40),
+                                       height=min(500, size[1] - 40))
+        base_size = min(size)
         title_font_size = max(16, min(24, base_size // 25))
         body_font_size = max(10, min(14, base_size // 50))
 
-        self.header.config(font=("Segoe UI", title_font_size, "bold"))
-
-        for widget in [self.login_username, self.login_password,
-                       self.signup_username, self.signup_password, self.signup_confirm]:
-            widget.config(font=("Segoe UI", body_font_size))
-
-        for label in [self.login_error, self.signup_error]:
-            label.config(font=("Segoe UI", max(8, body_font_size - 2)))
+        for font, font_size in ((self.title_font, title_font_size),
+                                (self.entry_font, body_font_size),
+                                (self.error_font, max(8, body_font_size - 2))):
+            if int(font.cget("size")) != font_size:
+                font.configure(size=font_size)
+
+    def destroy(self):
+        if self.layout_pending is not None:
+            self.after_cancel(self.layout_pending)
+            self.layout_pending = None
+        # Logged in or dismissed, this window's storage is done with; the main
+        # window opens its own. Only a signup still running is waited for: prepare
+        # and logins are reads, and may be stuck on an unreachable server
+        self.io.shutdown(wait=True)
+        self.storage.close()
+        super().destroy()
 
     def create_auth_ui(self):
         self.container = tk.Frame(self.gradient, bg=DARK_BG_2, bd=0)
         self.container.place(relx=0.5, rely=0.5, anchor="center", width=400, height=500)
 
-        self.header = tk.Label(self.container, text="Expense Tracker", font=TITLE_FONT,
+        self.header = tk.Label(self.container, text="Expense Tracker", font=self.title_font,
                                bg=DARK_BG_2, fg=ACCENT_COLOR)
         self.header.pack(pady=(20, 10))
 
@@ -122,7 +192,7 @@ class AuthWindow(tk.Tk):
         tk.Label(self.login_tab, text="Username", font=BODY_FONT,
              bg=DARK_BG_2, fg=TEXT_COLOR).pack(pady=(20, 5), anchor="w")
 
-        self.login_username = tk.Entry(self.login_tab, font=BODY_FONT, bg=DARK_BG_3,
+        self.login_username = tk.Entry(self.login_tab, font=self.entry_font, bg=DARK_BG_3,
                                    fg=TEXT_COLOR, insertbackground=TEXT_COLOR,
                                    borderwidth=0, highlightthickness=1,
                                    highlightbackground=DARK_BG_3, highlightcolor=ACCENT_COLOR)
@@ -134,7 +204,7 @@ class AuthWindow(tk.Tk):
         pw_frame = tk.Frame(self.login_tab, bg=DARK_BG_2)
         pw_frame.pack(fill="x", padx=20, pady=(0, 10))
 
-        self.login_password = tk.Entry(pw_frame, font=BODY_FONT, show="*",
+        self.login_password = tk.Entry(pw_frame, font=self.entry_font, show="*",
                                    bg=DARK_BG_3, fg=TEXT_COLOR, insertbackground=TEXT_COLOR,
                                    borderwidth=0, highlightthickness=1,
                                    highlightbackground=DARK_BG_3, highlightcolor=ACCENT_COLOR)
@@ -154,7 +224,7 @@ class AuthWindow(tk.Tk):
                           command=self.handle_login)
         login_btn.pack(fill="x", padx=20, pady=(10, 5), ipady=10)
 
-        self.login_error = tk.Label(self.login_tab, text="", font=SMALL_FONT,
+        self.login_error = tk.Label(self.login_tab, text="", font=self.error_font,
                                 bg=DARK_BG_2, fg=ERROR_COLOR)
         self.login_error.pack(pady=(5, 0))
 
@@ -170,7 +240,7 @@ class AuthWindow(tk.Tk):
         tk.Label(self.signup_tab, text="Username", font=BODY_FONT,
              bg=DARK_BG_2, fg=TEXT_COLOR).pack(pady=(15, 5), anchor="w")
 
-        self.signup_username = tk.Entry(self.signup_tab, font=("Segoe UI", 10), bg=DARK_BG_3,
+        self.signup_username = tk.Entry(self.signup_tab, font=self.entry_font, bg=DARK_BG_3,
                                     fg=TEXT_COLOR, insertbackground=TEXT_COLOR,
                                     borderwidth=0, highlightthickness=1,
                                     highlightbackground=DARK_BG_3, highlightcolor=ACCENT_COLOR)
@@ -182,7 +252,7 @@ class AuthWindow(tk.Tk):
         pw_frame = tk.Frame(self.signup_tab, bg=DARK_BG_2)
         pw_frame.pack(fill="x", padx=20, pady=(0, 10))
 
-        self.signup_password = tk.Entry(pw_frame, font=("Segoe UI", 10), show="*",
+        self.signup_password = tk.Entry(pw_frame, font=self.entry_font, show="*",
                                     bg=DARK_BG_3, fg=TEXT_COLOR, insertbackground=TEXT_COLOR,
                                     borderwidth=0, highlightthickness=1,
                                     highlightbackground=DARK_BG_3, highlightcolor=ACCENT_COLOR)
@@ -200,7 +270,7 @@ class AuthWindow(tk.Tk):
         cpw_frame = tk.Frame(self.signup_tab, bg=DARK_BG_2)
         cpw_frame.pack(fill="x", padx=20, pady=(0, 10))
 
-        self.signup_confirm = tk.Entry(cpw_frame, font=("Segoe UI", 10), show="*",
+        self.signup_confirm = tk.Entry(cpw_frame, font=self.entry_font, show="*",
                                    bg=DARK_BG_3, fg=TEXT_COLOR, insertbackground=TEXT_COLOR,
                                    borderwidth=0, highlightthickness=1,
                                    highlightbackground=DARK_BG_3, highlightcolor=ACCENT_COLOR)
@@ -220,7 +290,7 @@ class AuthWindow(tk.Tk):
                            command=self.handle_signup)
         signup_btn.pack(fill="x", padx=20, pady=(10, 0), ipady=3)
 
-        self.signup_error = tk.Label(self.signup_tab, text="", font=SMALL_FONT,
+        self.signup_error = tk.Label(self.signup_tab, text="", font=self.error_font,
                                  bg=DARK_BG_2, fg=ERROR_COLOR)
         self.signup_error.pack(pady=(5, 0))
 
@@ -255,25 +325,48 @@ class AuthWindow(tk.Tk):
             self.login_error.config(text="Please enter both username and password")
             return
 
-        try:
-            user = self.users_collection.find_one({"username": username})
-            if not user:
-                self.login_error.config(text="Username not found. Redirecting to Sign Up...")
-                self.after(1500, lambda: self.tab_control.select(self.signup_tab))
-                return
+        self.login_error.config(text="")
+        self.io.submit(self.check_credentials, username, password, spinner=self.login_tab,
+                       on_done=lambda result: self.finish_login(username, result),
+                       on_error=self.login_failed)
+
+    def check_credentials(self, username, password):
+        """Look the user up and verify the password (runs on a worker thread).
+
+        Returns None for an unknown user, else whether the password matched.
+        A matching password stored as legacy SHA-256 or with weaker scrypt
+        parameters is rehashed with the current ones.
+        """
+        credentials = self.storage.get_credentials(username)
+        if not credentials:
+            return None
+        if not passwords.verify_password(password, credentials["password"]):
+            return False
+        if passwords.needs_rehash(credentials["password"]):
+            try:
+                self.storage.update_password(username, passwords.hash_password(password))
+            except Exception:
+                # The old hash still works; try again on the next login
+                log.warning("Password rehash for %s failed", username, exc_info=True)
+        return True
+
+    def finish_login(self, username, result):
+        if result is None:
+            self.login_error.config(text="Username not found. Redirecting to Sign Up...")
+            self.after(1500, lambda: self.tab_control.select(self.signup_tab))
+            return
 
-            hashed_password = self.hash_password(password)
-            if user["password"] != hashed_password:
-                self.login_error.config(text="Incorrect password")
-                return
+        if not result:
+            self.login_error.config(text="Incorrect password")
+            return
 
-            self.destroy()
-            from main_app import ExpenseTrackerApp
-            ExpenseTrackerApp(username)
+        self.destroy()
+        from main_app import ExpenseTrackerApp
+        ExpenseTrackerApp(username)
 
-        except Exception as e:
-            self.login_error.config(text=f"Error: {str(e)}")
-            messagebox.showerror("Login Failed", str(e), parent=self)
+    def login_failed(self, error):
+        self.login_error.config(text=f"Error: {str(error)}")
+        messagebox.showerror("Login Failed", str(error), parent=self)
 
     def handle_signup(self):
         username = self.signup_username.get().strip()
@@ -292,28 +385,34 @@ class AuthWindow(tk.Tk):
             self.signup_error.config(text="Password must be at least 6 characters")
             return
 
-        if self.users_collection.find_one({"username": username}):
+        def create():
+            # The unique username index rejects a taken name with DuplicateUserError
+            self.storage.create_user({
+                "username": username,
+                "password": passwords.hash_password(password),
+                "created_at": datetime.now(),
+                "budgets": {}
+            })
+
+        self.signup_error.config(text="")
+        self.io.submit(create, spinner=self.signup_tab, write=True,
+                       on_done=lambda result: self.signup_done(),
+                       on_error=self.signup_failed)
+
+    def signup_done(self):
+        self.signup_error.config(text="Account created successfully!", fg=SUCCESS_COLOR)
+        self.tab_control.select(self.login_tab)
+        self.signup_username.delete(0, tk.END)
+        self.signup_password.delete(0, tk.END)
+        self.signup_confirm.delete(0, tk.END)
+
+    def signup_failed(self, error):
+        if isinstance(error, DuplicateUserError):
             self.signup_error.config(text="Username already exists")
-            return
-
-        new_user = {
-            "username": username,
-            "password": self.hash_password(password),
-            "created_at": datetime.now(),
-            "expenses": [],
-            "budgets": {}
-        }
-
-        try:
-            self.users_collection.insert_one(new_user)
-            self.signup_error.config(text="Account created successfully!", fg=SUCCESS_COLOR)
-            self.tab_control.select(self.login_tab)
-            self.signup_username.delete(0, tk.END)
-            self.signup_password.delete(0, tk.END)
-            self.signup_confirm.delete(0, tk.END)
-        except Exception as e:
-            self.signup_error.config(text=f"Error: {str(e)}")
+        else:
+            self.signup_error.config(text=f"Error: {str(error)}")
 
 if __name__ == '__main__':
     auth = AuthWindow()
     auth.mainloop()
+    close_client()
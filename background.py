@@ -0,0 +1,165 @@
+"""Run blocking data access off the Tk thread.
+
+Tk widgets may only be touched from the thread running the mainloop, so a
+BackgroundExecutor runs calls on a small thread pool and queues their results;
+the mainloop drains the queue with after() and runs the callbacks there.
+
+Requests can carry a tag (e.g. "view" for everything the current screen asked
+for). cancel(tag) makes the executor drop the results of every request made
+under that tag so far, so a slow answer never lands on a screen the user has
+already left.
+
+submit_async does the same for coroutines: they run on an asyncio event loop
+in its own thread (started on first use) and their results come back through
+the same queue, so callbacks, tags and spinners behave identically.
+
+Calls submitted with write=True are the only ones shutdown lets finish: reads
+and polls are cancelled, so closing never waits on an unreachable server.
+"""
+import logging
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for
+
+POLL_MS = 30
+SPINNER_FRAMES = "◐◓◑◒"
+SPINNER_MS = 120
+
+log = logging.getLogger(__name__)
+
+
+class Spinner(tk.Label):
+    """Small animated label shown over a panel while its data loads"""
+    def __init__(self, parent, **kwargs):
+        try:
+            background = parent.cget("bg")
+        except tk.TclError:
+            background = "#1E1E1E"  # ttk widgets have no bg option
+        super().__init__(parent, text=SPINNER_FRAMES[0], font=("Segoe UI", 18),
+                         bg=background, fg="#BB86FC", **kwargs)
+        self._frame = 0
+        self._after_id = self.after(SPINNER_MS, self._spin)
+
+    def _spin(self):
+        self._frame = (self._frame + 1) % len(SPINNER_FRAMES)
+        self.config(text=SPINNER_FRAMES[self._frame])
+        self._after_id = self.after(SPINNER_MS, self._spin)
+
+    def stop(self):
+        try:
+            self.after_cancel(self._after_id)
+            self.destroy()
+        except tk.TclError:
+            pass  # the panel is already gone
+
+
+class BackgroundExecutor:
+    """Thread pool whose results are delivered on the Tk thread"""
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="io")
+        self.results = queue.Queue()
+        self.generations = {}
+        self.pending = {}
+        self.writes = set()
+        self.loop_thread = None
+        self._after_id = root.after(POLL_MS, self._poll)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, tag=None, spinner=None,
+               write=False):
+        """Run fn(*args) in the pool; on_done(result) or on_error(exc) run on the Tk thread.
+
+        `spinner` is a widget to show a loading spinner over until the call finishes.
+        `write` marks a call that changes data: shutdown never cancels those.
+        """
+        future = self._track(self.pool.submit(fn, *args), on_done, on_error, tag, spinner)
+        if write:
+            self.writes = {pending for pending in self.writes if not pending.done()}
+            self.writes.add(future)
+        return future
+
+    def submit_async(self, coro, on_done=None, on_error=None, tag=None, spinner=None):
+        """Run a coroutine on the executor's event loop; callbacks as for submit"""
+        if self.loop_thread is None:
+            from async_storage import EventLoopThread
+            self.loop_thread = EventLoopThread()
+        return self._track(self.loop_thread.submit(coro), on_done, on_error, tag, spinner)
+
+    def _track(self, future, on_done, on_error, tag, spinner):
+        generation = self.generations.get(tag, 0)
+        indicator = None
+        if spinner is not None:
+            indicator = Spinner(spinner)
+            indicator.place(relx=0.5, rely=0.5, anchor="center")
+        self.pending.setdefault(tag, set()).add(future)
+        future.add_done_callback(lambda f: self.results.put(
+            (f, on_done, on_error, tag, generation, indicator)))
+        return future
+
+    def cancel(self, tag):
+        """Drop the results of all requests made so far under `tag`"""
+        self.generations[tag] = self.generations.get(tag, 0) + 1
+        for future in self.pending.pop(tag, ()):
+            future.cancel()
+
+    def busy(self, tag):
+        """Whether a request made under `tag` is still running"""
+        return bool(self.pending.get(tag))
+
+    def current(self, tag, callback):
+        """Wrap a callback so it only runs if `tag` is not cancelled in the meantime"""
+        generation = self.generations.get(tag, 0)
+
+        def guarded(*args):
+            if self.generations.get(tag, 0) == generation:
+                return callback(*args)
+        return guarded
+
+    def _poll(self):
+        while True:
+            try:
+                future, on_done, on_error, tag, generation, indicator = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.get(tag, set()).discard(future)
+            if indicator is not None:
+                indicator.stop()
+            if future.cancelled() or self.generations.get(tag, 0) != generation:
+                continue  # stale: nobody is waiting for this any more
+            try:
+                error = future.exception()
+                if error is None:
+                    if on_done:
+                        on_done(future.result())
+                elif on_error:
+                    on_error(error)
+                else:
+                    log.error("Background task failed", exc_info=error)
+            except Exception:
+                log.exception("Error handling background result")
+        try:
+            self._after_id = self.root.after(POLL_MS, self._poll)
+        except tk.TclError:
+            self.shutdown()  # window destroyed
+
+    def shutdown(self, wait=False):
+        """Stop accepting work and drop all results.
+
+        Queued reads are cancelled and running ones finish on their own; writes
+        always run. With `wait`, block until they have, so they reach storage
+        before it is closed (reads, which may be stuck waiting for an offline
+        server, are not waited for).
+        """
+        try:
+            self.root.after_cancel(self._after_id)
+        except tk.TclError:
+            pass
+        for futures in self.pending.values():
+            for future in futures:
+                if future not in self.writes:
+                    future.cancel()
+        self.pool.shutdown(wait=False)
+        if wait:
+            wait_for(self.writes)
+        if self.loop_thread is not None:
+            self.loop_thread.loop.call_soon_threadsafe(self.loop_thread.loop.stop)
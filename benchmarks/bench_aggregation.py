@@ -0,0 +1,91 @@
+"""Compare the period-key aggregation kernel with strftime-based pandas grouping.
+
+Builds N random expenses, then times the work behind the dashboard and the
+reports both ways: this month's total and the per-month, per-category totals.
+
+    python benchmarks/bench_aggregation.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from aggregation import grouped_sums_by_category, period_keys, sum_between  # noqa: E402
+from columnar import ExpenseColumns, day_number  # noqa: E402
+from expense_store import month_bounds  # noqa: E402
+
+CATEGORIES = ["Food", "Transportation", "Housing", "Entertainment", "Utilities",
+              "Healthcare", "Education", "Shopping", "Other"]
+
+
+def make_expenses(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.now() - timedelta(days=5 * 365)
+    offsets = rng.integers(0, 5 * 365 * 24 * 3600, rows)
+    categories = rng.integers(0, len(CATEGORIES), rows)
+    amounts = np.round(rng.uniform(1, 500, rows), 2)
+    return [{"_id": i, "date": start + timedelta(seconds=int(offset)),
+             "category": CATEGORIES[category], "amount": float(amount)}
+            for i, (offset, category, amount) in enumerate(zip(offsets, categories, amounts))]
+
+
+def timed(label, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<40}{best * 1000:10.1f} ms")
+    return best, result
+
+
+def with_pandas(df, current_month):
+    months = df["date"].dt.strftime("%Y-%m")
+    monthly = df.loc[months == current_month, "amount"].sum()
+    rollups = df.groupby([months, "category"])["amount"].sum()
+    return monthly, rollups
+
+
+def with_kernel(columns, month_start, month_end):
+    monthly = sum_between(columns.days, columns.cents,
+                          day_number(month_start), day_number(month_end))
+    rollups = grouped_sums_by_category(period_keys(columns.days, "month"),
+                                       columns.category_codes, len(columns.categories),
+                                       columns.cents)
+    return monthly, rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} expenses...")
+    expenses = make_expenses(args.rows)
+    month_start, month_end = month_bounds()
+
+    df = pd.DataFrame(expenses)
+    df["date"] = pd.to_datetime(df["date"])
+    columns = ExpenseColumns(expenses)
+
+    before, (pandas_monthly, pandas_rollups) = timed(
+        "pandas strftime + groupby", lambda: with_pandas(df, month_start.strftime("%Y-%m")),
+        args.repeat)
+    after, (kernel_monthly, kernel_rollups) = timed(
+        "period keys + bincount", lambda: with_kernel(columns, month_start, month_end),
+        args.repeat)
+
+    assert abs(pandas_monthly - kernel_monthly / 100) < 0.01
+    assert len(pandas_rollups) == len(kernel_rollups[0])
+    print(f"Speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Measure cold start: module import times and time to the first painted dashboard.
+
+Every sample runs in a fresh interpreter so nothing is already imported:
+
+- auth: importing the login window
+- main_app: importing the main window module
+- prewarm: importing everything prewarm.py loads while the login window is up
+- first_paint: importing main_app, opening the window on a throwaway SQLite
+  file holding --expenses rows and drawing the dashboard (needs a display)
+- warm_paint: the same again on the same file, drawn from the snapshot the
+  first window saved when it closed
+
+Results can be appended to a JSON Lines file to follow them over time, and
+budgets make the script exit with status 1 when a median goes over, so it
+can guard against regressions:
+
+    python benchmarks/bench_startup.py --record startup.jsonl --max-import-ms 400
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+IMPORT_SAMPLE = """
+import time
+started = time.perf_counter()
+{statement}
+print((time.perf_counter() - started) * 1000)
+"""
+
+PREWARM_STATEMENT = "import prewarm; prewarm._import_all(prewarm.MODULES)"
+
+FIRST_PAINT_SAMPLE = """
+import random, time
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from storage import open_storage
+
+rows = {rows}
+storage = open_storage("bench")
+if storage.find_user("bench") is None:
+    storage.create_user({{"username": "bench", "password": "", "created_at": datetime.now(),
+                         "budgets": {{"Food": 300.0, "Shopping": 200.0}}}})
+    now = datetime.now()
+    storage.insert_expenses([
+        {{"_id": ObjectId(), "date": now - timedelta(days=random.randint(0, 730)),
+          "category": random.choice(["Food", "Transport", "Shopping", "Utilities", "Other"]),
+          "amount": round(random.uniform(1, 200), 2), "description": "bench"}}
+        for _ in range(rows)
+    ])
+storage.close()
+
+started = time.perf_counter()
+import main_app
+
+class App(main_app.ExpenseTrackerApp):
+    def show_data(self, snapshot):
+        super().show_data(snapshot)
+        self.update_idletasks()
+        print((time.perf_counter() - started) * 1000)
+        self.after_idle(self.on_close)
+
+App("bench").mainloop()
+"""
+
+
+def sample(code, env=None):
+    """Run code in a fresh interpreter; returns the milliseconds it printed"""
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure(name, code, runs, env=None):
+    try:
+        times = [sample(code, env) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"{name:<14}skipped ({e})")
+        return None
+    median = statistics.median(times)
+    print(f"{name:<14}{median:9.1f} ms  (min {min(times):.1f}, max {max(times):.1f})")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--expenses", type=int, default=2000,
+                        help="expenses in the first-paint sample")
+    parser.add_argument("--record", help="append the results to this JSON Lines file")
+    parser.add_argument("--max-import-ms", type=float,
+                        help="fail if importing main_app takes longer")
+    parser.add_argument("--max-paint-ms", type=float,
+                        help="fail if the first paint takes longer")
+    parser.add_argument("--max-warm-paint-ms", type=float,
+                        help="fail if the first paint from a snapshot takes longer")
+    args = parser.parse_args()
+
+    results = {
+        "auth": measure("auth", IMPORT_SAMPLE.format(statement="import auth"), args.runs),
+        "main_app": measure("main_app", IMPORT_SAMPLE.format(statement="import main_app"),
+                            args.runs),
+        "prewarm": measure("prewarm", IMPORT_SAMPLE.format(statement=PREWARM_STATEMENT),
+                           args.runs),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, EXPENSE_TRACKER_STORAGE_BACKEND="sqlite",
+                   EXPENSE_TRACKER_STORAGE_SNAPSHOT_DIR=os.path.join(directory, "snapshots"))
+        paints = {"first_paint": [], "warm_paint": []}
+        try:
+            for run in range(args.runs):
+                # A new file each run, so every first sample loads the same data from scratch;
+                # the second opens it again and starts from the snapshot the first one saved
+                env["EXPENSE_TRACKER_STORAGE_SQLITE_PATH"] = os.path.join(directory, f"{run}.db")
+                for name in paints:
+                    paints[name].append(sample(FIRST_PAINT_SAMPLE.format(rows=args.expenses), env))
+        except RuntimeError as e:
+            print(f"{'first_paint':<14}skipped ({e})")
+    for name, times in paints.items():
+        results[name] = statistics.median(times) if times else None
+        if times:
+            print(f"{name:<14}{results[name]:9.1f} ms  (min {min(times):.1f}, max {max(times):.1f})")
+
+    if args.record:
+        with open(args.record, "a") as f:
+            f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                "python": sys.version.split()[0],
+                                "expenses": args.expenses, "ms": results}) + "\n")
+
+    failed = False
+    for name, limit in (("main_app", args.max_import_ms), ("first_paint", args.max_paint_ms),
+                        ("warm_paint", args.max_warm_paint_ms)):
+        if limit is not None and results[name] is not None and results[name] > limit:
+            print(f"{name} took {results[name]:.1f} ms, over the {limit:.0f} ms budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
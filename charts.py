@@ -0,0 +1,237 @@
+"""Dashboard charts that are drawn once and then updated in place.
+
+Each chart owns one Figure and one Tk canvas for the life of the dashboard.
+A refresh changes the data of the existing artists (the line's points, the
+pie's wedge angles, the bar heights) and asks for a redraw with draw_idle,
+instead of building a new figure each time. The figures are made with
+matplotlib.figure.Figure rather than pyplot, so they are never held in
+pyplot's registry and are freed with the dashboard by destroy().
+"""
+import math
+import tkinter as tk
+
+import matplotlib
+import matplotlib.style
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+from auth import ACCENT_COLOR, BODY_FONT, DARK_BG_2, DARK_BG_3, SUCCESS_COLOR, TEXT_COLOR, TEXT_COLOR_2
+
+PIE_EXPLODE = 0.05
+PIE_LABEL_DISTANCE = 1.1
+PIE_PCT_DISTANCE = 0.6
+
+_styled = False
+
+
+def use_chart_style():
+    """Apply the app's dark theme to matplotlib's defaults, once"""
+    global _styled
+    if _styled:
+        return
+    matplotlib.style.use("dark_background")
+    matplotlib.rcParams.update({
+        "axes.facecolor": DARK_BG_3,
+        "figure.facecolor": DARK_BG_2,
+        "text.color": TEXT_COLOR,
+        "axes.labelcolor": TEXT_COLOR,
+        "xtick.color": TEXT_COLOR,
+        "ytick.color": TEXT_COLOR,
+        "axes.titlecolor": TEXT_COLOR,
+        "axes.edgecolor": TEXT_COLOR_2,
+    })
+    _styled = True
+
+
+class Chart:
+    """A Figure on a Tk canvas, swapped for a message while there is nothing to show"""
+    def __init__(self, parent, figsize, empty_text, fill="both"):
+        self.figure = Figure(figsize=figsize, layout="tight")
+        self.figure.patch.set_facecolor(DARK_BG_2)
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.message = tk.Label(parent, text=empty_text, font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR)
+        self.fill = fill
+        self.showing = None
+
+    def show(self, has_data):
+        """Show the figure or the empty message"""
+        if has_data == self.showing:
+            return
+        self.showing = has_data
+        if has_data:
+            self.message.pack_forget()
+            self.widget.pack(fill=self.fill, expand=True, padx=5, pady=5)
+        else:
+            self.widget.pack_forget()
+            self.message.pack(fill=self.fill, expand=True)
+
+    def style(self, title):
+        ax = self.ax
+        ax.set_facecolor(DARK_BG_3)
+        ax.set_title(title, color=TEXT_COLOR, fontsize=10)
+        for spine in ax.spines.values():
+            spine.set_color(TEXT_COLOR_2)
+        ax.tick_params(axis="x", colors=TEXT_COLOR, labelsize=8)
+        ax.tick_params(axis="y", colors=TEXT_COLOR, labelsize=8)
+
+    def destroy(self):
+        self.figure.clear()
+        self.widget.destroy()
+        self.message.destroy()
+
+
+class MonthlyChart(Chart):
+    """Spending per month as a line"""
+    def __init__(self, parent):
+        super().__init__(parent, (4, 2.5), "No data available")
+        self.style("Monthly Spending")
+        self.ax.set_ylabel("Amount ($)", color=TEXT_COLOR, fontsize=8)
+        self.ax.tick_params(axis="x", rotation=45)
+        self.ax.grid(color=DARK_BG_3, linestyle="--", alpha=0.5)
+        self.line, = self.ax.plot([], [], color=ACCENT_COLOR, marker="o", linewidth=2)
+
+    def update(self, monthly_data):
+        self.show(bool(monthly_data))
+        if not monthly_data:
+            return
+        positions = range(len(monthly_data))
+        self.line.set_data(list(positions), list(monthly_data.values()))
+        self.ax.set_xticks(positions, list(monthly_data.keys()))
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
+
+
+class CategoryChart(Chart):
+    """Share of spending per category as a pie"""
+    def __init__(self, parent):
+        super().__init__(parent, (4, 2.5), "No data available")
+        self.ax.set_title("Category Breakdown", color=TEXT_COLOR, fontsize=10)
+        self.categories = None
+        self.wedges = []
+        self.texts = []
+        self.autotexts = []
+
+    def update(self, category_data):
+        self.show(bool(category_data))
+        if not category_data:
+            return
+        categories = list(category_data.keys())
+        values = list(category_data.values())
+        if categories != self.categories:
+            self._draw(categories, values)
+        else:
+            self._move_wedges(values)
+        self.canvas.draw_idle()
+
+    def _draw(self, categories, values):
+        """Lay the pie out from scratch when the set of categories changes"""
+        for artist in self.wedges + self.texts + self.autotexts:
+            artist.remove()
+        colors = matplotlib.colormaps["tab20"].colors[:len(categories)]
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            values, labels=categories, autopct="%1.1f%%", startangle=90, colors=colors,
+            explode=[PIE_EXPLODE] * len(categories), labeldistance=PIE_LABEL_DISTANCE,
+            pctdistance=PIE_PCT_DISTANCE,
+            textprops={"color": TEXT_COLOR, "fontsize": 8},
+            wedgeprops={"edgecolor": DARK_BG_2, "linewidth": 1})
+        for autotext in self.autotexts:
+            autotext.set_color("white")
+        self.categories = categories
+
+    def _move_wedges(self, values):
+        """Recompute the wedge angles and label positions for new values"""
+        total = sum(values)
+        theta = 90.0
+        for wedge, text, autotext, value in zip(self.wedges, self.texts, self.autotexts, values):
+            sweep = 360.0 * value / total if total else 0.0
+            middle = math.radians(theta + sweep / 2)
+            x, y = math.cos(middle), math.sin(middle)
+            center = (PIE_EXPLODE * x, PIE_EXPLODE * y)
+            wedge.set_center(center)
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + sweep)
+            text.set_position((center[0] + PIE_LABEL_DISTANCE * x,
+                               center[1] + PIE_LABEL_DISTANCE * y))
+            text.set_horizontalalignment("left" if x > 0 else "right")
+            autotext.set_position((center[0] + PIE_PCT_DISTANCE * x,
+                                   center[1] + PIE_PCT_DISTANCE * y))
+            autotext.set_text(f"{100.0 * value / total if total else 0:1.1f}%")
+            theta += sweep
+
+
+class BudgetChart(Chart):
+    """Spent and remaining budget per category as stacked bars"""
+    def __init__(self, parent):
+        super().__init__(parent, (8, 1.5), "No budget data available", fill="x")
+        self.categories = None
+        self.spent_bars = []
+        self.remaining_bars = []
+        self.labels = []
+
+    def update(self, budgets, spending):
+        self.show(bool(budgets))
+        if not budgets:
+            return
+        categories = list(budgets.keys())
+        spent = [spending.get(category, 0) for category in categories]
+        remaining = [max(0, budgets[category] - amount)
+                     for category, amount in zip(categories, spent)]
+        if categories != self.categories:
+            self._draw(categories, spent, remaining)
+        else:
+            for bar, amount in zip(self.spent_bars, spent):
+                bar.set_height(amount)
+            for bar, amount, bottom in zip(self.remaining_bars, remaining, spent):
+                bar.set_y(bottom)
+                bar.set_height(amount)
+            self.ax.relim()
+            self.ax.autoscale_view()
+        self._label(spent, remaining)
+        self.canvas.draw_idle()
+
+    def _draw(self, categories, spent, remaining):
+        """Rebuild the bars when the budgeted categories change"""
+        ax = self.ax
+        ax.clear()
+        self.style("Budget Progress")
+        index = range(len(categories))
+        self.spent_bars = ax.bar(index, spent, 0.6, color=ACCENT_COLOR, label="Spent")
+        self.remaining_bars = ax.bar(index, remaining, 0.6, bottom=spent,
+                                     color=SUCCESS_COLOR, label="Remaining")
+        ax.set_xticks(index, categories, rotation=45, color=TEXT_COLOR, fontsize=8)
+        ax.legend(facecolor=DARK_BG_3, labelcolor=TEXT_COLOR, fontsize=8)
+        self.labels = []
+        self.categories = categories
+
+    def _label(self, spent, remaining):
+        for label in self.labels:
+            label.remove()
+        self.labels = []
+        for i, (s, r) in enumerate(zip(spent, remaining)):
+            if s + r > 0:
+                self.labels.append(self.ax.text(i, s / 2, f"${s:.0f}", ha="center", va="center",
+                                                color="white", fontsize=8))
+                self.labels.append(self.ax.text(i, s + r / 2, f"${r:.0f}", ha="center",
+                                                va="center", color="white", fontsize=8))
+
+
+class DashboardCharts:
+    """The three dashboard charts, created once per dashboard"""
+    def __init__(self, monthly_parent, category_parent, budget_parent):
+        use_chart_style()
+        self.monthly = MonthlyChart(monthly_parent)
+        self.category = CategoryChart(category_parent)
+        self.budget = BudgetChart(budget_parent)
+
+    def update(self, monthly_data, category_data, budgets, spending):
+        """Show new totals; only artists whose data changed are touched"""
+        self.monthly.update(monthly_data)
+        self.category.update(category_data)
+        self.budget.update(budgets if monthly_data else {}, spending)
+
+    def destroy(self):
+        for chart in (self.monthly, self.category, self.budget):
+            chart.destroy()
@@ -0,0 +1,139 @@
+"""Columnar copy of a user's expenses for statistics, charts and reports.
+
+Every expense is one row across parallel NumPy arrays: the date as a day
+number (days since 1970-01-01), the category as a small integer code, the
+amount in whole cents and the description as a code into a table of interned
+strings. The table is built once from the loaded expenses and then kept
+current row by row, so aggregations (see aggregation.py) read the arrays in
+place instead of building a DataFrame from dicts and parsing dates on every
+redraw.
+
+Rows are unordered: appends go to the end (the arrays grow by doubling) and
+a removal moves the last row into the hole, so the live rows always form the
+prefix the column properties return as views.
+"""
+import sys
+from datetime import date
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+COLUMNS = {"days": np.int64, "category_codes": np.int16,
+           "cents": np.int64, "description_codes": np.int32}
+
+
+def day_number(value):
+    """Days since 1970-01-01 of a date or datetime"""
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def to_cents(amount):
+    return int(round(amount * 100))
+
+
+class ExpenseColumns:
+    """Expenses as parallel NumPy arrays, one row per expense"""
+    def __init__(self, expenses=()):
+        self.size = 0
+        self._arrays = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        self.categories = []     # code -> category
+        self.descriptions = []   # code -> description
+        self._codes = ({}, {})   # category -> code, description -> code
+        self.ids = []            # row -> expense id
+        self.rows = {}           # expense id -> row
+        self.extend(expenses)
+
+    def __len__(self):
+        return self.size
+
+    # Zero-copy views of the live rows
+    @property
+    def days(self):
+        return self._arrays["days"][:self.size]
+
+    @property
+    def category_codes(self):
+        return self._arrays["category_codes"][:self.size]
+
+    @property
+    def cents(self):
+        return self._arrays["cents"][:self.size]
+
+    @property
+    def description_codes(self):
+        return self._arrays["description_codes"][:self.size]
+
+    def _code(self, which, value):
+        codes = self._codes[which]
+        code = codes.get(value)
+        if code is None:
+            table = self.categories if which == 0 else self.descriptions
+            code = codes[value] = len(table)
+            table.append(sys.intern(value))
+        return code
+
+    def _reserve(self, count):
+        capacity = len(self._arrays["days"])
+        if self.size + count <= capacity:
+            return
+        capacity = max(self.size + count, capacity * 2, 1024)
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._arrays[name] = grown
+
+    def extend(self, expenses):
+        """Append expenses not in the table yet (known ids are updated in place)"""
+        new = []
+        for expense in expenses:
+            if str(expense["_id"]) in self.rows:
+                self.update(expense)
+            else:
+                new.append(expense)
+        if not new:
+            return
+        count = len(new)
+        self._reserve(count)
+        start, end = self.size, self.size + count
+        arrays = self._arrays
+        arrays["days"][start:end] = np.fromiter(
+            (day_number(expense["date"]) for expense in new), np.int64, count)
+        arrays["category_codes"][start:end] = np.fromiter(
+            (self._code(0, expense["category"]) for expense in new), np.int16, count)
+        arrays["cents"][start:end] = np.fromiter(
+            (to_cents(expense["amount"]) for expense in new), np.int64, count)
+        arrays["description_codes"][start:end] = np.fromiter(
+            (self._code(1, expense.get("description", "")) for expense in new), np.int32, count)
+        for row, expense in enumerate(new, start):
+            expense_id = str(expense["_id"])
+            self.ids.append(expense_id)
+            self.rows[expense_id] = row
+        self.size = end
+
+    def update(self, expense):
+        """Add an expense, or rewrite its row if it is already in the table"""
+        row = self.rows.get(str(expense["_id"]))
+        if row is None:
+            self.extend([expense])
+            return
+        self._arrays["days"][row] = day_number(expense["date"])
+        self._arrays["category_codes"][row] = self._code(0, expense["category"])
+        self._arrays["cents"][row] = to_cents(expense["amount"])
+        self._arrays["description_codes"][row] = self._code(1, expense.get("description", ""))
+
+    add = update
+
+    def remove(self, expense_id):
+        """Drop an expense's row, moving the last row into its place"""
+        row = self.rows.pop(str(expense_id), None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for array in self._arrays.values():
+                array[row] = array[last]
+            moved = self.ids[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+        self.size = last
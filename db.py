@@ -0,0 +1,97 @@
+"""Process-wide MongoDB connection.
+
+Every window and tool shares one MongoClient (and so one connection pool),
+created on first use from the settings in config.py and closed on exit.
+Asyncio code gets the same settings on an AsyncMongoClient, which belongs to
+the event loop it was first used on.
+"""
+import atexit
+import importlib.util
+import threading
+
+from pymongo import AsyncMongoClient, MongoClient
+
+from config import get_settings
+
+# Wire compressors and the module each one needs
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def available_compressors(requested):
+    """Keep only the requested compressors whose libraries are installed"""
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    return [name for name in names
+            if name in COMPRESSOR_MODULES
+            and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is not None]
+
+
+def client_options():
+    """Keyword options for a client, from the [mongodb] settings"""
+    settings = get_settings()
+    options = {
+        "appname": settings.get("mongodb", "app_name"),
+        "maxPoolSize": settings.get("mongodb", "max_pool_size"),
+        "minPoolSize": settings.get("mongodb", "min_pool_size"),
+        "connectTimeoutMS": settings.get("mongodb", "connect_timeout_ms"),
+        "serverSelectionTimeoutMS": settings.get("mongodb", "server_selection_timeout_ms"),
+        "socketTimeoutMS": settings.get("mongodb", "socket_timeout_ms"),
+    }
+    compressors = available_compressors(settings.get("mongodb", "compressors"))
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def get_client():
+    """The shared MongoClient, connecting on first use"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(get_settings().get("mongodb", "uri"), **client_options())
+        return _client
+
+
+def get_database():
+    """The expense tracker database on the shared client"""
+    return get_client()[get_settings().get("mongodb", "database")]
+
+
+def close_client():
+    """Close the shared client; the next get_client() reconnects"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+# Once per process, not per client: reconnects after close_client() reuse it
+atexit.register(close_client)
+
+
+def get_async_client():
+    """The shared AsyncMongoClient; connects lazily on its first await"""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncMongoClient(get_settings().get("mongodb", "uri"),
+                                             **client_options())
+        return _async_client
+
+
+def get_async_database():
+    """The expense tracker database on the shared async client"""
+    return get_async_client()[get_settings().get("mongodb", "database")]
+
+
+async def close_async_client():
+    """Close the shared async client, from the loop that used it"""
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
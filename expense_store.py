@@ -0,0 +1,331 @@
+from datetime import datetime
+
+from aggregation import (grouped_sums, grouped_sums_by_category, period_keys, period_label,
+                         sum_between)
+from columnar import ExpenseColumns, day_number
+from search_index import SearchIndex
+
+# What an expense shows; other keys (e.g. a MongoDB document's seq) are bookkeeping
+EXPENSE_FIELDS = ("date", "category", "amount", "description")
+
+
+def month_bounds(now=None):
+    """Start of the current month and start of the next one"""
+    now = now or datetime.now()
+    start = datetime(now.year, now.month, 1)
+    if now.month == 12:
+        return start, datetime(now.year + 1, 1, 1)
+    return start, datetime(now.year, now.month + 1, 1)
+
+
+class ExpenseStore:
+    """In-memory copy of a user's expenses and budgets.
+
+    Loaded once and kept current write-through, so views read from memory
+    instead of the database. `version` increases on every change and can be
+    used to tell whether something drawn from the store is stale.
+
+    Statistics, charts and reports are computed from a columnar copy of the
+    expenses (see columnar.py) that is kept current along with the list.
+
+    Storage access is split from cache updates so it can run on a worker
+    thread: fetch(), fetch_changes() and the write methods only talk to
+    storage, and the writes return a function that applies the change to the
+    cache, to be called on the thread that reads it.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.expenses = []
+        self.budgets = {}
+        self.version = 0
+        self.revision = None
+        self._by_id = {}
+        self._index = None
+        self._table = None
+        self._summary = (None, None)
+        self._rollups = (None, None)
+        self._query = None
+        self._query_key = None
+
+    def fetch(self):
+        """Read everything from storage (safe off the UI thread)"""
+        return {"user": self.storage.get_user_data() or {},
+                "expenses": self.storage.get_expenses()}
+
+    def apply_snapshot(self, snapshot):
+        """Replace the cache with the result of fetch()"""
+        user_data = snapshot["user"]
+        self.revision = user_data.get("revision", 0)
+        self.budgets = dict(user_data.get("budgets", {}))
+        self.expenses = snapshot["expenses"]
+        self._by_id = {str(expense["_id"]): expense for expense in self.expenses}
+        self._index = None
+        self._table = None
+        self.version += 1
+
+    def fetch_since(self, revision):
+        """Catch up from a saved snapshot taken at `revision` (safe off the UI thread).
+
+        Returns the changes_since delta (None if nothing changed), or a full
+        fetch() when storage is behind the snapshot, e.g. after a restore,
+        since a delta cannot remove what only the snapshot still has.
+        """
+        changes = self.storage.changes_since(revision)
+        if changes is not None and changes["revision"] < revision:
+            return self.fetch()
+        return changes
+
+    def apply_fetched(self, result):
+        """Apply what fetch_since() returned; returns True if anything changed"""
+        if result is not None and "user" in result:
+            self.apply_snapshot(result)
+            return True
+        return self.apply_changes(result)
+
+    def load(self):
+        """(Re)load everything from storage"""
+        self.apply_snapshot(self.fetch())
+
+    def has_external_changes(self):
+        """Whether the data was changed elsewhere since it was loaded"""
+        return self.storage.get_revision() != self.revision
+
+    def fetch_changes(self):
+        """What changed in storage since our revision, or None (safe off the UI thread)"""
+        if self.revision is None:
+            return None
+        return self.storage.changes_since(self.revision)
+
+    def refresh_if_changed(self):
+        """Pull only what changed since our revision; returns True if anything did"""
+        return self.apply_changes(self.fetch_changes())
+
+    def apply_changes(self, changes):
+        """Merge a changes_since delta into the cache; returns True if anything changed.
+
+        Expenses that come back unchanged (a local-first sync renumbering our
+        own writes) do not count, so the views are not refreshed for nothing.
+        """
+        if changes is None or changes["revision"] < (self.revision or 0):
+            return False  # nothing new, or overtaken by a later delta
+        changed = False
+        for expense in changes["expenses"]:
+            expense_id = str(expense["_id"])
+            cached = self._by_id.get(expense_id)
+            if cached is not None:
+                if all(cached.get(field) == expense.get(field) for field in EXPENSE_FIELDS):
+                    continue
+                cached.update(expense)
+            else:
+                self.expenses.append(expense)
+                self._by_id[expense_id] = expense
+            self._derived_update(self._by_id[expense_id])
+            changed = True
+        removed = {str(expense_id) for expense_id in changes["deleted"]
+                   if self._by_id.pop(str(expense_id), None) is not None}
+        for expense_id in removed:
+            self._derived_remove(expense_id)
+        if removed:
+            self.expenses = [expense for expense in self.expenses
+                             if str(expense["_id"]) not in removed]
+        self.revision = changes["revision"]
+        if not (changed or removed or changes["budgets"] != self.budgets):
+            return False
+        self.budgets = dict(changes["budgets"])
+        self._sort()
+        self.version += 1
+        return True
+
+    def _track_revision(self, revision):
+        """Record our own write.
+
+        If someone else wrote in between, the revision is left where it was so
+        the next fetch_changes() picks up their change (and ours again).
+        """
+        if self.revision is not None and revision == self.revision + 1:
+            self.revision = revision
+        self.version += 1
+
+    def get_expenses(self):
+        """Expenses, newest first (do not modify the returned list)"""
+        return self.expenses
+
+    def query(self, category=None, search=None):
+        """Expenses in `category` matching `search`, newest first (do not modify).
+
+        The result is cached per data version, so paging through it is cheap.
+        """
+        key = (self.version, category, search)
+        if self._query_key != key:
+            rows = self.expenses
+            if category and not search:
+                rows = [expense for expense in rows if expense["category"] == category]
+            if search:
+                matches = self._search_index().search(search)
+                rows = [self._by_id[expense_id] for expense_id in matches]
+                if category:
+                    rows = [expense for expense in rows if expense["category"] == category]
+                rows.sort(key=lambda expense: expense["date"], reverse=True)
+            self._query = rows
+            self._query_key = key
+        return self._query
+
+    def _search_index(self):
+        """The search index, built on first use and then kept current by writes"""
+        if self._index is None:
+            self._index = SearchIndex(self.expenses)
+        return self._index
+
+    def _columns(self):
+        """The columnar table, built on first use and then kept current by writes"""
+        if self._table is None:
+            self._table = ExpenseColumns(self.expenses)
+        return self._table
+
+    def _derived_update(self, expense):
+        if self._index is not None:
+            self._index.update(expense)
+        if self._table is not None:
+            self._table.update(expense)
+
+    def _derived_remove(self, expense_id):
+        if self._index is not None:
+            self._index.remove(expense_id)
+        if self._table is not None:
+            self._table.remove(expense_id)
+
+    def get_expense(self, expense_id):
+        """Look up a single expense by id"""
+        return self._by_id.get(str(expense_id))
+
+    def get_summary(self):
+        """Count, total, this month's total and top category"""
+        month_start, month_end = month_bounds()
+        key = (self.version, month_start)
+        if self._summary[0] != key:
+            columns = self._columns()
+            codes, sums, counts = grouped_sums(columns.category_codes, columns.cents)
+            self._summary = (key, {
+                "count": len(columns),
+                "total": int(columns.cents.sum()) / 100,
+                "monthly": sum_between(columns.days, columns.cents, day_number(month_start),
+                                       day_number(month_end)) / 100,
+                "top_category": columns.categories[codes[sums.argmax()]] if len(codes) else None
+            })
+        return self._summary[1]
+
+    def get_rollups(self, start_date=None):
+        """[{"month": "YYYY-MM", "category", "total", "count"}], oldest month first.
+
+        With `start_date`, only expenses on or after that day are counted, so
+        the first month may be partial.
+        """
+        start_day = day_number(start_date) if start_date is not None else None
+        key = (self.version, start_day)
+        if self._rollups[0] != key:
+            columns = self._columns()
+            days, category_codes, cents = columns.days, columns.category_codes, columns.cents
+            if start_day is not None:
+                keep = days >= start_day
+                days, category_codes, cents = days[keep], category_codes[keep], cents[keep]
+            months, codes, sums, counts = grouped_sums_by_category(
+                period_keys(days, "month"), category_codes, len(columns.categories), cents)
+            self._rollups = (key, [
+                {"month": period_label(month, "month"), "category": columns.categories[code],
+                 "total": total / 100, "count": count}
+                for month, code, total, count
+                in zip(months.tolist(), codes.tolist(), sums.tolist(), counts.tolist())
+            ])
+        return self._rollups[1]
+
+    def monthly_totals(self, start_month=None):
+        """{"YYYY-MM": total}, oldest month first"""
+        totals = {}
+        for rollup in self.get_rollups():
+            if start_month is None or rollup["month"] >= start_month:
+                totals[rollup["month"]] = totals.get(rollup["month"], 0) + rollup["total"]
+        return totals
+
+    def category_totals(self, start_month=None, month=None):
+        """{category: total} over all months, from `start_month` on, or for one `month`"""
+        totals = {}
+        for rollup in self.get_rollups():
+            if month is not None and rollup["month"] != month:
+                continue
+            if start_month is not None and rollup["month"] < start_month:
+                continue
+            totals[rollup["category"]] = totals.get(rollup["category"], 0) + rollup["total"]
+        return totals
+
+    def get_budgets(self):
+        """A copy of the budgets dict"""
+        return dict(self.budgets)
+
+    def _sort(self):
+        self.expenses.sort(key=lambda expense: expense["date"], reverse=True)
+
+    # Writes: call on any thread, then call the returned function on the UI thread
+    def add_expense(self, expense_data):
+        """Add an expense to storage"""
+        revision = self.storage.add_expense(expense_data)
+
+        def apply():
+            # A poll may have delivered it already: update that copy, never add twice
+            expense = self._by_id.get(str(expense_data["_id"]))
+            if expense is not None:
+                expense.update(expense_data)
+            else:
+                expense = expense_data
+                self.expenses.append(expense)
+                self._by_id[str(expense["_id"])] = expense
+            self._derived_update(expense)
+            self._sort()
+            self._track_revision(revision)
+        return apply
+
+    def update_expense(self, expense_id, new_data):
+        """Update an expense in storage"""
+        return self.update_expenses([expense_id], new_data)
+
+    def delete_expense(self, expense_id):
+        """Delete an expense from storage"""
+        return self.delete_expenses([expense_id])
+
+    def update_expenses(self, expense_ids, fields):
+        """Apply the same change to several expenses in storage"""
+        revision = self.storage.update_expenses(expense_ids, fields)
+
+        def apply():
+            for expense_id in expense_ids:
+                expense = self._by_id.get(str(expense_id))
+                if expense is not None:
+                    expense.update(fields)
+                    self._derived_update(expense)
+            if "date" in fields:
+                self._sort()
+            self._track_revision(revision)
+        return apply
+
+    def delete_expenses(self, expense_ids):
+        """Delete several expenses from storage"""
+        revision = self.storage.delete_expenses(expense_ids)
+
+        def apply():
+            removed = set()
+            for expense_id in expense_ids:
+                if self._by_id.pop(str(expense_id), None) is not None:
+                    removed.add(str(expense_id))
+                    self._derived_remove(expense_id)
+            self.expenses = [expense for expense in self.expenses
+                             if str(expense["_id"]) not in removed]
+            self._track_revision(revision)
+        return apply
+
+    def set_budgets(self, budgets):
+        """Replace the budgets in storage"""
+        revision = self.storage.update_budgets(budgets)
+
+        def apply():
+            self.budgets = dict(budgets)
+            self._track_revision(revision)
+        return apply
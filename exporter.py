@@ -0,0 +1,62 @@
+"""Export of expense histories to CSV or JSON Lines.
+
+Expenses are read from a database cursor and written out as they arrive, so
+exporting any number of rows only ever holds one cursor batch in memory.
+"""
+import csv
+import gzip
+import json
+
+EXPORT_FIELDS = ["date", "category", "amount", "description", "id"]
+PROGRESS_EVERY = 10000
+
+
+def detect_format(path):
+    """Pick the output format and compression from the file name"""
+    name = path.lower()
+    compress = name.endswith(".gz")
+    if compress:
+        name = name[:-3]
+    fmt = "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+    return fmt, compress
+
+
+def _export_row(expense):
+    return {
+        "date": expense["date"].strftime("%Y-%m-%d"),
+        "category": expense["category"],
+        "amount": round(expense["amount"], 2),
+        "description": expense.get("description", ""),
+        "id": str(expense["_id"])
+    }
+
+
+def export_expenses(storage, path, fmt=None, compress=None, start=None, end=None,
+                    category=None, progress=None):
+    """Write the user's expenses matching the filters to `path`.
+
+    Returns the number of rows written; `progress(count)` is called every
+    few thousand rows.
+    """
+    detected_fmt, detected_compress = detect_format(path)
+    fmt = fmt or detected_fmt
+    compress = detected_compress if compress is None else compress
+
+    opener = gzip.open if compress else open
+    count = 0
+    with opener(path, "wt", newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            writer = csv.DictWriter(file, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: file.write(json.dumps(row) + "\n")
+
+        for expense in storage.iter_expenses(start=start, end=end, category=category):
+            write(_export_row(expense))
+            count += 1
+            if progress and count % PROGRESS_EVERY == 0:
+                progress(count)
+    if progress:
+        progress(count)
+    return count
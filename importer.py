@@ -0,0 +1,188 @@
+"""Bulk import of expenses from CSV, OFX and QIF files.
+
+Files are read row by row and handled in batches: each batch has its dates
+and amounts parsed and validated in one vectorized pass, then is written with
+a single bulk insert, so memory use depends on the batch size rather than the
+file size.
+"""
+import csv
+import os
+import re
+from itertools import islice
+
+from bson.objectid import ObjectId
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CATEGORY = "Other"
+
+# Accepted CSV header names for each field
+CSV_COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date"),
+    "category": ("category",),
+    "amount": ("amount", "debit", "value"),
+    "description": ("description", "memo", "payee", "name", "details")
+}
+
+# Date format each file type is normalised to before parsing
+DATE_FORMATS = {"csv": "%Y-%m-%d", "ofx": "%Y%m%d", "qif": "%m/%d/%Y"}
+
+OFX_FIELD = re.compile(r"<(DTPOSTED|TRNAMT|NAME|MEMO)>([^<\r\n]*)", re.IGNORECASE)
+
+
+class ImportResult:
+    """Counts of rows imported and rejected"""
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+
+    def __repr__(self):
+        return f"ImportResult(imported={self.imported}, rejected={self.rejected})"
+
+
+class _CountingReader:
+    """Iterate a text file's lines while keeping track of how far we got"""
+    def __init__(self, file):
+        self.file = file
+        self.position = 0
+
+    def __iter__(self):
+        for line in self.file:
+            self.position += len(line)
+            yield line
+
+
+def detect_format(path):
+    """Guess the file format from its extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension not in DATE_FORMATS:
+        raise ValueError(f"Unsupported file type: .{extension}")
+    return extension
+
+
+def iter_csv_rows(lines):
+    """Yield raw rows from a CSV file with a header line"""
+    reader = csv.reader(lines)
+    header = [name.strip().lower() for name in next(reader, [])]
+    positions = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in header:
+                positions[field] = header.index(name)
+                break
+    if "date" not in positions or "amount" not in positions:
+        raise ValueError("CSV file needs at least 'date' and 'amount' columns")
+
+    for row in reader:
+        if not row:
+            continue
+        yield {field: row[index] if index < len(row) else ""
+               for field, index in positions.items()}
+
+
+def iter_ofx_rows(lines):
+    """Yield debits from the <STMTTRN> blocks of an OFX statement"""
+    transaction = None
+    for line in lines:
+        upper = line.upper()
+        if "<STMTTRN>" in upper:
+            transaction = {}
+        if transaction is not None:
+            for tag, value in OFX_FIELD.findall(line):
+                transaction[tag.upper()] = value.strip()
+        if "</STMTTRN>" in upper and transaction is not None:
+            yield _statement_row(transaction.get("DTPOSTED", "")[:8],
+                                 transaction.get("TRNAMT", ""),
+                                 transaction.get("NAME") or transaction.get("MEMO", ""))
+            transaction = None
+
+
+def iter_qif_rows(lines):
+    """Yield debits from the records of a QIF file"""
+    record = {}
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line or line.startswith("!"):
+            continue
+        if line.startswith("^"):
+            if record:
+                yield _statement_row(_qif_date(record.get("D", "")), record.get("T", ""),
+                                     record.get("P") or record.get("M", ""),
+                                     record.get("L", ""))
+            record = {}
+        else:
+            record[line[0]] = line[1:].strip()
+
+
+def _qif_date(value):
+    """Normalise QIF dates such as 1/5'24 or 01/05/2024 to MM/DD/YYYY"""
+    parts = re.split(r"[/'\-]", value.strip())
+    if len(parts) != 3:
+        return value
+    month, day, year = parts
+    if len(year) == 2:
+        year = "20" + year
+    return f"{month.zfill(2)}/{day.zfill(2)}/{year}"
+
+
+def _statement_row(date, amount, description, category=""):
+    """Bank statements list debits as negative amounts; keep only those"""
+    amount = amount.replace(",", "").strip()
+    if amount.startswith("-"):
+        amount = amount[1:]
+    else:
+        amount = ""  # credits are not expenses, let validation reject them
+    return {"date": date, "amount": amount, "description": description,
+            "category": category}
+
+
+def parse_batch(rows, fmt):
+    """Validate a batch of raw rows and turn the good ones into expense documents.
+
+    Returns (expenses, rejected_count).
+    """
+    import pandas as pd  # imported on first use to keep app startup light
+    frame = pd.DataFrame.from_records(rows, columns=["date", "category", "amount", "description"])
+    dates = pd.to_datetime(frame["date"].str.strip(), format=DATE_FORMATS[fmt], errors="coerce")
+    amounts = pd.to_numeric(
+        frame["amount"].astype(str).str.replace(r"[$,\s]", "", regex=True),
+        errors="coerce"
+    )
+    categories = frame["category"].fillna("").str.strip().replace("", DEFAULT_CATEGORY)
+    descriptions = frame["description"].fillna("").str.strip()
+
+    valid = dates.notna() & amounts.notna() & (amounts > 0)
+    expenses = [
+        {"_id": ObjectId(), "date": date, "category": category,
+         "amount": round(float(amount), 2), "description": description}
+        for date, category, amount, description in zip(
+            dates[valid].dt.to_pydatetime(), categories[valid],
+            amounts[valid], descriptions[valid])
+    ]
+    return expenses, len(rows) - len(expenses)
+
+
+def import_expenses(storage, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Stream expenses from `path` into `storage` in batches.
+
+    `progress(result, fraction)` is called after each batch is written.
+    """
+    fmt = fmt or detect_format(path)
+    row_readers = {"csv": iter_csv_rows, "ofx": iter_ofx_rows, "qif": iter_qif_rows}
+    total_size = os.path.getsize(path) or 1
+    result = ImportResult()
+
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as file:
+        lines = _CountingReader(file)
+        rows = row_readers[fmt](lines)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            expenses, rejected = parse_batch(batch, fmt)
+            if expenses:
+                storage.insert_expenses(expenses)
+            result.imported += len(expenses)
+            result.rejected += rejected
+            if progress:
+                progress(result, min(1.0, lines.position / total_size))
+    return result
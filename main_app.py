@@ -1,11 +1,16 @@
+import logging
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
-import matplotlib.pyplot as plt
-import pandas as pd
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from pymongo import MongoClient
 from bson.objectid import ObjectId
+from config import get_settings
+from storage import open_storage
+from expense_store import ExpenseStore
+from snapshot import load_snapshot, save_snapshot, snapshot_path
+from importer import import_expenses
+from exporter import export_expenses
+from virtual_table import VirtualTreeview
+from background import BackgroundExecutor
 try:
     from auth import (
         GradientFrame, DARK_BG_1, DARK_BG_2, DARK_BG_3, 
@@ -30,16 +35,38 @@ except ImportError:
     BODY_FONT = ("Segoe UI", 12)
     SMALL_FONT = ("Segoe UI", 10)
 
+# Wait for a pause in typing before searching
+SEARCH_DEBOUNCE_MS = 150
+
+# How often to pull changes made on other devices (only the delta is fetched)
+POLL_MS = 1000
+
+log = logging.getLogger(__name__)
+
 class ExpenseTrackerApp(tk.Tk):
-    """Main Expense Tracker Application with MongoDB backend"""
+    """Main Expense Tracker Application with pluggable storage backend"""
     def __init__(self, username):
         super().__init__()
         self.username = username
+        self.current_view = None
+        self.search_after_id = None
+        self.dashboard = None
+        self.charts = None
+        
+        # Configured storage backend (MongoDB connection is shared across logins)
+        self.storage = open_storage(self.username)
+        
+        # Database calls run on worker threads so the window never freezes
+        self.io = BackgroundExecutor(self)
+        
+        # Views read from this cache, loaded in the background below
+        self.store = ExpenseStore(self.storage)
         
-        # Connect to MongoDB
-        self.client = MongoClient("mongodb+srv://<username>:<db-password>@expense-tracker.xvmac2e.mongodb.net/?retryWrites=true&w=majority&appName=expense-tracker")
-        self.db = self.client["expense_tracker"]
-        self.users_collection = self.db["users"]
+        # Data saved by the last session, shown while storage catches up
+        self.snapshot_path = snapshot_path(self.username)
+        
+        # Report charts already drawn for the current data (created with the first report)
+        self.render_cache = None
         
         # Initialize data
         self.expense_categories = ['Food', 'Transport', 'Entertainment', 
@@ -48,61 +75,187 @@ class ExpenseTrackerApp(tk.Tk):
         # Setup UI
         self.setup_ui()
         
-        # Start with dashboard
-        self.show_dashboard()
+        # Start with dashboard once the data is in
+        self.load_data()
+        
+        # Pick up changes made elsewhere
+        self.bind("<F5>", lambda e: self.refresh_data())
         
-        # Configure matplotlib style
-        plt.style.use('dark_background')
-        plt.rcParams['axes.facecolor'] = DARK_BG_3
-        plt.rcParams['figure.facecolor'] = DARK_BG_2
-        plt.rcParams['text.color'] = TEXT_COLOR
-        plt.rcParams['axes.labelcolor'] = TEXT_COLOR
-        plt.rcParams['xtick.color'] = TEXT_COLOR
-        plt.rcParams['ytick.color'] = TEXT_COLOR
-        plt.rcParams['axes.titlecolor'] = TEXT_COLOR
-        plt.rcParams['axes.edgecolor'] = TEXT_COLOR_2
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def get_user_data(self):
-        """Get current user's data from MongoDB"""
-        return self.users_collection.find_one({"username": self.username})
+        """Get current user's data from storage"""
+        return self.storage.get_user_data()
     
     def get_expenses(self):
         """Get expenses for current user"""
-        user_data = self.get_user_data()
-        return user_data.get("expenses", [])
+        return self.store.get_expenses()
     
     def get_budgets(self):
         """Get budgets for current user"""
-        user_data = self.get_user_data()
-        return user_data.get("budgets", {})
-    
-    def add_expense_to_db(self, expense_data):
-        """Add new expense to MongoDB"""
-        self.users_collection.update_one(
-            {"username": self.username},
-            {"$push": {"expenses": expense_data}}
-        )
+        return self.store.get_budgets()
     
-    def update_expense_in_db(self, expense_id, new_data):
-        """Update existing expense in MongoDB"""
-        self.users_collection.update_one(
-            {"username": self.username, "expenses._id": ObjectId(expense_id)},
-            {"$set": {"expenses.$": new_data}}
-        )
-    
-    def delete_expense_from_db(self, expense_id):
-        """Delete expense from MongoDB"""
-        self.users_collection.update_one(
-            {"username": self.username},
-            {"$pull": {"expenses": {"_id": ObjectId(expense_id)}}}
-        )
+    def load_data(self):
+        """Show the saved snapshot if there is one, else load everything from storage"""
+        def read():
+            return load_snapshot(self.snapshot_path) if self.snapshot_path else None
+        self.io.submit(read, on_done=self.on_snapshot_read, spinner=self.main_content)
     
-    def update_budgets_in_db(self, budgets):
-        """Update budgets in MongoDB"""
-        self.users_collection.update_one(
-            {"username": self.username},
-            {"$set": {"budgets": budgets}}
-        )
+    def on_snapshot_read(self, snapshot):
+        if snapshot is None:
+            self.fetch_data()
+            return
+        # Draw last session's data now; storage only has to send what changed since
+        self.show_data(snapshot)
+        self.catch_up(snapshot["user"]["revision"])
+    
+    def fetch_data(self):
+        """Prepare storage and load the user's data without blocking the window"""
+        def fetch():
+            self.storage.prepare()
+            return self.store.fetch()
+        self.io.submit(fetch, on_done=self.on_data_loaded, on_error=self.on_load_failed,
+                       spinner=self.main_content)
+    
+    def catch_up(self, revision):
+        """Prepare storage and fetch what changed after the snapshot's revision"""
+        def fetch():
+            self.storage.prepare()
+            return self.store.fetch_since(revision)
+        self.io.submit(fetch, on_done=self.on_caught_up,
+                       on_error=lambda error: self.on_catch_up_failed(revision, error))
+    
+    def on_caught_up(self, result):
+        if self.store.apply_fetched(result):
+            self.refresh_current_view()
+        self.after(POLL_MS, self.poll_changes)
+    
+    def on_catch_up_failed(self, revision, error):
+        if messagebox.askretrycancel("Connection Failed",
+                                     f"Showing your last saved data. Could not update it: {error}",
+                                     parent=self):
+            self.catch_up(revision)
+        else:
+            # Keep watching: polling picks up from the snapshot once storage answers
+            self.after(POLL_MS, self.poll_changes)
+    
+    def on_data_loaded(self, snapshot):
+        """Show the data and start watching for changes"""
+        self.show_data(snapshot)
+        self.after(POLL_MS, self.poll_changes)
+    
+    def show_data(self, snapshot):
+        self.store.apply_snapshot(snapshot)
+        if self.current_view is None:
+            self.show_dashboard()
+        else:
+            self.refresh_current_view()
+    
+    def on_load_failed(self, error):
+        if messagebox.askretrycancel("Connection Failed", f"Could not load your data: {error}", 
+                                     parent=self):
+            self.fetch_data()
+    
+    def save_data(self):
+        """Keep the loaded data on disk for a warm start next time"""
+        if self.snapshot_path is None or self.store.revision is None:
+            return
+        try:
+            save_snapshot(self.snapshot_path, self.store.revision, self.store.budgets,
+                          self.store.expenses)
+        except OSError as e:
+            print(f"Could not save snapshot: {e}")
+    
+    def run_write(self, write, *args, on_done=None):
+        """Save in the background, then update the cache and, if still showing, the view"""
+        if on_done is not None:
+            on_done = self.io.current("view", on_done)
+        
+        def saved(apply):
+            apply()
+            if on_done is not None:
+                on_done()
+        
+        self.io.submit(write, *args, on_done=saved, write=True,
+                       on_error=lambda e: messagebox.showerror(
+                           "Error", f"Could not save changes: {e}", parent=self))
+    
+    def add_expense_to_db(self, expense_data, on_done=None):
+        """Add new expense to storage"""
+        self.run_write(self.store.add_expense, expense_data, on_done=on_done)
+    
+    def update_expense_in_db(self, expense_id, new_data, on_done=None):
+        """Update existing expense in storage"""
+        self.run_write(self.store.update_expense, expense_id, new_data, on_done=on_done)
+    
+    def delete_expense_from_db(self, expense_id, on_done=None):
+        """Delete expense from storage"""
+        self.run_write(self.store.delete_expense, expense_id, on_done=on_done)
+    
+    def update_expenses_in_db(self, expense_ids, fields, on_done=None):
+        """Update several expenses in storage with one request"""
+        self.run_write(self.store.update_expenses, expense_ids, fields, on_done=on_done)
+    
+    def delete_expenses_from_db(self, expense_ids, on_done=None):
+        """Delete several expenses from storage with one request"""
+        self.run_write(self.store.delete_expenses, expense_ids, on_done=on_done)
+    
+    def update_budgets_in_db(self, budgets, on_done=None):
+        """Update budgets in storage"""
+        self.run_write(self.store.set_budgets, budgets, on_done=on_done)
+    
+    def refresh_data(self):
+        """Pull changes from storage and redraw the current view"""
+        def fetched(changes):
+            if self.store.apply_changes(changes):
+                self.refresh_current_view()
+        self.io.submit(self.store.fetch_changes, on_done=fetched)
+    
+    def poll_changes(self):
+        """Redraw when the data changed elsewhere; only changed expenses are fetched"""
+        self.io.submit(self.store.fetch_changes, on_done=self.on_changes_polled,
+                       on_error=self.on_poll_failed, tag="poll")
+    
+    def on_changes_polled(self, changes):
+        if self.store.apply_changes(changes):
+            self.refresh_current_view()
+        self.update_sync_status()
+        self.after(POLL_MS, self.poll_changes)
+    
+    def on_poll_failed(self, error):
+        log.warning("Error checking for changes: %s", error)
+        self.after(POLL_MS, self.poll_changes)
+    
+    def update_sync_status(self):
+        """Show whether background sync is keeping up"""
+        worker = getattr(self.storage, "worker", None)
+        if worker is None:
+            return
+        pending = self.storage.pending_count()
+        if not worker.online:
+            self.sidebar_sync.config(text=f"Sync: Offline ({pending} pending)", fg=ERROR_COLOR)
+        elif pending:
+            self.sidebar_sync.config(text=f"Sync: {pending} pending", fg=WARNING_COLOR)
+        else:
+            self.sidebar_sync.config(text="Sync: Up to date", fg=SUCCESS_COLOR)
+    
+    def refresh_current_view(self):
+        """Update the showing view's widgets in place.
+
+        Nothing is rebuilt, so search text, scroll position and selection stay,
+        and the view's pending requests (a dialog's save) are not cancelled.
+        Forms are left alone so typed input is not lost.
+        """
+        self.update_stats()
+        if self.current_view == self.show_dashboard:
+            self.update_recent_transactions()
+            self.update_charts()
+        elif self.current_view == self.show_view_expenses:
+            # A debounced search about to run will show the new data itself
+            if self.search_after_id is None:
+                self.filter_expenses()
+        elif self.current_view == self.show_budget:
+            self.load_budget_tree()
     
     def setup_ui(self):
         """Setup the main application UI with modern styling"""
@@ -236,30 +389,26 @@ class ExpenseTrackerApp(tk.Tk):
                                   font=SMALL_FONT, bg=DARK_BG_2, fg=TEXT_COLOR)
         self.sidebar_budget.pack(anchor="w", pady=(0, 5))
         
+        # Sync status (local-first storage only)
+        self.sidebar_sync = tk.Label(stats_frame, text="", 
+                                font=SMALL_FONT, bg=DARK_BG_2, fg=TEXT_COLOR_2)
+        self.sidebar_sync.pack(anchor="w", pady=(0, 5))
+        
         # Update sidebar stats
         self.update_sidebar_stats()
     
     def update_sidebar_stats(self):
         """Update the sidebar statistics"""
         try:
-            expenses = self.get_expenses()
-            if expenses:
-                # Convert to DataFrame for easier calculations
-                import pandas as pd
-                df = pd.DataFrame(expenses)
-                df['date'] = pd.to_datetime(df['date'])
-            
+            summary = self.store.get_summary()
+            if summary["count"]:
                 # Monthly expenses
-                current_month = datetime.now().strftime("%Y-%m")
-                monthly = df[df['date'].dt.strftime("%Y-%m") == current_month]['amount'].sum()
+                monthly = summary["monthly"]
                 self.sidebar_monthly.config(text=f"This Month: ${monthly:.2f}")
             
                 # Top category
-                if not df.empty:
-                    top_category = df.groupby("category")['amount'].sum().idxmax()
-                    self.sidebar_category.config(text=f"Top Category: {top_category}")
-                else:
-                    self.sidebar_category.config(text="Top Category: None")
+                top_category = summary["top_category"] or "None"
+                self.sidebar_category.config(text=f"Top Category: {top_category}")
             
                 # Budget status
                 budgets = self.get_budgets()
@@ -337,24 +486,20 @@ class ExpenseTrackerApp(tk.Tk):
     
     def update_stats(self):
         """Update the header statistics"""
-        expenses = self.get_expenses()
-        if expenses:
-            import pandas as pd
-            df = pd.DataFrame(expenses)
-            df['date'] = pd.to_datetime(df['date'])
-            
+        summary = self.store.get_summary()
+        
+        # The stat cards only exist on the dashboard
+        if summary["count"] and self.current_view == self.show_dashboard:
             # Total expenses
-            total = df['amount'].sum()
+            total = summary["total"]
             self.stat_labels["Total Expenses"].config(text=f"${total:.2f}")
             
             # Monthly expenses
-            current_month = datetime.now().strftime("%Y-%m")
-            monthly = df[df['date'].dt.strftime("%Y-%m") == current_month]['amount'].sum()
+            monthly = summary["monthly"]
             self.stat_labels["This Month"].config(text=f"${monthly:.2f}")
             
             # Top category
-            top_category = df.groupby("category")['amount'].sum().idxmax()
-            self.stat_labels["Top Category"].config(text=top_category)
+            self.stat_labels["Top Category"].config(text=summary["top_category"])
             
             # Budget status
             budgets = self.get_budgets()
@@ -372,18 +517,40 @@ class ExpenseTrackerApp(tk.Tk):
     
     def clear_main_content(self):
         """Clear the main content area except header"""
+        # Results requested by the old view are no longer wanted
+        self.io.cancel("view")
+        
+        # A pending search would run against destroyed widgets
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+            self.search_after_id = None
         for widget in self.main_content.winfo_children():
-            if widget not in [child for child in self.main_content.winfo_children() 
+            if widget is self.dashboard:
+                # Kept for the next visit, charts and all
+                widget.pack_forget()
+            elif widget not in [child for child in self.main_content.winfo_children() 
                             if isinstance(child, tk.Frame) and child.winfo_children()[0] in self.main_content.winfo_children()]:
                 widget.destroy()
     
     def show_dashboard(self):
         """Show interactive dashboard view"""
         self.clear_main_content()
-
+        self.current_view = self.show_dashboard
+        
+        # Built on the first visit; after that only its contents are updated
+        if self.dashboard is None:
+            self.build_dashboard()
+        self.dashboard.pack(fill="both", expand=True)
+        
+        self.update_stats()
+        self.update_recent_transactions()
+        self.update_charts()
+    
+    def build_dashboard(self):
+        """Create the dashboard widgets and charts"""
         # Main container with scrollbar
         container = tk.Frame(self.main_content, bg=DARK_BG_2)
-        container.pack(fill="both", expand=True)
+        self.dashboard = container
         
         # Create a canvas and scrollbar
         canvas = tk.Canvas(container, bg=DARK_BG_2, highlightthickness=0)
@@ -409,9 +576,6 @@ class ExpenseTrackerApp(tk.Tk):
 
         self.budget_card = self.create_stat_card(cards_container, "Budget Status", "No Budget", "#FF9800")
         self.budget_card.pack(side="left", fill="x", expand=True, padx=5)
-
-        # Update the header stats
-        self.update_stats()
         
         # Configure the canvas
         canvas.configure(yscrollcommand=scrollbar.set)
@@ -447,14 +611,6 @@ class ExpenseTrackerApp(tk.Tk):
         list_scrollbar.pack(side="right", fill="y")
         self.transaction_list.config(yscrollcommand=list_scrollbar.set)
         
-        # Add recent transactions with alternating colors
-        expenses = sorted(self.get_expenses(), key=lambda x: x['date'], reverse=True)[:10]
-        for i, expense in enumerate(expenses):
-            bg_color = DARK_BG_3 if i % 2 == 0 else DARK_BG_2
-            self.transaction_list.insert("end", 
-                f"{expense['date'].strftime('%Y-%m-%d')} | {expense['category']} | ${expense['amount']:.2f} | {expense.get('description', '')}")
-            self.transaction_list.itemconfig("end", {'bg': bg_color})
-        
         # Charts frame
         charts_frame = tk.Frame(scrollable_frame, bg=DARK_BG_2, padx=20, pady=10)
         charts_frame.pack(fill="x")
@@ -491,137 +647,42 @@ class ExpenseTrackerApp(tk.Tk):
         self.budget_progress_canvas = tk.Canvas(budget_frame, bg=DARK_BG_2, highlightthickness=0)
         self.budget_progress_canvas.pack(fill="x", expand=True, pady=(5, 0))
         
-        # Update charts
-        self.update_charts()
+        # Figures and canvases live as long as the dashboard
+        # (matplotlib is imported here, on first use, not at startup)
+        from charts import DashboardCharts
+        self.charts = DashboardCharts(self.monthly_chart_canvas, self.category_chart_canvas,
+                                      self.budget_progress_canvas)
+        self.charts_key = None
+    
+    def update_recent_transactions(self):
+        """Refill the recent transactions list"""
+        top = self.transaction_list.yview()[0]
+        self.transaction_list.delete(0, "end")
+        # Expenses are kept newest first
+        for i, expense in enumerate(self.get_expenses()[:10]):
+            bg_color = DARK_BG_3 if i % 2 == 0 else DARK_BG_2
+            self.transaction_list.insert("end", 
+                f"{expense['date'].strftime('%Y-%m-%d')} | {expense['category']} | ${expense['amount']:.2f} | {expense.get('description', '')}")
+            self.transaction_list.itemconfig("end", {'bg': bg_color})
+        self.transaction_list.yview_moveto(top)
     
     def update_charts(self):
-        """Update dashboard charts with better visibility"""
-        # Clear previous charts
-        for widget in self.monthly_chart_canvas.winfo_children():
-            widget.destroy()
-        for widget in self.category_chart_canvas.winfo_children():
-            widget.destroy()
-        for widget in self.budget_progress_canvas.winfo_children():
-            widget.destroy()
-    
-        expenses = self.get_expenses()
-        if not expenses:
-            tk.Label(self.monthly_chart_canvas, text="No data available", 
-                font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(fill="both", expand=True)
-            tk.Label(self.category_chart_canvas, text="No data available", 
-                font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(fill="both", expand=True)
-            tk.Label(self.budget_progress_canvas, text="No budget data available", 
-                font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(fill="x", expand=True)
+        """Update the dashboard charts in place"""
+        # The canvases still show what they last drew; skip if nothing changed
+        current_month = datetime.now().strftime("%Y-%m")
+        key = (self.store.version, current_month)
+        if key == self.charts_key:
             return
-    
-        import pandas as pd
-        df = pd.DataFrame(expenses)
-        df['date'] = pd.to_datetime(df['date'])
-    
-        # Monthly spending chart - smaller size
-        fig1, ax1 = plt.subplots(figsize=(4, 2.5))  # Reduced from (5, 3)
-    
-        df["Month"] = df["date"].dt.to_period("M")
-        monthly_data = df.groupby("Month")["amount"].sum()
-    
-        ax1.plot(monthly_data.index.astype(str), monthly_data.values, 
-            color=ACCENT_COLOR, marker="o", linewidth=2)
-        ax1.set_title("Monthly Spending", color=TEXT_COLOR, fontsize=10)  # Smaller font
-        ax1.set_ylabel("Amount ($)", color=TEXT_COLOR, fontsize=8)
-    
-        # Style the chart
-        ax1.set_facecolor(DARK_BG_3)
-        fig1.patch.set_facecolor(DARK_BG_2)
-        for spine in ax1.spines.values():
-            spine.set_color(TEXT_COLOR_2)
-        ax1.tick_params(axis='x', colors=TEXT_COLOR, rotation=45, labelsize=8)
-        ax1.tick_params(axis='y', colors=TEXT_COLOR, labelsize=8)
-        ax1.grid(color=DARK_BG_3, linestyle='--', alpha=0.5)
-    
-        # Embed in Tkinter with tight layout
-        canvas1 = FigureCanvasTkAgg(fig1, master=self.monthly_chart_canvas)
-        canvas1.draw()
-        canvas1.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
-        fig1.tight_layout()
-    
-        # Category breakdown chart - smaller size
-        fig2, ax2 = plt.subplots(figsize=(4, 2.5))  # Reduced from (5, 3)
-    
-        category_data = df.groupby("category")["amount"].sum()
-        colors = plt.cm.tab20.colors[:len(category_data)]
-        explode = [0.05] * len(category_data)
-    
-        wedges, texts, autotexts = ax2.pie(category_data, 
-                                     labels=category_data.index, 
-                                     autopct="%1.1f%%",
-                                     startangle=90, 
-                                     colors=colors, 
-                                     explode=explode,
-                                     textprops={"color": TEXT_COLOR, "fontsize": 8},
-                                     wedgeprops={"edgecolor": DARK_BG_2, "linewidth": 1})
-    
-        ax2.set_title("Category Breakdown", color=TEXT_COLOR, fontsize=10)
-    
-        # Make autopct text more visible
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontsize(8)
-    
-        # Embed in Tkinter with tight layout
-        canvas2 = FigureCanvasTkAgg(fig2, master=self.category_chart_canvas)
-        canvas2.draw()
-        canvas2.get_tk_widget().pack(fill="both", expand=True, padx=5, pady=5)
-        fig2.tight_layout()
-    
-        # Budget progress chart - smaller size
-        budgets = self.get_budgets()
-        if budgets:
-            fig3, ax3 = plt.subplots(figsize=(8, 1.5))  # Reduced from (10, 2)
+        self.charts_key = key
         
-            current_month = datetime.now().strftime("%Y-%m")
-            monthly_spending = df[
-                df["date"].dt.strftime("%Y-%m") == current_month
-            ].groupby("category")["amount"].sum()
-        
-            # Prepare data for comparison
-            categories = list(budgets.keys())
-            budget_amounts = [budgets[cat] for cat in categories]
-            spent = [monthly_spending.get(cat, 0) for cat in categories]
-            remaining = [max(0, budget - spent[i]) for i, budget in enumerate(budget_amounts)]
-        
-            # Create stacked bar chart
-            bar_width = 0.6
-            index = range(len(categories))
-        
-            ax3.bar(index, spent, bar_width, color=ACCENT_COLOR, label='Spent')
-            ax3.bar(index, remaining, bar_width, bottom=spent, color=SUCCESS_COLOR, label='Remaining')
-        
-            # Style the chart
-            ax3.set_facecolor(DARK_BG_3)
-            fig3.patch.set_facecolor(DARK_BG_2)
-            ax3.set_title("Budget Progress", color=TEXT_COLOR, fontsize=10)
-            ax3.set_xticks(index)
-            ax3.set_xticklabels(categories, rotation=45, color=TEXT_COLOR, fontsize=8)
-            ax3.tick_params(axis='y', colors=TEXT_COLOR, fontsize=8)
-        
-            # Add value labels
-            for i, (s, r) in enumerate(zip(spent, remaining)):
-                total = s + r
-                if total > 0:
-                    ax3.text(i, s/2, f"${s:.0f}", ha='center', va='center', color='white', fontsize=8)
-                    ax3.text(i, s + r/2, f"${r:.0f}", ha='center', va='center', color='white', fontsize=8)
-        
-            ax3.legend(facecolor=DARK_BG_3, labelcolor=TEXT_COLOR, fontsize=8)
-        
-            # Embed in Tkinter with tight layout
-            canvas3 = FigureCanvasTkAgg(fig3, master=self.budget_progress_canvas)
-            canvas3.draw()
-            canvas3.get_tk_widget().pack(fill="x", expand=True, padx=5, pady=5)
-            fig3.tight_layout()
+        # Totals per month and category, from the in-memory columns
+        self.charts.update(self.store.monthly_totals(), self.store.category_totals(),
+                           self.get_budgets(), self.store.category_totals(month=current_month))
     
     def show_add_expense(self):
         """Show add expense form with modern styling"""
         self.clear_main_content()
+        self.current_view = self.show_add_expense
         
         form_frame = tk.Frame(self.main_content, bg=DARK_BG_2, padx=20, pady=20)
         form_frame.pack(fill="both", expand=True)
@@ -712,18 +773,17 @@ class ExpenseTrackerApp(tk.Tk):
             "description": description
         }
         
-        # Add to MongoDB
-        self.add_expense_to_db(expense_data)
+        def added():
+            self.show_dashboard()
+            messagebox.showinfo("Success", "Expense added successfully!", parent=self)
         
-        # Update UI
-        self.update_stats()
-        self.show_dashboard()
-        
-        messagebox.showinfo("Success", "Expense added successfully!", parent=self)
+        # Add to storage, then update UI
+        self.add_expense_to_db(expense_data, on_done=added)
     
     def show_view_expenses(self):
         """Show all expenses in a table with modern styling and search functionality"""
         self.clear_main_content()
+        self.current_view = self.show_view_expenses
         
         # Main container
         container = tk.Frame(self.main_content, bg=DARK_BG_2, padx=20, pady=20)
@@ -746,7 +806,7 @@ class ExpenseTrackerApp(tk.Tk):
                                 highlightbackground=DARK_BG_3,
                                 highlightcolor=ACCENT_COLOR)
         self.search_entry.pack(side="left", fill="x", expand=True, ipady=5)
-        self.search_entry.bind("<KeyRelease>", self.filter_expenses)
+        self.search_entry.bind("<KeyRelease>", self.schedule_filter)
         
         # Filter by category
         tk.Label(search_frame, text="Category:", font=BODY_FONT, 
@@ -759,14 +819,22 @@ class ExpenseTrackerApp(tk.Tk):
         self.category_filter.set("All")
         self.category_filter.bind("<<ComboboxSelected>>", self.filter_expenses)
         
+        # Row count (the table itself only holds the rows on screen)
+        self.expenses_count_label = tk.Label(container, text="", font=SMALL_FONT, 
+                                         bg=DARK_BG_2, fg=TEXT_COLOR_2)
+        self.expenses_count_label.pack(anchor="w", pady=(0, 5))
+        
         # Table container with scrollbars
         table_container = tk.Frame(container, bg=DARK_BG_2)
         table_container.pack(fill="both", expand=True)
         
-        # Treeview for expenses
-        self.expenses_tree = ttk.Treeview(table_container, 
-                                        columns=("date", "category", "amount", "desc", "id"), 
-                                        show="headings", selectmode="extended")
+        # Treeview for expenses, rows are keyed by expense id
+        self.expenses_table = VirtualTreeview(table_container, 
+                                          columns=("date", "category", "amount", "desc", "id"), 
+                                          row_values=self.expense_row_values,
+                                          row_key=lambda expense: expense['_id'],
+                                          show="headings", selectmode="extended")
+        self.expenses_tree = self.expenses_table.tree
         
         # Configure columns
         self.expenses_tree.heading("date", text="Date", anchor="center")
@@ -782,9 +850,9 @@ class ExpenseTrackerApp(tk.Tk):
         self.expenses_tree.column("id", width=0, stretch=tk.NO)  # Hidden ID column
         
         # Add scrollbars
-        y_scroll = ttk.Scrollbar(table_container, orient="vertical", command=self.expenses_tree.yview)
+        y_scroll = self.expenses_table.scrollbar
         x_scroll = ttk.Scrollbar(table_container, orient="horizontal", command=self.expenses_tree.xview)
-        self.expenses_tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.expenses_tree.configure(xscrollcommand=x_scroll.set)
         
         # Grid layout
         self.expenses_tree.grid(row=0, column=0, sticky="nsew")
@@ -808,6 +876,15 @@ class ExpenseTrackerApp(tk.Tk):
                          cursor="hand2", command=self.edit_selected_expense)
         edit_btn.pack(side="left", padx=(0, 10), ipady=5)
         
+        # Recategorize button
+        recategorize_btn = tk.Button(btn_frame, text="Recategorize Selected", font=BODY_FONT, 
+                                 bg=ACCENT_COLOR_2, fg=TEXT_COLOR, 
+                                 activebackground=ACCENT_COLOR,
+                                 activeforeground=TEXT_COLOR, 
+                                 borderwidth=0, relief="flat",
+                                 cursor="hand2", command=self.recategorize_selected_expenses)
+        recategorize_btn.pack(side="left", padx=(0, 10), ipady=5)
+        
         # Delete button
         delete_btn = tk.Button(btn_frame, text="Delete Selected", font=BODY_FONT, 
                            bg=ERROR_COLOR, fg=TEXT_COLOR, 
@@ -817,67 +894,64 @@ class ExpenseTrackerApp(tk.Tk):
                            cursor="hand2", command=self.delete_selected_expenses)
         delete_btn.pack(side="left", ipady=5)
         
+        # Import button
+        import_btn = tk.Button(btn_frame, text="Import...", font=BODY_FONT, 
+                           bg=DARK_BG_3, fg=TEXT_COLOR, 
+                           activebackground=ACCENT_COLOR,
+                           activeforeground=TEXT_COLOR, 
+                           borderwidth=0, relief="flat",
+                           cursor="hand2", command=self.import_expenses_from_file)
+        import_btn.pack(side="right", ipady=5)
+        
+        # Export button
+        export_btn = tk.Button(btn_frame, text="Export...", font=BODY_FONT, 
+                           bg=DARK_BG_3, fg=TEXT_COLOR, 
+                           activebackground=ACCENT_COLOR,
+                           activeforeground=TEXT_COLOR, 
+                           borderwidth=0, relief="flat",
+                           cursor="hand2", command=self.export_expenses_to_file)
+        export_btn.pack(side="right", padx=(0, 10), ipady=5)
+        
         # Load data
         self.load_expenses_table()
     
+    def schedule_filter(self, event=None):
+        """Re-run the search once typing pauses instead of on every keystroke"""
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(SEARCH_DEBOUNCE_MS, self.filter_expenses, event)
+    
     def filter_expenses(self, event=None):
         """Filter expenses based on search criteria"""
+        self.search_after_id = None
         search_term = self.search_entry.get().lower()
         category_filter = self.category_filter.get()
         
-        # Clear existing items
-        for item in self.expenses_tree.get_children():
-            self.expenses_tree.delete(item)
-        
-        # Get all expenses
-        expenses = self.get_expenses()
-        
-        # Filter expenses
-        filtered = []
-        for expense in expenses:
-            # Apply category filter
-            if category_filter != "All" and expense['category'] != category_filter:
-                continue
-            
-            # Apply search term filter
-            if search_term:
-                desc = expense.get('description', '').lower()
-                if (search_term not in expense['category'].lower() and 
-                    search_term not in str(expense['amount']) and 
-                    search_term not in desc):
-                    continue
-            
-            filtered.append(expense)
-        
-        # Add filtered expenses
-        for expense in filtered:
-            self.expenses_tree.insert("", "end", values=(
-                expense['date'].strftime("%Y-%m-%d"),
-                expense['category'],
-                f"${expense['amount']:.2f}",
-                expense.get('description', ''),
-                str(expense['_id'])  # Hidden ID
-            ))
+        # Matches come from the store's search index; only the visible rows are inserted
+        expenses = self.store.query(
+            category=None if category_filter == "All" else category_filter,
+            search=search_term or None
+        )
+        self.expenses_table.set_rows(expenses, keep_position=event is None)
+        self.expenses_count_label.config(text=f"{len(expenses)} of {len(self.get_expenses())} expenses")
     
     def load_expenses_table(self):
         """Load expenses into the table"""
-        # Clear existing items
-        for item in self.expenses_tree.get_children():
-            self.expenses_tree.delete(item)
-        
-        # Add expenses
-        for expense in self.get_expenses():
-            self.expenses_tree.insert("", "end", values=(
-                expense['date'].strftime("%Y-%m-%d"),
-                expense['category'],
-                f"${expense['amount']:.2f}",
-                expense.get('description', ''),
-                str(expense['_id'])  # Hidden ID
-            ))
+        self.filter_expenses()
+    
+    def expense_row_values(self, expense):
+        """Table columns for an expense"""
+        return (
+            expense['date'].strftime("%Y-%m-%d"),
+            expense['category'],
+            f"${expense['amount']:.2f}",
+            expense.get('description', ''),
+            str(expense['_id'])  # Hidden ID
+        )
     
     def edit_selected_expense(self):
         """Edit selected expense"""
-        selection = self.expenses_tree.selection()
+        selection = self.expenses_table.selected_keys()
         if not selection:
             messagebox.showwarning("Warning", "Please select an expense to edit", parent=self)
             return
@@ -886,15 +960,10 @@ class ExpenseTrackerApp(tk.Tk):
             messagebox.showwarning("Warning", "Please select only one expense to edit", parent=self)
             return
         
-        item = self.expenses_tree.item(selection[0])
-        expense_id = item['values'][4]  # Get the hidden ID
+        expense_id = selection[0]
         
-        # Find the expense in MongoDB
-        expense = None
-        for exp in self.get_expenses():
-            if str(exp['_id']) == expense_id:
-                expense = exp
-                break
+        # Find the expense
+        expense = self.store.get_expense(expense_id)
         
         if not expense:
             messagebox.showerror("Error", "Expense not found", parent=self)
@@ -1010,7 +1079,7 @@ class ExpenseTrackerApp(tk.Tk):
             messagebox.showerror("Error", f"Invalid input: {str(e)}", parent=self.edit_dialog)
             return
         
-        # Update the expense in MongoDB
+        # Update the expense in storage
         new_data = {
             "date": date_obj,
             "category": category,
@@ -1018,19 +1087,17 @@ class ExpenseTrackerApp(tk.Tk):
             "description": description
         }
         
-        self.update_expense_in_db(expense_id, new_data)
-        
-        # Update UI
-        self.update_stats()
-        self.load_expenses_table()
-        self.filter_expenses()
+        def updated():
+            self.update_stats()
+            self.filter_expenses()
+            messagebox.showinfo("Success", "Expense updated successfully!", parent=self.edit_dialog)
+            self.edit_dialog.destroy()
         
-        messagebox.showinfo("Success", "Expense updated successfully!", parent=self.edit_dialog)
-        self.edit_dialog.destroy()
+        self.update_expense_in_db(expense_id, new_data, on_done=updated)
     
     def delete_selected_expenses(self):
         """Delete selected expenses"""
-        selection = self.expenses_tree.selection()
+        selection = self.expenses_table.selected_keys()
         if not selection:
             messagebox.showwarning("Warning", "Please select expenses to delete", parent=self)
             return
@@ -1045,23 +1112,169 @@ class ExpenseTrackerApp(tk.Tk):
         if not confirm:
             return
         
-        # Get IDs of selected expenses
-        ids_to_delete = [self.expenses_tree.item(item)['values'][4] for item in selection]
+        def deleted():
+            # Only the visible window is re-rendered
+            self.filter_expenses()
+            self.update_stats()
+            messagebox.showinfo("Success", f"{len(selection)} expense(s) deleted", parent=self)
         
-        # Delete from MongoDB
-        for expense_id in ids_to_delete:
-            self.delete_expense_from_db(expense_id)
+        # Delete from storage
+        self.delete_expenses_from_db(selection, on_done=deleted)
+    
+    def recategorize_selected_expenses(self):
+        """Move all selected expenses to another category"""
+        selection = self.expenses_table.selected_keys()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select expenses to recategorize", parent=self)
+            return
         
-        # Update UI
-        self.update_stats()
-        self.load_expenses_table()
-        self.filter_expenses()
+        # Create dialog
+        self.recategorize_dialog = tk.Toplevel(self)
+        self.recategorize_dialog.title("Recategorize Expenses")
+        self.recategorize_dialog.geometry("300x200")
+        self.recategorize_dialog.resizable(False, False)
+        self.recategorize_dialog.transient(self)
+        self.recategorize_dialog.grab_set()
+        
+        # Gradient background
+        GradientFrame(self.recategorize_dialog, color1=DARK_BG_1, color2=DARK_BG_2).pack(fill="both", expand=True)
+        
+        # Main container
+        container = tk.Frame(self.recategorize_dialog, bg=DARK_BG_2)
+        container.place(relx=0.5, rely=0.5, anchor="center", width=280, height=160)
         
-        messagebox.showinfo("Success", f"{len(selection)} expense(s) deleted", parent=self)
+        tk.Label(container, text=f"Recategorize {len(selection)} Expense(s)", font=BODY_FONT, 
+             bg=DARK_BG_2, fg=TEXT_COLOR).pack(pady=(0, 10))
+        
+        # Category
+        tk.Label(container, text="New Category", font=BODY_FONT, 
+             bg=DARK_BG_2, fg=TEXT_COLOR).pack(anchor="w", pady=(0, 5))
+        
+        self.recategorize_category = ttk.Combobox(container, values=self.expense_categories, 
+                                                font=BODY_FONT)
+        self.recategorize_category.pack(fill="x", pady=(0, 10), ipady=5)
+        
+        # Button frame
+        btn_frame = tk.Frame(container, bg=DARK_BG_2)
+        btn_frame.pack(fill="x")
+        
+        # Save button
+        save_btn = tk.Button(btn_frame, text="Save Changes", font=BODY_FONT, 
+                         bg=SUCCESS_COLOR, fg=TEXT_COLOR, 
+                         activebackground="#4CAF50",
+                         activeforeground=TEXT_COLOR, 
+                         borderwidth=0, relief="flat",
+                         cursor="hand2", 
+                         command=lambda: self.save_recategorized_expenses(selection))
+        save_btn.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        
+        # Cancel button
+        cancel_btn = tk.Button(btn_frame, text="Cancel", font=BODY_FONT, 
+                           bg=ERROR_COLOR, fg=TEXT_COLOR, 
+                           activebackground="#F44336",
+                           activeforeground=TEXT_COLOR, 
+                           borderwidth=0, relief="flat",
+                           cursor="hand2", 
+                           command=self.recategorize_dialog.destroy)
+        cancel_btn.pack(side="left", fill="x", expand=True)
+    
+    def save_recategorized_expenses(self, selection):
+        """Apply the new category to the selected expenses"""
+        category = self.recategorize_category.get().strip()
+        if not category:
+            messagebox.showerror("Error", "Please select a category", parent=self.recategorize_dialog)
+            return
+        
+        def recategorized():
+            # Only the visible window is re-rendered
+            self.filter_expenses()
+            self.update_stats()
+            messagebox.showinfo("Success", f"{len(selection)} expense(s) recategorized", 
+                              parent=self.recategorize_dialog)
+            self.recategorize_dialog.destroy()
+        
+        # Update storage in a single request
+        self.update_expenses_in_db(selection, {"category": category}, on_done=recategorized)
+    
+    def import_expenses_from_file(self):
+        """Import expenses from a CSV, OFX or QIF file"""
+        path = filedialog.askopenfilename(
+            parent=self, title="Import Expenses",
+            filetypes=[("Statements", "*.csv *.ofx *.qif"), ("CSV", "*.csv"),
+                       ("OFX", "*.ofx"), ("QIF", "*.qif")]
+        )
+        if not path:
+            return
+        
+        # Progress dialog
+        progress_dialog = tk.Toplevel(self, bg=DARK_BG_2, padx=20, pady=20)
+        progress_dialog.title("Importing...")
+        progress_dialog.resizable(False, False)
+        progress_dialog.transient(self)
+        progress_dialog.grab_set()
+        
+        status = tk.Label(progress_dialog, text="Reading file...", font=BODY_FONT, 
+                      bg=DARK_BG_2, fg=TEXT_COLOR)
+        status.pack(anchor="w", pady=(0, 10))
+        bar = ttk.Progressbar(progress_dialog, length=300, maximum=1.0)
+        bar.pack(fill="x")
+        
+        # The import runs on a worker thread, which only records its progress
+        progress = {"result": None, "fraction": 0.0}
+        
+        def on_progress(result, fraction):
+            progress["result"], progress["fraction"] = result, fraction
+        
+        def show_progress():
+            if not progress_dialog.winfo_exists():
+                return
+            bar["value"] = progress["fraction"]
+            if progress["result"] is not None:
+                status.config(text=f"Imported {progress['result'].imported} expense(s)...")
+            progress_dialog.after(100, show_progress)
+        
+        def imported(result):
+            progress_dialog.destroy()
+            
+            # Pull everything in once now that the import is done
+            self.refresh_data()
+            
+            message = f"{result.imported} expense(s) imported"
+            if result.rejected:
+                message += f", {result.rejected} invalid row(s) skipped"
+            messagebox.showinfo("Import Complete", message, parent=self)
+        
+        def failed(error):
+            progress_dialog.destroy()
+            messagebox.showerror("Import Failed", str(error), parent=self)
+        
+        self.io.submit(lambda: import_expenses(self.storage, path, progress=on_progress),
+                       on_done=imported, on_error=failed, write=True)
+        show_progress()
+    
+    def export_expenses_to_file(self):
+        """Export expenses (limited to the selected category) to CSV or JSON Lines"""
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Export Expenses", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"),
+                       ("Compressed CSV", "*.csv.gz"), ("Compressed JSON Lines", "*.jsonl.gz")]
+        )
+        if not path:
+            return
+        
+        category = self.category_filter.get()
+        category = None if category == "All" else category
+        self.io.submit(
+            lambda: export_expenses(self.storage, path, category=category),
+            on_done=lambda count: messagebox.showinfo(
+                "Export Complete", f"{count} expense(s) exported", parent=self),
+            on_error=lambda e: messagebox.showerror("Export Failed", str(e), parent=self)
+        )
     
     def show_budget(self):
         """Show budget management with modern styling"""
         self.clear_main_content()
+        self.current_view = self.show_budget
         
         # Budget frame
         budget_frame = tk.Frame(self.main_content, bg=DARK_BG_2, padx=20, pady=20)
@@ -1158,7 +1371,10 @@ class ExpenseTrackerApp(tk.Tk):
         self.load_budget_tree()
     
     def load_budget_tree(self):
-        """Load budgets into the treeview"""
+        """Load budgets into the treeview, keeping the selection and scroll position"""
+        selected = {str(self.budget_tree.item(item, "values")[0])
+                    for item in self.budget_tree.selection()}
+        top = self.budget_tree.yview()[0]
         # Clear existing items
         for item in self.budget_tree.get_children():
             self.budget_tree.delete(item)
@@ -1168,14 +1384,8 @@ class ExpenseTrackerApp(tk.Tk):
             return
     
         # Get current month's spending by category
-        expenses = self.get_expenses()
         current_month = datetime.now().strftime("%Y-%m")
-        monthly_spending = {}
-    
-        for expense in expenses:
-            if expense['date'].strftime("%Y-%m") == current_month:
-                category = expense['category']
-                monthly_spending[category] = monthly_spending.get(category, 0) + expense['amount']
+        monthly_spending = self.store.category_totals(month=current_month)
     
         # Add budgets to treeview
         for category, amount in budgets.items():
@@ -1185,12 +1395,15 @@ class ExpenseTrackerApp(tk.Tk):
             # Determine row color based on budget status
             tags = ('over',) if spent > amount else ('under',)
         
-            self.budget_tree.insert("", "end", values=(
+            item = self.budget_tree.insert("", "end", values=(
                 category,
                 f"${amount:.2f}",
                 f"${spent:.2f}",
                 f"${remaining:.2f}"
             ), tags=tags)
+            if category in selected:
+                self.budget_tree.selection_add(item)
+        self.budget_tree.yview_moveto(top)
     
         # Configure tag colors
         self.budget_tree.tag_configure('over', foreground=ERROR_COLOR)
@@ -1216,22 +1429,21 @@ class ExpenseTrackerApp(tk.Tk):
             messagebox.showerror("Error", "Please enter a valid positive number", parent=self)
             return
     
-        # Update budgets in MongoDB
+        # Update budgets in storage
         budgets = self.get_budgets()
         budgets[category] = amount
-        self.update_budgets_in_db(budgets)
-    
-        # Update all relevant UI components
-        self.load_budget_tree()
-        self.update_sidebar_stats()
-        self.update_stats()
-        self.update_charts()  # Add this to refresh charts
-    
-        messagebox.showinfo("Success", f"Budget for {category} set to ${amount:.2f}", parent=self)
+        def saved():
+            # Update all relevant UI components
+            self.load_budget_tree()
+            self.update_stats()
+        
+            messagebox.showinfo("Success", f"Budget for {category} set to ${amount:.2f}", parent=self)
+        
+            # Clear form
+            self.budget_category.set('')
+            self.budget_amount.delete(0, tk.END)
     
-        # Clear form
-        self.budget_category.set('')
-        self.budget_amount.delete(0, tk.END)
+        self.update_budgets_in_db(budgets, on_done=saved)
     
     def edit_budget(self):
         """Edit selected budget"""
@@ -1318,18 +1530,19 @@ class ExpenseTrackerApp(tk.Tk):
             messagebox.showerror("Error", "Please enter a valid positive number", parent=self.edit_budget_dialog)
             return
         
-        # Update the budget in MongoDB
+        # Update the budget in storage
         budgets = self.get_budgets()
         budgets[category] = amount
-        self.update_budgets_in_db(budgets)
-        
-        # Update UI
-        self.load_budget_tree()
-        self.update_stats()
+        def saved():
+            # Update UI
+            self.load_budget_tree()
+            self.update_stats()
+            
+            messagebox.showinfo("Success", f"Budget for {category} updated to ${amount:.2f}", 
+                              parent=self.edit_budget_dialog)
+            self.edit_budget_dialog.destroy()
         
-        messagebox.showinfo("Success", f"Budget for {category} updated to ${amount:.2f}", 
-                          parent=self.edit_budget_dialog)
-        self.edit_budget_dialog.destroy()
+        self.update_budgets_in_db(budgets, on_done=saved)
     
     def clear_budget(self):
         """Clear selected budget"""
@@ -1351,22 +1564,24 @@ class ExpenseTrackerApp(tk.Tk):
         if not confirm:
             return
         
-        # Remove budgets from MongoDB
+        # Remove budgets from storage
         budgets = self.get_budgets()
         for category in categories:
             budgets.pop(category, None)
         
-        self.update_budgets_in_db(budgets)
-        
-        # Update UI
-        self.load_budget_tree()
-        self.update_stats()
+        def cleared():
+            # Update UI
+            self.load_budget_tree()
+            self.update_stats()
+            
+            messagebox.showinfo("Success", f"{len(categories)} budget(s) cleared", parent=self)
         
-        messagebox.showinfo("Success", f"{len(categories)} budget(s) cleared", parent=self)
+        self.update_budgets_in_db(budgets, on_done=cleared)
     
     def show_reports(self):
         """Show reports view with modern styling"""
         self.clear_main_content()
+        self.current_view = self.show_reports
         
         reports_frame = tk.Frame(self.main_content, bg=DARK_BG_2, padx=20, pady=20)
         reports_frame.pack(fill="both", expand=True)
@@ -1447,71 +1662,88 @@ class ExpenseTrackerApp(tk.Tk):
             widget.destroy()
         
         # Filter data based on time period
+        import pandas as pd
         today = datetime.now()
         start_date = {
             "Last Month": today - pd.DateOffset(months=1),
             "Last 3 Months": today - pd.DateOffset(months=3),
             "Last 6 Months": today - pd.DateOffset(months=6),
             "Last Year": today - pd.DateOffset(years=1),
-            "All Time": datetime.min
-        }.get(time_period, datetime.min)
+        }.get(time_period)
         
-        expenses = [exp for exp in self.get_expenses() if exp['date'] >= start_date]
+        # Periods start on the exact day; the render cache is keyed by that day
+        rollups = self.store.get_rollups(start_date)
+        start_day = start_date.toordinal() if start_date is not None else None
         
-        if not expenses:
+        if not rollups:
             tk.Label(self.report_canvas, text="No data available for the selected period", 
                  font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(fill="both", expand=True)
             return
         
         # Generate report
         if report_type == "Monthly Summary":
-            self.generate_monthly_report(expenses)
+            self.generate_monthly_report(rollups, start_day)
         elif report_type == "Category Breakdown":
-            self.generate_category_report(expenses)
+            self.generate_category_report(rollups, start_day)
         elif report_type == "Spending Trend":
-            self.generate_trend_report(expenses)
-    
-    def generate_monthly_report(self, expenses):
+            self.generate_trend_report(rollups, start_day)
+    
+    def show_report_chart(self, kind, params, figsize, draw):
+        """Show a report chart, drawing it only if the render cache has no matching image"""
+        import matplotlib
+        from charts import use_chart_style
+        from render_cache import RenderCache
+        use_chart_style()
+        if self.render_cache is None:
+            self.render_cache = RenderCache(get_settings().get("ui", "render_cache_mb") * 2**20)
+        
+        dpi = matplotlib.rcParams["figure.dpi"]
+        size = (round(figsize[0] * dpi), round(figsize[1] * dpi))
+        key = (kind, params, self.store.version, size)
+        image = self.render_cache.render(key, draw, size, dpi, master=self)
+        
+        label = tk.Label(self.report_canvas, image=image, bg=DARK_BG_2, borderwidth=0)
+        label.image = image  # keep it alive while shown, even if evicted
+        label.pack(fill="x", expand=True, pady=10)
+    
+    def generate_monthly_report(self, rollups, start_day):
         """Generate monthly summary report with improved styling"""
-        # Create figure with dark theme
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
         # Convert to DataFrame for easier manipulation
+        import matplotlib
         import pandas as pd
-        df = pd.DataFrame(expenses)
-        df['date'] = pd.to_datetime(df['date'])
-        
-        # Group by month and category
-        df["Month"] = df["date"].dt.to_period("M")
-        monthly_data = df.groupby(["Month", "category"])["amount"].sum().unstack().fillna(0)
-        
-        # Plot stacked bar chart
-        colors = plt.cm.tab20.colors[:len(monthly_data.columns)]
-        monthly_data.plot(kind="bar", stacked=True, ax=ax, color=colors)
+        df = pd.DataFrame(rollups)
         
-        # Style the chart
-        ax.set_title("Monthly Spending by Category", color=TEXT_COLOR)
-        ax.set_ylabel("Amount ($)", color=TEXT_COLOR)
-        ax.set_xlabel("Month", color=TEXT_COLOR)
+        # Rollups are already grouped by month and category
+        monthly_data = df.pivot_table(index="month", columns="category", values="total",
+                                      aggfunc="sum", fill_value=0)
         
-        # Custom legend
-        legend = ax.legend(title="Category", facecolor=DARK_BG_3, 
-                          edgecolor=DARK_BG_3, labelcolor=TEXT_COLOR)
-        plt.setp(legend.get_title(), color=TEXT_COLOR)
-        
-        # Grid and spines
-        ax.grid(color=DARK_BG_3, linestyle='--', alpha=0.5)
-        for spine in ax.spines.values():
-            spine.set_color(TEXT_COLOR_2)
-        
-        # Rotate x-axis labels
-        ax.tick_params(axis='x', colors=TEXT_COLOR, rotation=45)
-        ax.tick_params(axis='y', colors=TEXT_COLOR)
+        def draw(fig):
+            ax = fig.add_subplot()
+            
+            # Plot stacked bar chart
+            colors = matplotlib.colormaps["tab20"].colors[:len(monthly_data.columns)]
+            monthly_data.plot(kind="bar", stacked=True, ax=ax, color=colors)
+            
+            # Style the chart
+            ax.set_title("Monthly Spending by Category", color=TEXT_COLOR)
+            ax.set_ylabel("Amount ($)", color=TEXT_COLOR)
+            ax.set_xlabel("Month", color=TEXT_COLOR)
+            
+            # Custom legend
+            legend = ax.legend(title="Category", facecolor=DARK_BG_3, 
+                              edgecolor=DARK_BG_3, labelcolor=TEXT_COLOR)
+            legend.get_title().set_color(TEXT_COLOR)
+            
+            # Grid and spines
+            ax.grid(color=DARK_BG_3, linestyle='--', alpha=0.5)
+            for spine in ax.spines.values():
+                spine.set_color(TEXT_COLOR_2)
+            
+            # Rotate x-axis labels
+            ax.tick_params(axis='x', colors=TEXT_COLOR, rotation=45)
+            ax.tick_params(axis='y', colors=TEXT_COLOR)
         
-        # Embed in Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.report_canvas)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="x", expand=True, pady=10)
+        self.show_report_chart("monthly", start_day, (10, 5), draw)
         
         # Add total spending label
         total_spending = monthly_data.sum(axis=1).sum()
@@ -1519,42 +1751,40 @@ class ExpenseTrackerApp(tk.Tk):
              text=f"Total Spending: ${total_spending:.2f} over {len(monthly_data)} months", 
              font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(anchor="w", padx=20)
     
-    def generate_category_report(self, expenses):
+    def generate_category_report(self, rollups, start_day):
         """Generate category breakdown report with improved styling"""
-        # Create figure with dark theme
-        fig, ax = plt.subplots(figsize=(8, 8))
-        
         # Convert to DataFrame for easier manipulation
+        import matplotlib
         import pandas as pd
-        df = pd.DataFrame(expenses)
+        df = pd.DataFrame(rollups)
         
         # Group by category
-        category_data = df.groupby("category")["amount"].sum()
-        
-        # Plot pie chart with improved visibility
-        colors = plt.cm.tab20.colors[:len(category_data)]
-        explode = [0.05] * len(category_data)  # Add slight separation between slices
-        
-        wedges, texts, autotexts = ax.pie(category_data, 
-                                         labels=category_data.index, 
-                                         autopct="%1.1f%%",
-                                         startangle=90, 
-                                         colors=colors, 
-                                         explode=explode,
-                                         textprops={"color": TEXT_COLOR},
-                                         wedgeprops={"edgecolor": DARK_BG_2, "linewidth": 1})
+        category_data = df.groupby("category")["total"].sum()
         
-        ax.set_title("Category Spending Breakdown", color=TEXT_COLOR)
-        
-        # Make autopct text more visible
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontsize(10)
+        def draw(fig):
+            ax = fig.add_subplot()
+            
+            # Plot pie chart with improved visibility
+            colors = matplotlib.colormaps["tab20"].colors[:len(category_data)]
+            explode = [0.05] * len(category_data)  # Add slight separation between slices
+            
+            wedges, texts, autotexts = ax.pie(category_data, 
+                                             labels=category_data.index, 
+                                             autopct="%1.1f%%",
+                                             startangle=90, 
+                                             colors=colors, 
+                                             explode=explode,
+                                             textprops={"color": TEXT_COLOR},
+                                             wedgeprops={"edgecolor": DARK_BG_2, "linewidth": 1})
+            
+            ax.set_title("Category Spending Breakdown", color=TEXT_COLOR)
+            
+            # Make autopct text more visible
+            for autotext in autotexts:
+                autotext.set_color('white')
+                autotext.set_fontsize(10)
         
-        # Embed in Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.report_canvas)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="x", expand=True, pady=10)
+        self.show_report_chart("category", start_day, (8, 8), draw)
         
         # Add total spending label
         total_spending = category_data.sum()
@@ -1562,46 +1792,41 @@ class ExpenseTrackerApp(tk.Tk):
              text=f"Total Spending: ${total_spending:.2f} across {len(category_data)} categories", 
              font=BODY_FONT, bg=DARK_BG_2, fg=TEXT_COLOR).pack(anchor="w", padx=20)
     
-    def generate_trend_report(self, expenses):
+    def generate_trend_report(self, rollups, start_day):
         """Generate spending trend report with improved styling"""
-        # Create figure with dark theme
-        fig, ax = plt.subplots(figsize=(10, 5))
-        
         # Convert to DataFrame for easier manipulation
         import pandas as pd
-        df = pd.DataFrame(expenses)
-        df['date'] = pd.to_datetime(df['date'])
+        df = pd.DataFrame(rollups)
         
         # Group by month
-        df["Month"] = df["date"].dt.to_period("M")
-        trend_data = df.groupby("Month")["amount"].sum()
-        
-        # Plot trend line with markers
-        ax.plot(trend_data.index.astype(str), trend_data.values, 
-               color=ACCENT_COLOR, marker="o", linewidth=2, markersize=8)
-        
-        # Style the chart
-        ax.set_title("Spending Trend Over Time", color=TEXT_COLOR)
-        ax.set_ylabel("Amount ($)", color=TEXT_COLOR)
-        ax.set_xlabel("Month", color=TEXT_COLOR)
+        trend_data = df.groupby("month")["total"].sum()
         
-        # Grid and spines
-        ax.grid(color=DARK_BG_3, linestyle='--', alpha=0.5)
-        for spine in ax.spines.values():
-            spine.set_color(TEXT_COLOR_2)
-        
-        # Rotate x-axis labels
-        ax.tick_params(axis='x', colors=TEXT_COLOR, rotation=45)
-        ax.tick_params(axis='y', colors=TEXT_COLOR)
-        
-        # Add value annotations
-        for x, y in zip(trend_data.index.astype(str), trend_data.values):
-            ax.text(x, y, f"${y:.0f}", ha='center', va='bottom', color=TEXT_COLOR)
+        def draw(fig):
+            ax = fig.add_subplot()
+            
+            # Plot trend line with markers
+            ax.plot(trend_data.index, trend_data.values, 
+                   color=ACCENT_COLOR, marker="o", linewidth=2, markersize=8)
+            
+            # Style the chart
+            ax.set_title("Spending Trend Over Time", color=TEXT_COLOR)
+            ax.set_ylabel("Amount ($)", color=TEXT_COLOR)
+            ax.set_xlabel("Month", color=TEXT_COLOR)
+            
+            # Grid and spines
+            ax.grid(color=DARK_BG_3, linestyle='--', alpha=0.5)
+            for spine in ax.spines.values():
+                spine.set_color(TEXT_COLOR_2)
+            
+            # Rotate x-axis labels
+            ax.tick_params(axis='x', colors=TEXT_COLOR, rotation=45)
+            ax.tick_params(axis='y', colors=TEXT_COLOR)
+            
+            # Add value annotations
+            for x, y in zip(trend_data.index, trend_data.values):
+                ax.text(x, y, f"${y:.0f}", ha='center', va='bottom', color=TEXT_COLOR)
         
-        # Embed in Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.report_canvas)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="x", expand=True, pady=10)
+        self.show_report_chart("trend", start_day, (10, 5), draw)
         
         # Add stats labels
         avg_spending = trend_data.mean()
@@ -1618,9 +1843,20 @@ class ExpenseTrackerApp(tk.Tk):
         tk.Label(stats_frame, text=f"Minimum: ${min_spending:.2f}", 
              font=BODY_FONT, bg=DARK_BG_2, fg=SUCCESS_COLOR).pack(side="left")
     
+    def on_close(self):
+        """Save a snapshot, release storage (stopping background sync) and close the window"""
+        self.save_data()
+        # Let pending saves finish (closing storage under them would lose them);
+        # reads and polls are cancelled rather than waited for
+        self.io.shutdown(wait=True)
+        self.storage.close()
+        if self.charts is not None:
+            self.charts.destroy()
+        self.destroy()
+    
     def logout(self):
         """Logout and return to authentication window"""
-        self.destroy()
+        self.on_close()
         from auth import AuthWindow
         AuthWindow()
 
@@ -0,0 +1,165 @@
+"""Command line maintenance tasks for the Expense Tracker data store"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+
+from config import get_settings
+from async_storage import AsyncMongoStorage
+from db import close_async_client, close_client, get_async_database, get_database
+from expense_store import month_bounds
+from exporter import export_expenses
+from importer import DEFAULT_BATCH_SIZE, import_expenses
+from mongo_storage import USERS_COLLECTION, ensure_indexes, migrate_all_expenses
+from passwords import calibrate, hash_password
+from storage import BACKENDS, open_storage
+
+
+def configure(args):
+    """Apply the global command line options to the settings"""
+    settings = get_settings()
+    if args.backend:
+        settings.override("storage", "backend", args.backend)
+    if args.uri:
+        settings.override("mongodb", "uri", args.uri)
+    if args.database:
+        settings.override("mongodb", "database", args.database)
+
+
+def open_user_storage(username):
+    """Open storage for an existing user, exiting if there is no such user"""
+    storage = open_storage(username)
+    storage.prepare()
+    if not storage.get_user_data():
+        sys.exit(f"No such user: {username}")
+    return storage
+
+
+def cmd_migrate(args):
+    """Move embedded expense arrays into the expenses collection"""
+    if get_settings().get("storage", "backend") != "mongodb":
+        sys.exit("migrate only applies to the mongodb backend")
+    db = get_database()
+    ensure_indexes(db)
+    total = migrate_all_expenses(
+        db, batch_size=args.batch_size,
+        progress=lambda username, moved: print(f"{username}: moved {moved} expense(s)")
+    )
+    print(f"Migrated {total} expense(s)")
+
+
+async def user_stats(usernames):
+    """Summaries of the given users (default: everyone), fetched concurrently"""
+    db = get_async_database()
+    try:
+        if not usernames:
+            usernames = [user["username"] async for user
+                         in db[USERS_COLLECTION].find({}, {"username": 1})]
+        month_start, month_end = month_bounds()
+        summaries = await asyncio.gather(*(
+            AsyncMongoStorage(db, username).get_summary(month_start, month_end)
+            for username in usernames
+        ))
+        return list(zip(usernames, summaries))
+    finally:
+        await close_async_client()
+
+
+def cmd_stats(args):
+    """Print expense totals per user"""
+    if get_settings().get("storage", "backend") != "mongodb":
+        sys.exit("stats only applies to the mongodb backend")
+    for username, summary in asyncio.run(user_stats(args.user)):
+        print(f"{username}: {summary['count']} expense(s), total {summary['total']:.2f}, "
+              f"this month {summary['monthly']:.2f}, top {summary['top_category'] or '-'}")
+
+
+def cmd_calibrate_passwords(args):
+    """Pick the scrypt work factor that hashes in the target time on this machine"""
+    target = args.target_ms or get_settings().get("security", "password_hash_ms")
+    params = calibrate(target)
+    started = time.perf_counter()
+    hash_password("calibration", params)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"n = {params.n} (r = {params.r}, p = {params.p}) hashes in {elapsed:.0f} ms "
+          f"(target {target} ms)")
+    print(f"To pin it, add to expense_tracker.ini:\n\n[security]\nscrypt_n = {params.n}")
+
+
+def cmd_import(args):
+    """Import expenses from a CSV, OFX or QIF file"""
+    storage = open_user_storage(args.user)
+    result = import_expenses(
+        storage, args.path, fmt=args.format, batch_size=args.batch_size,
+        progress=lambda result, fraction: print(
+            f"\r{fraction:6.1%}  {result.imported} imported", end="", flush=True)
+    )
+    print(f"\nImported {result.imported} expense(s), skipped {result.rejected} invalid row(s)")
+
+
+def cmd_export(args):
+    """Export expenses to CSV or JSON Lines"""
+    storage = open_user_storage(args.user)
+    count = export_expenses(
+        storage, args.path, fmt=args.format, compress=args.gzip or None,
+        start=args.start, end=args.end, category=args.category,
+        progress=lambda count: print(f"\r{count} exported", end="", flush=True)
+    )
+    print(f"\nExported {count} expense(s) to {args.path}")
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=BACKENDS, help="storage backend (default: from config)")
+    parser.add_argument("--uri", help="MongoDB connection string (default: from config)")
+    parser.add_argument("--database", help="database name (default: from config)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help=cmd_migrate.__doc__)
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.set_defaults(func=cmd_migrate)
+
+    stats = commands.add_parser("stats", help=cmd_stats.__doc__)
+    stats.add_argument("--user", action="append", help="only this user (repeatable)")
+    stats.set_defaults(func=cmd_stats)
+
+    calibration = commands.add_parser("calibrate-passwords", help=cmd_calibrate_passwords.__doc__)
+    calibration.add_argument("--target-ms", type=int,
+                             help="time one hash should take (default: from config)")
+    calibration.set_defaults(func=cmd_calibrate_passwords)
+
+    importer = commands.add_parser("import", help=cmd_import.__doc__)
+    importer.add_argument("--user", required=True)
+    importer.add_argument("--format", choices=["csv", "ofx", "qif"],
+                          help="file format (default: from the file extension)")
+    importer.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    importer.add_argument("path")
+    importer.set_defaults(func=cmd_import)
+
+    exporter = commands.add_parser("export", help=cmd_export.__doc__)
+    exporter.add_argument("--user", required=True)
+    exporter.add_argument("--format", choices=["csv", "jsonl"],
+                          help="output format (default: from the file name)")
+    exporter.add_argument("--gzip", action="store_true",
+                          help="gzip the output (implied by a .gz file name)")
+    exporter.add_argument("--start", type=parse_date, help="first date to include (YYYY-MM-DD)")
+    exporter.add_argument("--end", type=parse_date, help="first date to exclude (YYYY-MM-DD)")
+    exporter.add_argument("--category")
+    exporter.add_argument("path")
+    exporter.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+    configure(args)
+    try:
+        args.func(args)
+    finally:
+        close_client()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+import logging
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson.objectid import ObjectId
+
+from storage import DuplicateUserError, Storage, UnknownUserError
+
+log = logging.getLogger(__name__)
+
+USERS_COLLECTION = "users"
+EXPENSES_COLLECTION = "expenses"
+TOMBSTONES_COLLECTION = "expense_tombstones"
+
+# Change numbers: expense writes reserve the next number (seq_counter) and
+# list it in `pending_seqs`, stamp it on the documents as `seq`, then publish.
+# Publishing moves the user's `revision` only up to just below the oldest
+# number still pending, so when concurrent writers finish out of order,
+# changes_since still never hands out a revision past documents that have not
+# been written yet. A reservation left by a writer that died stops holding
+# the revision back after PENDING_TIMEOUT_MS; a writer that was only slow
+# finds its reservation gone when it publishes, and moves its documents to a
+# fresh number first (see _publish_revision), since clients may already have
+# a revision past the expired one.
+PENDING_TIMEOUT_MS = 60000
+
+NEXT_REVISION = {"$add": [{"$max": [{"$ifNull": ["$seq_counter", 0]},
+                                    {"$ifNull": ["$revision", 0]}]}, 1]}
+
+# The highest revision with nothing pending at or below it (after live_pending):
+# just below the oldest pending number, or the last number taken if none is
+PUBLISHABLE = {"$max": [{"$ifNull": ["$revision", 0]},
+                        {"$ifNull": [{"$subtract": [{"$min": "$pending_seqs.seq"}, 1]},
+                                     "$seq_counter"]}]}
+
+
+# Projections of the user document: never the legacy embedded expenses
+CREDENTIAL_FIELDS = {"password": 1}
+PROFILE_FIELDS = {"username": 1, "created_at": 1, "budgets": 1, "revision": 1}
+USER_FIELDS = {"expenses": 0}
+CHANGES_FIELDS = {"revision": 1, "budgets": 1}
+COUNTER_FIELDS = {"seq_counter": 1}
+# Expenses are returned without their owner
+EXPENSE_FIELDS = {"username": 0}
+
+# (collection, keys, options) of the indexes the collections are queried by
+INDEXES = [
+    (USERS_COLLECTION, [("username", ASCENDING)],
+     {"name": "username", "unique": True}),
+    (EXPENSES_COLLECTION, [("username", ASCENDING), ("date", DESCENDING)],
+     {"name": "user_date"}),
+    (EXPENSES_COLLECTION, [("username", ASCENDING), ("category", ASCENDING),
+                           ("date", DESCENDING)],
+     {"name": "user_category_date"}),
+    (EXPENSES_COLLECTION, [("username", ASCENDING), ("seq", ASCENDING)],
+     {"name": "user_seq"}),
+    (TOMBSTONES_COLLECTION, [("username", ASCENDING), ("seq", ASCENDING)],
+     {"name": "user_seq"}),
+]
+
+
+def ensure_indexes(db):
+    """Create the indexes the collections are queried by"""
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except DuplicateKeyError as e:
+            index_conflict(collection, options, e)
+
+
+def index_conflict(collection, options, error):
+    """Report a unique index that existing duplicates keep from being built"""
+    # Everything else still works; the duplicates have to be merged by hand
+    log.warning("Could not create unique index %s on %s: %s", options["name"], collection, error)
+
+
+def embedded_batch_query(username, batch_size):
+    """(filter, projection) of the next batch of a user's embedded expenses"""
+    return ({"username": username, "expenses.0": {"$exists": True}},
+            {"expenses": {"$slice": batch_size}})
+
+
+def migration_writes(username, user):
+    """(upserts, pull) moving the batch read by embedded_batch_query, or None when done.
+
+    Each batch is upserted by _id before it is pulled from the user document,
+    so an interrupted migration can simply be run again.
+    """
+    batch = [expense for expense in user["expenses"] if "_id" in expense]
+    if not batch:
+        return None
+    upserts = [UpdateOne({"_id": expense["_id"]},
+                         {"$setOnInsert": dict(expense, username=username)},
+                         upsert=True)
+               for expense in batch]
+    pull = {"$pull": {"expenses": {"_id": {"$in": [expense["_id"] for expense in batch]}}}}
+    return upserts, pull
+
+
+def emptied_array(username):
+    """(filter, update) dropping the emptied array so the user document stays small"""
+    return {"username": username, "expenses": {"$size": 0}}, {"$unset": {"expenses": ""}}
+
+
+def migrate_user_expenses(db, username, batch_size=500):
+    """Move a user's embedded expenses array into the expenses collection"""
+    users = db[USERS_COLLECTION]
+    moved = 0
+    while True:
+        user = users.find_one(*embedded_batch_query(username, batch_size))
+        writes = migration_writes(username, user) if user else None
+        if writes is None:
+            break
+        upserts, pull = writes
+        db[EXPENSES_COLLECTION].bulk_write(upserts, ordered=False)
+        users.update_one({"_id": user["_id"]}, pull)
+        moved += len(upserts)
+    users.update_one(*emptied_array(username))
+    return moved
+
+
+def expense_query(username, start=None, end=None, category=None):
+    """Filter for a user's expenses in [start, end) and optionally one category"""
+    query = {"username": username}
+    if category:
+        query["category"] = category
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lt"] = end
+    return query
+
+
+def ids_query(username, expense_ids):
+    """Filter for some of a user's expenses, by id (strings or ObjectIds)"""
+    return {"_id": {"$in": [ObjectId(expense_id) for expense_id in expense_ids]},
+            "username": username}
+
+
+def new_documents(username, expenses, revision):
+    """Expense documents to insert, stamped with their owner and change number"""
+    return [dict(expense, username=username, seq=revision) for expense in expenses]
+
+
+def expense_update(fields, revision):
+    """Update setting `fields` on expenses changed under `revision`"""
+    return {"$set": dict(fields, seq=revision)}
+
+
+def tombstone_documents(username, expense_ids, revision):
+    """Tombstones recording the deletion of expenses under `revision`"""
+    return [{"username": username, "expense_id": str(ObjectId(expense_id)), "seq": revision}
+            for expense_id in expense_ids]
+
+
+def changes_window(username, revision, user):
+    """Filter for the expenses and tombstones written after `revision`, or None if none were"""
+    if user is None or user.get("revision", 0) == revision:
+        return None
+    return {"username": username, "seq": {"$gt": revision, "$lte": user.get("revision", 0)}}
+
+
+def read_changes(user, expenses, tombstones):
+    """The changes_since dict from the user document and what changes_window matched"""
+    return {
+        "revision": user.get("revision", 0),
+        "budgets": user.get("budgets", {}),
+        "expenses": expenses,
+        "deleted": [tombstone["expense_id"] for tombstone in tombstones]
+    }
+
+
+def summary_pipeline(username, month_start, month_end):
+    """Total, this month's total and top category in one aggregation"""
+    return [
+        {"$match": {"username": username}},
+        {"$facet": {
+            "total": [
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+            ],
+            "month": [
+                {"$match": {"date": {"$gte": month_start, "$lt": month_end}}},
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}}}
+            ],
+            "top_category": [
+                {"$group": {"_id": "$category", "amount": {"$sum": "$amount"}}},
+                {"$sort": {"amount": -1}},
+                {"$limit": 1}
+            ]
+        }}
+    ]
+
+
+def read_summary(result):
+    """Turn the summary_pipeline result into the get_summary dict"""
+    total = result["total"][0] if result["total"] else {"amount": 0, "count": 0}
+    month = result["month"][0] if result["month"] else {"amount": 0}
+    top = result["top_category"][0] if result["top_category"] else None
+    return {
+        "count": total["count"],
+        "total": total["amount"],
+        "monthly": month["amount"],
+        "top_category": top["_id"] if top else None
+    }
+
+
+def live_pending(exclude=None):
+    """pending_seqs without expired reservations, and without `exclude`"""
+    cond = {"$gt": ["$$this.at", {"$subtract": ["$$NOW", PENDING_TIMEOUT_MS]}]}
+    if exclude is not None:
+        cond = {"$and": [cond, {"$ne": ["$$this.seq", exclude]}]}
+    return {"$filter": {"input": {"$ifNull": ["$pending_seqs", []]}, "cond": cond}}
+
+
+def allocate_pipeline():
+    """Update that reserves the next change number and marks it pending"""
+    return [
+        {"$set": {"seq_counter": NEXT_REVISION, "pending_seqs": live_pending()}},
+        {"$set": {"pending_seqs": {"$concatArrays": [
+            "$pending_seqs", [{"seq": "$seq_counter", "at": "$$NOW"}]]}}},
+    ]
+
+
+def publish_pipeline(revision):
+    """Update that marks `revision` written and publishes as far as is safe"""
+    return [{"$set": {"pending_seqs": live_pending(revision)}},
+            {"$set": {"revision": PUBLISHABLE}}]
+
+
+def reserved(username, revision):
+    """Filter matching the user only while `revision` is still reserved (not expired)"""
+    return {"username": username,
+            "$expr": {"$in": [revision, {"$map": {"input": live_pending(), "in": "$$this.seq"}}]}}
+
+
+def restamp(username, stale, revision):
+    """(filter, update) moving the documents written under `stale` to `revision`"""
+    return {"username": username, "seq": stale}, {"$set": {"seq": revision}}
+
+
+def bump_pipeline(fields=None):
+    """Update that takes and publishes the next change number, setting `fields` too"""
+    published = {"revision": PUBLISHABLE}
+    for field, value in (fields or {}).items():
+        published[field] = {"$literal": value}
+    return [{"$set": {"seq_counter": NEXT_REVISION, "pending_seqs": live_pending()}},
+            {"$set": published}]
+
+
+def migrate_all_expenses(db, batch_size=500, progress=None):
+    """Migrate every user that still has embedded expenses"""
+    total = 0
+    pending = db[USERS_COLLECTION].find({"expenses.0": {"$exists": True}},
+                                        {"username": 1})
+    for user in pending:
+        moved = migrate_user_expenses(db, user["username"], batch_size)
+        total += moved
+        if progress:
+            progress(user["username"], moved)
+    return total
+
+
+class MongoStorage(Storage):
+    """Storage backed by a MongoDB database"""
+    def __init__(self, db, username=None):
+        super().__init__(username)
+        self.db = db
+        self.users_collection = db[USERS_COLLECTION]
+        self.expenses_collection = db[EXPENSES_COLLECTION]
+        self.tombstones_collection = db[TOMBSTONES_COLLECTION]
+
+    def prepare(self):
+        """Create indexes and move embedded expenses out"""
+        ensure_indexes(self.db)
+        if self.username:
+            migrate_user_expenses(self.db, self.username)
+
+    def find_user(self, username):
+        """Get a user's document by name"""
+        return self.users_collection.find_one({"username": username}, USER_FIELDS)
+
+    def get_credentials(self, username):
+        """Get just the _id and password hash of a user"""
+        return self.users_collection.find_one({"username": username}, CREDENTIAL_FIELDS)
+
+    def create_user(self, user):
+        """Insert a new user document"""
+        try:
+            self.users_collection.insert_one(dict(user))
+        except DuplicateKeyError:
+            raise DuplicateUserError(user["username"])
+
+    def update_password(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        self.users_collection.update_one({"username": username},
+                                         {"$set": {"password": password_hash}})
+
+    def get_user_data(self):
+        """Get the user's profile: name, creation date, budgets and revision"""
+        return self.users_collection.find_one({"username": self.username}, PROFILE_FIELDS)
+
+    def get_expenses(self):
+        """Get the user's expenses, newest first"""
+        cursor = self.expenses_collection.find({"username": self.username}, EXPENSE_FIELDS)
+        return list(cursor.sort("date", DESCENDING))
+
+    def iter_expenses(self, start=None, end=None, category=None, batch_size=1000):
+        """Stream the user's expenses, oldest first, from a server-side cursor"""
+        query = expense_query(self.username, start, end, category)
+        cursor = self.expenses_collection.find(query, EXPENSE_FIELDS, batch_size=batch_size)
+        return cursor.sort("date", ASCENDING)
+
+    def existing_ids(self, expense_ids):
+        """The ids (as strings) among `expense_ids` that the user still has"""
+        cursor = self.expenses_collection.find(ids_query(self.username, expense_ids), {"_id": 1})
+        return {str(expense["_id"]) for expense in cursor}
+
+    def get_budgets(self):
+        """Get the user's budgets"""
+        user_data = self.users_collection.find_one({"username": self.username}, {"budgets": 1})
+        return user_data.get("budgets", {})
+
+    def get_summary(self, month_start, month_end):
+        """Total, this month's total and top category in one aggregation"""
+        pipeline = summary_pipeline(self.username, month_start, month_end)
+        return read_summary(next(self.expenses_collection.aggregate(pipeline)))
+
+    def get_revision(self):
+        """Get the user's change counter, bumped by every write"""
+        user = self.users_collection.find_one({"username": self.username},
+                                              {"revision": 1})
+        return user.get("revision", 0) if user else 0
+
+    def changes_since(self, revision):
+        """Expenses changed and deleted after `revision`, or None if nothing changed"""
+        user = self.users_collection.find_one({"username": self.username}, CHANGES_FIELDS)
+        window = changes_window(self.username, revision, user)
+        if window is None:
+            return None
+        return read_changes(user, list(self.expenses_collection.find(window, EXPENSE_FIELDS)),
+                            list(self.tombstones_collection.find(window, {"expense_id": 1})))
+
+    def _allocate_revision(self):
+        """Reserve the next change number for the documents about to be written"""
+        user = self.users_collection.find_one_and_update(
+            {"username": self.username},
+            allocate_pipeline(),
+            projection=COUNTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            raise UnknownUserError(self.username)
+        return user["seq_counter"]
+
+    def _publish_revision(self, revision):
+        """Mark `revision` written; changes up to it show once no earlier write is pending.
+
+        If the reservation expired first, later writes may have published past
+        it, so the documents move to a new number before that one is published.
+        Returns the number the changes ended up under.
+        """
+        while not self.users_collection.update_one(reserved(self.username, revision),
+                                                   publish_pipeline(revision)).matched_count:
+            stale, revision = revision, self._allocate_revision()
+            self.expenses_collection.update_many(*restamp(self.username, stale, revision))
+            self.tombstones_collection.update_many(*restamp(self.username, stale, revision))
+        return revision
+
+    def _bump_revision(self, fields=None):
+        """Take the next change number and publish it in one step, setting `fields` too.
+
+        Returns the number taken; the published revision stays below it while
+        an earlier expense write is still pending.
+        """
+        user = self.users_collection.find_one_and_update(
+            {"username": self.username},
+            bump_pipeline(fields),
+            projection=COUNTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            raise UnknownUserError(self.username)
+        return user["seq_counter"]
+
+    def add_expense(self, expense_data):
+        """Insert a new expense"""
+        return self.insert_expenses([expense_data])
+
+    def insert_expenses(self, expenses):
+        """Insert a batch of new expenses in one request"""
+        revision = self._allocate_revision()
+        try:
+            self.expenses_collection.insert_many(
+                new_documents(self.username, expenses, revision), ordered=False)
+        except BulkWriteError:
+            # Some made it in (sync retries hit duplicates): publish them anyway
+            self._publish_revision(revision)
+            raise
+        return self._publish_revision(revision)
+
+    def update_expense(self, expense_id, new_data):
+        """Update the fields of an existing expense"""
+        return self.update_expenses([expense_id], new_data)
+
+    def delete_expense(self, expense_id):
+        """Delete an expense"""
+        return self.delete_expenses([expense_id])
+
+    def update_expenses(self, expense_ids, fields):
+        """Set the same fields on several expenses in one request"""
+        revision = self._allocate_revision()
+        self.expenses_collection.update_many(ids_query(self.username, expense_ids),
+                                             expense_update(fields, revision))
+        return self._publish_revision(revision)
+
+    def delete_expenses(self, expense_ids):
+        """Delete several expenses in one request, leaving tombstones for sync"""
+        revision = self._allocate_revision()
+        self.tombstones_collection.insert_many(
+            tombstone_documents(self.username, expense_ids, revision))
+        self.expenses_collection.delete_many(ids_query(self.username, expense_ids))
+        return self._publish_revision(revision)
+
+    def update_budgets(self, budgets):
+        """Replace the user's budgets"""
+        return self._bump_revision({"budgets": budgets})
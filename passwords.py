@@ -0,0 +1,104 @@
+"""Password hashing with salted scrypt.
+
+Hashes are stored as ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` (salt and hash in
+base64), so each one carries the parameters it was made with and old hashes
+keep verifying after the parameters change. Accounts created before this
+module have an unsalted SHA-256 hex digest; verify_password still accepts
+those, and needs_rehash tells the login to replace them (or any hash weaker
+than the current parameters) once the password is known to be right.
+
+The work factor n is ``[security] scrypt_n`` when set, otherwise it is
+calibrated once per process: one hash at MIN_N is timed and n is scaled up to
+the largest power of two expected to stay within ``[security]
+password_hash_ms`` on this machine. Hashing takes that long on purpose, so
+callers run it off the Tk thread.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import namedtuple
+
+from config import get_settings
+
+ScryptParams = namedtuple("ScryptParams", "n r p")
+
+SCHEME = "scrypt"
+SALT_BYTES = 16
+HASH_BYTES = 32
+BLOCK_SIZE = 8
+PARALLELISM = 1
+# 16 MiB and 128 MiB of memory per hash with r = 8
+MIN_N = 1 << 14
+MAX_N = 1 << 17
+
+_params = None
+_params_lock = threading.Lock()
+
+
+def _scrypt(password, salt, params):
+    return hashlib.scrypt(password.encode(), salt=salt, n=params.n, r=params.r, p=params.p,
+                          maxmem=256 * params.r * params.n, dklen=HASH_BYTES)
+
+
+def calibrate(target_ms, min_n=MIN_N, max_n=MAX_N):
+    """The largest power-of-two n (within the bounds) expected to hash in target_ms"""
+    params = ScryptParams(min_n, BLOCK_SIZE, PARALLELISM)
+    started = time.perf_counter()
+    _scrypt("calibration", os.urandom(SALT_BYTES), params)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    n = min_n
+    # scrypt's time grows linearly with n
+    while n < max_n and elapsed_ms * (n * 2) / min_n <= target_ms:
+        n *= 2
+    return params._replace(n=n)
+
+
+def current_params():
+    """The parameters new hashes are made with, calibrated on first use"""
+    global _params
+    with _params_lock:
+        if _params is None:
+            settings = get_settings()
+            n = settings.get("security", "scrypt_n")
+            if n:
+                _params = ScryptParams(n, BLOCK_SIZE, PARALLELISM)
+            else:
+                _params = calibrate(settings.get("security", "password_hash_ms"))
+        return _params
+
+
+def hash_password(password, params=None):
+    """A new salted hash of `password`"""
+    params = params or current_params()
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, params)
+    return "$".join([SCHEME, str(params.n), str(params.r), str(params.p),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+def _parse(stored):
+    """(params, salt, digest) of an scrypt hash, or None for a legacy SHA-256 hash"""
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    n, r, p = (int(part) for part in parts[1:4])
+    return ScryptParams(n, r, p), base64.b64decode(parts[4]), base64.b64decode(parts[5])
+
+
+def verify_password(password, stored):
+    """Whether `password` matches the stored hash, in constant time"""
+    parsed = _parse(stored)
+    if parsed is None:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    params, salt, digest = parsed
+    return hmac.compare_digest(_scrypt(password, salt, params), digest)
+
+
+def needs_rehash(stored):
+    """Whether a stored hash is legacy SHA-256 or weaker than the current parameters"""
+    parsed = _parse(stored)
+    return parsed is None or parsed[0].n < current_params().n
@@ -0,0 +1,38 @@
+"""Import the main window's heavy modules while the login window is open.
+
+NumPy, pandas and matplotlib take most of a second to import. The main
+window only needs them once the user is logged in, so AuthWindow starts a
+background thread that imports them while credentials are being typed; by
+the time login succeeds they are already in sys.modules. Importing is all
+the thread does: no Tk or matplotlib objects are created off the Tk thread.
+"""
+import importlib
+import threading
+
+# In dependency order, so each import finds most of its own already loaded
+MODULES = (
+    "numpy",
+    "expense_store",
+    "pandas",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_tkagg",
+    "charts",
+    "render_cache",
+    "main_app",
+)
+
+
+def _import_all(modules):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # The main window imports it again and reports the real error
+            print(f"Prewarm of {name} failed: {e}")
+
+
+def start(modules=MODULES):
+    """Begin importing `modules` on a daemon thread"""
+    thread = threading.Thread(target=_import_all, args=(modules,), name="prewarm", daemon=True)
+    thread.start()
+    return thread
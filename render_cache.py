@@ -0,0 +1,73 @@
+"""Cache of rendered report charts.
+
+A report chart is drawn with Agg once and shown as a PhotoImage. The image is
+kept under (chart kind, parameters, data version, pixel size), so returning
+to a report whose data and size have not changed shows the stored image
+straight away instead of drawing the figure again. When the decoded images
+pass the memory cap, the least recently shown ones are dropped.
+"""
+import tkinter as tk
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def rasterize(figure):
+    """Draw a figure with Agg; returns (width, height, RGB bytes)"""
+    canvas = FigureCanvasAgg(figure)
+    canvas.draw()
+    pixels = np.asarray(canvas.buffer_rgba())
+    height, width = pixels.shape[:2]
+    return width, height, pixels[..., :3].tobytes()
+
+
+class RenderCache:
+    """LRU of rendered charts, bounded by the size of the decoded images"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.images = OrderedDict()  # key -> (image, bytes)
+
+    def __len__(self):
+        return len(self.images)
+
+    def get(self, key):
+        """The image stored under `key`, or None"""
+        entry = self.images.get(key)
+        if entry is None:
+            return None
+        self.images.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, image):
+        """Store an image, evicting the least recently used ones over the cap"""
+        self.discard(key)
+        cost = image.width() * image.height() * 4  # Tk keeps 32-bit pixels
+        self.images[key] = (image, cost)
+        self.size += cost
+        while self.size > self.max_bytes and len(self.images) > 1:
+            self.discard(next(iter(self.images)))
+
+    def discard(self, key):
+        entry = self.images.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.images.clear()
+        self.size = 0
+
+    def render(self, key, draw, size, dpi, master=None):
+        """The cached image for `key`, or draw(figure) on a new figure of `size` pixels"""
+        image = self.get(key)
+        if image is None:
+            figure = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+            draw(figure)
+            width, height, rgb = rasterize(figure)
+            # Binary PPM: Tk decodes it without the cost of compressing a PNG
+            image = tk.PhotoImage(master=master,
+                                  data=b"P6 %d %d 255\n" % (width, height) + rgb)
+            self.put(key, image)
+        return image
@@ -0,0 +1,87 @@
+"""In-memory substring index over the searchable fields of expenses.
+
+The search box matches the category, the amount and the description. Those
+values repeat a lot across a history (the same shop, the same price), so the
+index works on distinct lowercased values: each value is listed under every
+trigram it contains, and maps to the ids of the expenses that carry it.
+
+A search checks only the values listed under the rarest trigram of the term,
+then collects their expenses, instead of scanning every expense. Terms shorter
+than a trigram fall back to a scan of the distinct values.
+"""
+GRAM = 3
+
+
+def expense_values(expense):
+    """The searchable values of an expense, lowercased"""
+    return (expense["category"].lower(), str(expense["amount"]).lower(),
+            expense.get("description", "").lower())
+
+
+def _grams(value):
+    return {value[i:i + GRAM] for i in range(len(value) - GRAM + 1)}
+
+
+class SearchIndex:
+    """Trigram index from field values to expense ids"""
+    def __init__(self, expenses=()):
+        self.postings = {}  # trigram -> values containing it
+        self.docs = {}      # value -> ids of expenses carrying it
+        self.values = {}    # expense id -> its values
+        for expense in expenses:
+            self.add(expense)
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, expense):
+        """Index an expense, replacing any earlier version of it"""
+        key = str(expense["_id"])
+        values = expense_values(expense)
+        if self.values.get(key) == values:
+            return
+        self.remove(key)
+        self.values[key] = values
+        for value in values:
+            docs = self.docs.get(value)
+            if docs is None:
+                docs = self.docs[value] = set()
+                for gram in _grams(value):
+                    self.postings.setdefault(gram, set()).add(value)
+            docs.add(key)
+
+    update = add
+
+    def remove(self, expense_id):
+        """Forget an expense"""
+        values = self.values.pop(str(expense_id), None)
+        if values is None:
+            return
+        # Two fields can hold the same value ("Food", "food"): visit it once
+        for value in set(values):
+            docs = self.docs[value]
+            docs.discard(str(expense_id))
+            if not docs:
+                # Last expense with this value: drop it from the postings too
+                del self.docs[value]
+                for gram in _grams(value):
+                    posting = self.postings[gram]
+                    posting.discard(value)
+                    if not posting:
+                        del self.postings[gram]
+
+    def search(self, term):
+        """Ids of the expenses with a field containing `term`"""
+        term = term.lower()
+        if len(term) < GRAM:
+            candidates = self.docs
+        else:
+            postings = [self.postings.get(gram) for gram in _grams(term)]
+            if any(posting is None for posting in postings):
+                return set()
+            candidates = min(postings, key=len)
+        matches = set()
+        for value in candidates:
+            if term in value:
+                matches.update(self.docs[value])
+        return matches
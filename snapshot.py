@@ -0,0 +1,100 @@
+"""Saved copy of a user's data, for showing the dashboard before storage answers.
+
+When the main window closes, the expenses and budgets it holds are written
+to an uncompressed .npz file as columns: ObjectIds as 12-byte rows, dates as
+datetime64[us], amounts as float64, categories and descriptions as codes
+into tables of unique strings. On the next launch the window reads that
+file (local disk, no network), draws the dashboard from it, and then asks
+storage only for what changed after the saved revision (changes_since).
+
+Files are named after a hash of the backend, where its data lives and the
+username, so a snapshot is never applied to another database's revisions.
+They are replaced atomically, and one that cannot be read is ignored.
+"""
+import hashlib
+import json
+import os
+import zipfile
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from config import get_settings
+
+FORMAT = 1
+OBJECT_ID_BYTES = 12
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def snapshot_path(username):
+    """The configured backend's snapshot file for `username`, or None if snapshots are off"""
+    settings = get_settings()
+    directory = settings.get("storage", "snapshot_dir")
+    if not directory:
+        return None
+    backend = settings.get("storage", "backend")
+    if backend == "mongodb":
+        location = f"{settings.get('mongodb', 'uri')}/{settings.get('mongodb', 'database')}"
+    else:
+        location = os.path.abspath(settings.get("storage", "sqlite_path"))
+    key = "\0".join([backend, location, username]).encode()
+    return os.path.join(directory, hashlib.sha256(key).hexdigest()[:32] + ".npz")
+
+
+def save_snapshot(path, revision, budgets, expenses):
+    """Write the data as of `revision`; returns False if the expenses cannot be stored"""
+    if not all(isinstance(expense["_id"], ObjectId) for expense in expenses):
+        return False
+    category_codes = {}
+    description_codes = {}
+    arrays = {
+        "meta": np.array(json.dumps({"format": FORMAT, "revision": revision,
+                                     "budgets": budgets})),
+        "ids": np.frombuffer(b"".join(expense["_id"].binary for expense in expenses),
+                             dtype=np.uint8).reshape(-1, OBJECT_ID_BYTES),
+        # Integer microseconds: NumPy converts datetime objects one by one, far slower
+        "dates": np.array([(expense["date"] - EPOCH) // MICROSECOND for expense in expenses],
+                          dtype=np.int64).view("datetime64[us]"),
+        "amounts": np.array([expense["amount"] for expense in expenses], dtype=np.float64),
+        "category_codes": np.array(
+            [category_codes.setdefault(expense["category"], len(category_codes))
+             for expense in expenses], dtype=np.int32),
+        "description_codes": np.array(
+            [description_codes.setdefault(expense.get("description", ""), len(description_codes))
+             for expense in expenses], dtype=np.int32),
+    }
+    arrays["categories"] = np.array(list(category_codes), dtype=str)
+    arrays["descriptions"] = np.array(list(description_codes), dtype=str)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+    return True
+
+
+def load_snapshot(path):
+    """The saved data in the shape ExpenseStore.fetch() returns, or None if there is none"""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != FORMAT:
+                return None
+            ids = data["ids"].tobytes()
+            categories = data["categories"].tolist()
+            descriptions = data["descriptions"].tolist()
+            columns = zip(data["dates"].tolist(), data["amounts"].tolist(),
+                          data["category_codes"].tolist(), data["description_codes"].tolist())
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    expenses = [
+        {"_id": ObjectId(ids[i * OBJECT_ID_BYTES:(i + 1) * OBJECT_ID_BYTES]),
+         "date": date, "category": categories[category], "amount": amount,
+         "description": descriptions[description]}
+        for i, (date, amount, category, description) in enumerate(columns)
+    ]
+    return {"user": {"revision": meta["revision"], "budgets": meta["budgets"]},
+            "expenses": expenses}
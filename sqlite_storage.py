@@ -0,0 +1,334 @@
+"""Embedded SQLite storage backend.
+
+Runs entirely on the local machine: no server, no network. The database is
+opened in WAL mode, so other processes (manage.py, a second window) can read
+while one writes. Within a process every call shares one connection
+serialised by a lock, so there reads do wait for a write in progress.
+Expenses carry the same (username, date) and (username, category, date)
+indexes as the MongoDB collection, with the amount appended so the
+statistics sums are answered from the indexes alone.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from storage import DuplicateUserError, Storage, UnknownUserError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    created_at TEXT,
+    budgets TEXT NOT NULL DEFAULT '{}',
+    revision INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deleted_expenses (
+    id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS expenses_user_date ON expenses (username, date, amount);
+CREATE INDEX IF NOT EXISTS expenses_user_category_date ON expenses (username, category, date, amount);
+"""
+
+# Created after SCHEMA, once databases from before the seq column are upgraded
+SEQ_INDEXES = """
+CREATE INDEX IF NOT EXISTS expenses_user_seq ON expenses (username, seq);
+CREATE INDEX IF NOT EXISTS deleted_expenses_user_seq ON deleted_expenses (username, seq);
+"""
+
+# Expense fields that map straight onto columns
+EXPENSE_COLUMNS = ("date", "category", "amount", "description")
+
+
+def _to_db(field, value):
+    if field == "date":
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _row_to_expense(row):
+    return {
+        "_id": ObjectId(row["id"]),
+        "date": datetime.fromisoformat(row["date"]),
+        "category": row["category"],
+        "amount": row["amount"],
+        "description": row["description"]
+    }
+
+
+class SQLiteStorage(Storage):
+    """Storage backed by a local SQLite database file"""
+    def __init__(self, path, username=None):
+        super().__init__(username)
+        self.path = path
+        # One connection shared between threads, serialised by a lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            columns = [row["name"] for row in
+                       self.connection.execute("PRAGMA table_info(expenses)")]
+            if "seq" not in columns:
+                self.connection.execute(
+                    "ALTER TABLE expenses ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            self.connection.executescript(SEQ_INDEXES)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def _bump_revision(self):
+        """Increment the change counter inside the current transaction and return it"""
+        self.connection.execute(
+            "UPDATE users SET revision = revision + 1 WHERE username = ?", (self.username,))
+        row = self.connection.execute(
+            "SELECT revision FROM users WHERE username = ?", (self.username,)).fetchone()
+        if row is None:
+            raise UnknownUserError(self.username)
+        return row[0]
+
+    def _record(self, op, payload):
+        """Hook called inside every write transaction, before the change is made.
+
+        Does nothing here; the local-first storage uses it to journal writes.
+        """
+
+    def _user_row_to_dict(self, row):
+        user = {
+            "username": row["username"],
+            "created_at": datetime.fromisoformat(row["created_at"]) if row["created_at"] else None,
+            "budgets": json.loads(row["budgets"]),
+            "revision": row["revision"]
+        }
+        if "password" in row.keys():
+            user["password"] = row["password"]
+        return user
+
+    # Users
+    def find_user(self, username):
+        """Get a user's record by name"""
+        rows = self._query("SELECT * FROM users WHERE username = ?", (username,))
+        return self._user_row_to_dict(rows[0]) if rows else None
+
+    def get_credentials(self, username):
+        """Get just the name and password hash of a user"""
+        rows = self._query("SELECT username, password FROM users WHERE username = ?", (username,))
+        return {"username": rows[0]["username"], "password": rows[0]["password"]} if rows else None
+
+    def create_user(self, user):
+        """Insert a new user"""
+        created_at = user.get("created_at")
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT INTO users (username, password, created_at, budgets) VALUES (?, ?, ?, ?)",
+                    (user["username"], user["password"],
+                     created_at.isoformat(sep=" ") if created_at else None,
+                     json.dumps(user.get("budgets", {})))
+                )
+        except sqlite3.IntegrityError:
+            raise DuplicateUserError(user["username"])
+
+    def update_password(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE users SET password = ? WHERE username = ?",
+                                    (password_hash, username))
+
+    def get_user_data(self):
+        """Get the current user's profile: name, creation date, budgets and revision"""
+        rows = self._query(
+            "SELECT username, created_at, budgets, revision FROM users WHERE username = ?",
+            (self.username,))
+        return self._user_row_to_dict(rows[0]) if rows else None
+
+    def get_revision(self):
+        """Get the user's change counter, bumped by every write"""
+        rows = self._query("SELECT revision FROM users WHERE username = ?", (self.username,))
+        return rows[0]["revision"] if rows else 0
+
+    def changes_since(self, revision):
+        """Expenses changed and deleted after `revision`, or None if nothing changed"""
+        with self.lock:
+            user = self.connection.execute(
+                "SELECT revision, budgets FROM users WHERE username = ?",
+                (self.username,)).fetchone()
+            if user is None or user["revision"] == revision:
+                return None
+            expenses = self.connection.execute(
+                "SELECT * FROM expenses WHERE username = ? AND seq > ?",
+                (self.username, revision)).fetchall()
+            deleted = self.connection.execute(
+                "SELECT id FROM deleted_expenses WHERE username = ? AND seq > ?",
+                (self.username, revision)).fetchall()
+        return {
+            "revision": user["revision"],
+            "budgets": json.loads(user["budgets"]),
+            "expenses": [_row_to_expense(row) for row in expenses],
+            "deleted": [row["id"] for row in deleted]
+        }
+
+    # Expenses
+    def get_expenses(self):
+        """Get the user's expenses, newest first"""
+        rows = self._query(
+            "SELECT * FROM expenses WHERE username = ? ORDER BY date DESC", (self.username,))
+        return [_row_to_expense(row) for row in rows]
+
+    def iter_expenses(self, start=None, end=None, category=None, batch_size=1000):
+        """Stream the user's expenses, oldest first, one batch at a time"""
+        conditions = ["username = ?"]
+        params = [self.username]
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if start:
+            conditions.append("date >= ?")
+            params.append(_to_db("date", start))
+        if end:
+            conditions.append("date < ?")
+            params.append(_to_db("date", end))
+        where = " AND ".join(conditions)
+
+        # Keyset pagination, so the lock is never held while the caller works
+        last = None
+        while True:
+            if last is None:
+                sql = f"SELECT * FROM expenses WHERE {where} ORDER BY date, id LIMIT ?"
+                rows = self._query(sql, params + [batch_size])
+            else:
+                sql = (f"SELECT * FROM expenses WHERE {where} AND (date, id) > (?, ?) "
+                       f"ORDER BY date, id LIMIT ?")
+                rows = self._query(sql, params + [last["date"], last["id"], batch_size])
+            if not rows:
+                return
+            for row in rows:
+                yield _row_to_expense(row)
+            last = rows[-1]
+
+    def existing_ids(self, expense_ids):
+        """The ids (as strings) among `expense_ids` that the user still has"""
+        ids = [str(expense_id) for expense_id in expense_ids]
+        found = set()
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._query(
+                f"SELECT id FROM expenses WHERE username = ? AND id IN "
+                f"({', '.join('?' * len(chunk))})", [self.username] + chunk)
+            found.update(row["id"] for row in rows)
+        return found
+
+    def get_summary(self, month_start, month_end):
+        """Total, this month's total and top category"""
+        with self.lock:
+            count, total = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM expenses WHERE username = ?",
+                (self.username,)).fetchone()
+            monthly = self.connection.execute(
+                "SELECT COALESCE(SUM(amount), 0) FROM expenses "
+                "WHERE username = ? AND date >= ? AND date < ?",
+                (self.username, _to_db("date", month_start), _to_db("date", month_end))
+            ).fetchone()[0]
+            top = self.connection.execute(
+                "SELECT category FROM expenses WHERE username = ? "
+                "GROUP BY category ORDER BY SUM(amount) DESC LIMIT 1",
+                (self.username,)).fetchone()
+        return {
+            "count": count,
+            "total": total,
+            "monthly": monthly,
+            "top_category": top[0] if top else None
+        }
+
+    def add_expense(self, expense_data):
+        """Insert a new expense"""
+        return self.insert_expenses([expense_data])
+
+    def insert_expenses(self, expenses):
+        """Insert a batch of new expenses in one transaction"""
+        with self.lock, self.connection:
+            self._record("insert", {"expenses": expenses})
+            revision = self._bump_revision()
+            self.connection.executemany(
+                "INSERT INTO expenses (id, username, date, category, amount, description, seq) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(str(expense["_id"]), self.username, _to_db("date", expense["date"]),
+                  expense["category"], expense["amount"], expense.get("description", ""),
+                  revision)
+                 for expense in expenses])
+            return revision
+
+    def update_expense(self, expense_id, new_data):
+        """Update the fields of an existing expense"""
+        return self.update_expenses([expense_id], new_data)
+
+    def update_expenses(self, expense_ids, fields):
+        """Set the same fields on several expenses in one transaction"""
+        columns = [field for field in EXPENSE_COLUMNS if field in fields]
+        assignments = "".join(f"{column} = ?, " for column in columns)
+        values = [_to_db(column, fields[column]) for column in columns]
+        with self.lock, self.connection:
+            self._record("update", {"ids": [str(expense_id) for expense_id in expense_ids],
+                                    "fields": fields})
+            revision = self._bump_revision()
+            self.connection.executemany(
+                f"UPDATE expenses SET {assignments}seq = ? WHERE id = ? AND username = ?",
+                [values + [revision, str(expense_id), self.username]
+                 for expense_id in expense_ids])
+            return revision
+
+    def delete_expense(self, expense_id):
+        """Delete an expense"""
+        return self.delete_expenses([expense_id])
+
+    def delete_expenses(self, expense_ids):
+        """Delete several expenses in one transaction, leaving tombstones for sync"""
+        ids = [str(expense_id) for expense_id in expense_ids]
+        with self.lock, self.connection:
+            self._record("delete", {"ids": ids})
+            revision = self._bump_revision()
+            self._delete_rows(ids, revision)
+            return revision
+
+    def _delete_rows(self, ids, revision):
+        self.connection.executemany(
+            "DELETE FROM expenses WHERE id = ? AND username = ?",
+            [(expense_id, self.username) for expense_id in ids])
+        self.connection.executemany(
+            "INSERT INTO deleted_expenses (id, username, seq) VALUES (?, ?, ?)",
+            [(expense_id, self.username, revision) for expense_id in ids])
+
+    # Budgets
+    def get_budgets(self):
+        """Get the user's budgets"""
+        rows = self._query("SELECT budgets FROM users WHERE username = ?", (self.username,))
+        return json.loads(rows[0]["budgets"]) if rows else {}
+
+    def update_budgets(self, budgets):
+        """Replace the user's budgets"""
+        with self.lock, self.connection:
+            self._record("budgets", {"budgets": budgets})
+            self.connection.execute("UPDATE users SET budgets = ? WHERE username = ?",
+                                    (json.dumps(budgets), self.username))
+            return self._bump_revision()
@@ -0,0 +1,128 @@
+"""Storage interface shared by the database backends.
+
+A storage object holds users, their expenses and their budgets. It is bound
+to one username for expense and budget operations; the user-level methods
+(find_user, get_credentials, create_user, update_password) work on any
+instance, so the login window can use one opened without a username.
+
+Expenses are plain dicts with ``_id``, ``date`` (datetime), ``category``,
+``amount`` and ``description``. Every write returns the user's new
+``revision``, a counter that increases with each change; changes_since
+returns just what changed after a given revision, so callers holding a copy
+can catch up without reloading everything.
+"""
+from config import get_settings
+
+BACKENDS = ("mongodb", "sqlite", "local")
+
+
+class DuplicateUserError(Exception):
+    """Raised by create_user when the username is already taken"""
+
+
+class UnknownUserError(Exception):
+    """Raised by writes when the bound user does not exist"""
+
+
+class Storage:
+    """Operations every backend provides"""
+    def __init__(self, username=None):
+        self.username = username
+
+    def prepare(self):
+        """Make sure indexes exist and the user's data is in the current layout"""
+
+    def close(self):
+        """Release resources held by this storage"""
+
+    # Users
+    def find_user(self, username):
+        raise NotImplementedError
+
+    def get_credentials(self, username):
+        """{"password"} of a user (plus the backend's key), or None; nothing else is read"""
+        raise NotImplementedError
+
+    def create_user(self, user):
+        raise NotImplementedError
+
+    def update_password(self, username, password_hash):
+        """Replace a user's stored password hash"""
+        raise NotImplementedError
+
+    def get_user_data(self):
+        raise NotImplementedError
+
+    def get_revision(self):
+        raise NotImplementedError
+
+    def changes_since(self, revision):
+        """{"revision", "budgets", "expenses", "deleted"} after `revision`.
+
+        None if nothing changed or the user does not exist.
+        """
+        raise NotImplementedError
+
+    # Expenses
+    def get_expenses(self):
+        raise NotImplementedError
+
+    def iter_expenses(self, start=None, end=None, category=None, batch_size=1000):
+        raise NotImplementedError
+
+    def existing_ids(self, expense_ids):
+        """The ids (as strings) among `expense_ids` that the user still has"""
+        raise NotImplementedError
+
+    def get_summary(self, month_start, month_end):
+        raise NotImplementedError
+
+    def add_expense(self, expense_data):
+        raise NotImplementedError
+
+    def insert_expenses(self, expenses):
+        raise NotImplementedError
+
+    def update_expense(self, expense_id, new_data):
+        raise NotImplementedError
+
+    def update_expenses(self, expense_ids, fields):
+        raise NotImplementedError
+
+    def delete_expense(self, expense_id):
+        raise NotImplementedError
+
+    def delete_expenses(self, expense_ids):
+        raise NotImplementedError
+
+    # Budgets
+    def get_budgets(self):
+        raise NotImplementedError
+
+    def update_budgets(self, budgets):
+        raise NotImplementedError
+
+
+def open_storage(username=None, backend=None):
+    """Open the configured storage backend"""
+    settings = get_settings()
+    backend = backend or settings.get("storage", "backend")
+
+    if backend == "mongodb":
+        from db import get_database
+        from mongo_storage import MongoStorage
+        return MongoStorage(get_database(), username)
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(settings.get("storage", "sqlite_path"), username)
+    if backend == "local":
+        from db import get_database
+        from mongo_storage import MongoStorage
+        from sync import LocalFirstStorage
+        return LocalFirstStorage(
+            settings.get("storage", "sqlite_path"), username,
+            remote_factory=lambda name: MongoStorage(get_database(), name),
+            sync_interval=settings.get("sync", "interval"),
+            batch_size=settings.get("sync", "batch_size")
+        )
+    raise ValueError(f"Unknown storage backend: {backend!r} (expected one of {BACKENDS})")
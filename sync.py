@@ -0,0 +1,379 @@
+"""Local-first storage with background replication to MongoDB.
+
+Every read and write goes to a local SQLite replica, so the UI never waits on
+the network. Writes are also journaled, in the same SQLite transaction, to an
+``outbox`` table; a SyncWorker thread replays the outbox against MongoDB in
+batches, retrying with backoff while the server is unreachable, and pulls
+changes made elsewhere back into the replica. Pulls are incremental: only the
+expenses written or deleted after the last synced revision are fetched
+(``changes_since``); the full data is only downloaded on the first sync.
+
+Conflicts are detected with the user's ``revision`` counter: if the server
+revision moved since the replica was last in sync, pending edits are checked
+against the server's current data. Updates and deletes of expenses that no
+longer exist on the server are dropped; budget edits win over concurrent
+server changes. Both cases are recorded in ``sync_conflicts``.
+"""
+import json
+import threading
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+
+from sqlite_storage import SQLiteStorage
+
+SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    op TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    username TEXT PRIMARY KEY,
+    remote_revision INTEGER
+);
+CREATE TABLE IF NOT EXISTS sync_conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    op TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    detected_at TEXT NOT NULL
+);
+"""
+
+MAX_BACKOFF = 60
+DUPLICATE_KEY = 11000
+
+
+def _encode(value):
+    """JSON encoder for expense payloads"""
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def _decode(obj):
+    if "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    if "$oid" in obj:
+        return ObjectId(obj["$oid"])
+    return obj
+
+
+class LocalFirstStorage(SQLiteStorage):
+    """SQLite replica that journals writes for replication to MongoDB"""
+    def __init__(self, path, username=None, remote_factory=None,
+                 sync_interval=1, batch_size=500):
+        super().__init__(path, username)
+        self.remote_factory = remote_factory
+        self.sync_interval = sync_interval
+        self.batch_size = batch_size
+        self.worker = None
+        self._remote = None
+        with self.lock:
+            self.connection.executescript(SYNC_SCHEMA)
+
+    @property
+    def remote(self):
+        """The MongoDB storage for this user, created on first use"""
+        if self._remote is None:
+            self._remote = self.remote_factory(self.username)
+        return self._remote
+
+    def prepare(self):
+        """Start replicating the current user's data in the background.
+
+        Without a user, prepares the server instead (its indexes, including
+        the unique usernames that create_user relies on).
+        """
+        if not self.username:
+            self.remote_factory(None).prepare()
+        elif self.worker is None:
+            self.worker = SyncWorker(self, self.sync_interval, self.batch_size)
+            self.worker.start()
+
+    def close(self):
+        """Stop the sync worker and close the replica"""
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        super().close()
+
+    def _record(self, op, payload):
+        """Journal a write in the outbox (called inside the write transaction)"""
+        if op == "budgets":
+            # Keep the previous values so concurrent server edits can be detected
+            row = self.connection.execute(
+                "SELECT budgets FROM users WHERE username = ?", (self.username,)).fetchone()
+            payload = dict(payload, previous=json.loads(row["budgets"]) if row else {})
+        self.connection.execute(
+            "INSERT INTO outbox (username, op, payload, created_at) VALUES (?, ?, ?, ?)",
+            (self.username, op, json.dumps(payload, default=_encode),
+             datetime.now().isoformat(sep=" "))
+        )
+        if self.worker is not None:
+            self.worker.notify()
+
+    # Users live on the server; the replica keeps a copy for offline logins
+    def find_user(self, username):
+        """Get a user from the replica, falling back to the server"""
+        user = super().find_user(username)
+        if user is None and self.remote_factory is not None:
+            user = self.remote_factory(None).find_user(username)
+            if user is not None:
+                self._cache_user(user)
+        return user
+
+    def get_credentials(self, username):
+        """Get a user's password hash from the replica, fetching the user if missing"""
+        credentials = super().get_credentials(username)
+        if credentials is None and self.remote_factory is not None:
+            user = self.find_user(username)
+            if user is not None:
+                credentials = {"username": user["username"], "password": user["password"]}
+        return credentials
+
+    def create_user(self, user):
+        """Create the user on the server, then in the replica"""
+        self.remote_factory(None).create_user(user)
+        self._cache_user(user)
+
+    def update_password(self, username, password_hash):
+        """Change the password on the server, then in the replica"""
+        self.remote_factory(None).update_password(username, password_hash)
+        super().update_password(username, password_hash)
+
+    def _cache_user(self, user):
+        created_at = user.get("created_at")
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO users (username, password, created_at, budgets) "
+                "VALUES (?, ?, ?, ?)",
+                (user["username"], user["password"],
+                 created_at.isoformat(sep=" ") if created_at else None,
+                 json.dumps(user.get("budgets", {})))
+            )
+
+    # Replication bookkeeping, used by the SyncWorker
+    def pending_ops(self, limit):
+        """The oldest journaled writes that have not reached the server yet"""
+        rows = self._query(
+            "SELECT seq, op, payload FROM outbox WHERE username = ? ORDER BY seq LIMIT ?",
+            (self.username, limit))
+        return [{"seq": row["seq"], "op": row["op"],
+                 "payload": json.loads(row["payload"], object_hook=_decode)}
+                for row in rows]
+
+    def pending_count(self):
+        """Number of writes waiting to be replicated"""
+        return self._query("SELECT COUNT(*) FROM outbox WHERE username = ?",
+                           (self.username,))[0][0]
+
+    def ack_ops(self, last_seq):
+        """Drop journaled writes up to and including `last_seq`"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM outbox WHERE username = ? AND seq <= ?",
+                                    (self.username, last_seq))
+
+    def get_sync_revision(self):
+        """The server revision the replica was last in sync with"""
+        rows = self._query("SELECT remote_revision FROM sync_state WHERE username = ?",
+                           (self.username,))
+        return rows[0]["remote_revision"] if rows else None
+
+    def set_sync_revision(self, revision):
+        with self.lock, self.connection:
+            self._set_sync_revision(revision)
+
+    def _set_sync_revision(self, revision):
+        self.connection.execute(
+            "INSERT INTO sync_state (username, remote_revision) VALUES (?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET remote_revision = excluded.remote_revision",
+            (self.username, revision))
+
+    def record_conflict(self, op, reason):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO sync_conflicts (username, op, payload, reason, detected_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.username, op["op"], json.dumps(op["payload"], default=_encode), reason,
+                 datetime.now().isoformat(sep=" ")))
+
+    def _has_pending(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM outbox WHERE username = ?", (self.username,)).fetchone()[0]
+
+    def _upsert_rows(self, expenses, revision):
+        self.connection.executemany(
+            "INSERT INTO expenses (id, username, date, category, amount, description, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET date = excluded.date, "
+            "category = excluded.category, amount = excluded.amount, "
+            "description = excluded.description, seq = excluded.seq",
+            [(str(expense["_id"]), self.username, expense["date"].isoformat(sep=" "),
+              expense["category"], expense["amount"], expense.get("description", ""), revision)
+             for expense in expenses])
+
+    def apply_remote_state(self, user_data, expenses):
+        """Replace the replica's copy with the server's; skipped while writes are pending"""
+        with self.lock, self.connection:
+            if self._has_pending():
+                return False
+            # Bump the local revision so open views notice the change
+            revision = self._bump_revision()
+            remote_ids = {str(expense["_id"]) for expense in expenses}
+            removed = [row["id"] for row in self.connection.execute(
+                "SELECT id FROM expenses WHERE username = ?", (self.username,))
+                if row["id"] not in remote_ids]
+            self._delete_rows(removed, revision)
+            self._upsert_rows(expenses, revision)
+            self.connection.execute("UPDATE users SET budgets = ? WHERE username = ?",
+                                    (json.dumps(user_data.get("budgets", {})), self.username))
+            self._set_sync_revision(user_data.get("revision", 0))
+        return True
+
+    def apply_remote_changes(self, changes):
+        """Merge a changes_since delta from the server; skipped while writes are pending"""
+        with self.lock, self.connection:
+            if self._has_pending():
+                return False
+            revision = self._bump_revision()
+            self._upsert_rows(changes["expenses"], revision)
+            self._delete_rows(changes["deleted"], revision)
+            self.connection.execute("UPDATE users SET budgets = ? WHERE username = ?",
+                                    (json.dumps(changes["budgets"]), self.username))
+            self._set_sync_revision(changes["revision"])
+        return True
+
+
+class SyncWorker(threading.Thread):
+    """Replicates a LocalFirstStorage's outbox to MongoDB in the background"""
+    def __init__(self, local, interval=1, batch_size=500):
+        super().__init__(name=f"sync-{local.username}", daemon=True)
+        self.local = local
+        self.interval = interval
+        self.batch_size = batch_size
+        self.online = False
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self):
+        """Wake the worker up because there is something to push"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wake.set()
+        if self is not threading.current_thread():
+            self.join(timeout)
+
+    def run(self):
+        backoff = 0
+        while not self._stopping.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                # Offline or the server is unhappy: keep the outbox and retry later
+                self.online = False
+                self.last_error = e
+                backoff = min(MAX_BACKOFF, max(1, backoff * 2))
+                self._stopping.wait(backoff)
+                continue
+            self.online = True
+            self.last_error = None
+            backoff = 0
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def sync_once(self):
+        """Push pending writes, then pull whatever changed on the server"""
+        remote = self.local.remote
+        base = self.local.get_sync_revision()
+        remote_revision = remote.get_revision()
+
+        while True:
+            ops = self.local.pending_ops(self.batch_size)
+            if not ops:
+                break
+
+            # Someone else wrote since we last synced: check edits against their data
+            server = None
+            if base is None or remote_revision != base:
+                server = {"budgets": remote.get_budgets()}
+
+            pushed = 0
+            revision = remote_revision
+            for op in ops:
+                result = self._push(remote, op, server)
+                if result is not None:
+                    revision = result
+                    pushed += 1
+            self.local.ack_ops(ops[-1]["seq"])
+
+            if server is None and revision == remote_revision + pushed:
+                # Nobody wrote in between: the replica matches the server again
+                base = revision
+                self.local.set_sync_revision(base)
+            remote_revision = revision if pushed else remote.get_revision()
+
+        if base is None:
+            self.local.apply_remote_state(remote.get_user_data(), remote.get_expenses())
+        elif remote_revision != base:
+            changes = remote.changes_since(base)
+            if changes is not None:
+                self.local.apply_remote_changes(changes)
+
+    def _push(self, remote, op, server):
+        """Apply one journaled write to the server; returns the new revision or None"""
+        kind, payload = op["op"], op["payload"]
+
+        if kind == "insert":
+            try:
+                return remote.insert_expenses(payload["expenses"])
+            except BulkWriteError as e:
+                # Already pushed before a crash: inserts are keyed by _id
+                if all(error["code"] == DUPLICATE_KEY for error in e.details["writeErrors"]):
+                    return None
+                raise
+
+        if kind in ("update", "delete"):
+            ids = payload["ids"]
+            if server is not None:
+                # Asked per op, so expenses inserted earlier in this batch count as present
+                existing = remote.existing_ids(ids)
+                missing = [expense_id for expense_id in ids if expense_id not in existing]
+                if missing and kind == "update":
+                    self.local.record_conflict(op, f"deleted on server: {', '.join(missing)}")
+                ids = [expense_id for expense_id in ids if expense_id in existing]
+            if not ids:
+                return None
+            if kind == "update":
+                return remote.update_expenses(ids, payload["fields"])
+            return remote.delete_expenses(ids)
+
+        if kind == "budgets":
+            budgets = payload["budgets"]
+            if server is not None:
+                # Apply only what changed locally on top of the server's budgets
+                previous = payload["previous"]
+                merged = dict(server["budgets"])
+                for category in set(previous) | set(budgets):
+                    if previous.get(category) == budgets.get(category):
+                        continue
+                    if server["budgets"].get(category) != previous.get(category):
+                        self.local.record_conflict(op, f"budget for {category} changed on server")
+                    if category in budgets:
+                        merged[category] = budgets[category]
+                    else:
+                        merged.pop(category, None)
+                server["budgets"] = budgets = merged
+            return remote.update_budgets(budgets)
+
+        raise ValueError(f"Unknown journaled operation: {kind}")
@@ -0,0 +1,94 @@
+import os
+import sys
+import uuid
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlite_storage import SQLiteStorage  # noqa: E402
+
+# MongoDB server for the MongoDB backends; their tests are skipped without one
+MONGO_URI = os.environ.get("EXPENSE_TRACKER_TEST_MONGO_URI")
+
+STORAGE_BACKENDS = ("sqlite", "mongodb", "async-mongodb")
+
+
+def new_user(username, budgets=None):
+    return {"username": username, "password": "x", "created_at": datetime(2024, 1, 1),
+            "budgets": budgets or {}}
+
+
+@pytest.fixture
+def make_user():
+    """Factory for user documents: make_user(username, budgets=None)"""
+    return new_user
+
+
+def sqlite_opener(tmp_path):
+    path = str(tmp_path / "test.db")
+    opened = []
+
+    def open_storage(username):
+        storage = SQLiteStorage(path, username)
+        opened.append(storage)
+        return storage
+
+    def close():
+        for storage in opened:
+            storage.close()
+    return open_storage, close
+
+
+def mongo_opener():
+    from pymongo import MongoClient
+    from mongo_storage import MongoStorage
+    client = MongoClient(MONGO_URI)
+    name = f"expense_tracker_test_{uuid.uuid4().hex}"
+
+    def close():
+        client.drop_database(name)
+        client.close()
+    return lambda username: MongoStorage(client[name], username), close
+
+
+def async_mongo_opener():
+    from pymongo import AsyncMongoClient
+    from async_storage import AsyncMongoStorage, BlockingStorage, EventLoopThread
+    loop_thread = EventLoopThread()
+    client = AsyncMongoClient(MONGO_URI)
+    name = f"expense_tracker_test_{uuid.uuid4().hex}"
+
+    def open_storage(username):
+        return BlockingStorage(AsyncMongoStorage(client[name], username), loop_thread)
+
+    def close():
+        loop_thread.run(client.drop_database(name))
+        loop_thread.run(client.close())
+        loop_thread.stop()
+    return open_storage, close
+
+
+@pytest.fixture(params=STORAGE_BACKENDS)
+def open_storage(request, tmp_path):
+    """Factory opening one backend's storage for a username, all on one fresh database"""
+    if request.param == "sqlite":
+        opener, close = sqlite_opener(tmp_path)
+    elif not MONGO_URI:
+        pytest.skip("set EXPENSE_TRACKER_TEST_MONGO_URI to test the MongoDB backends")
+    elif request.param == "mongodb":
+        opener, close = mongo_opener()
+    else:
+        opener, close = async_mongo_opener()
+    yield opener
+    close()
+
+
+@pytest.fixture
+def storage(open_storage):
+    """Storage bound to a freshly created user "alice\""""
+    storage = open_storage("alice")
+    storage.prepare()
+    storage.create_user(new_user("alice"))
+    return storage
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from expense_store import ExpenseStore
+
+
+def expense(date, category="Food", amount=10.0):
+    return {"_id": ObjectId(), "date": date, "category": category, "amount": amount,
+            "description": ""}
+
+
+def test_rollups_from_a_start_day(storage):
+    storage.insert_expenses([expense(datetime(2024, 1, 10)),
+                             expense(datetime(2024, 1, 20), amount=5.0),
+                             expense(datetime(2024, 2, 3), "Rent", 500.0)])
+    store = ExpenseStore(storage)
+    store.load()
+    assert [(r["month"], r["category"], r["total"]) for r in store.get_rollups()] == [
+        ("2024-01", "Food", 15.0), ("2024-02", "Rent", 500.0)]
+    # The first month only counts the days from the start on
+    assert [(r["month"], r["total"]) for r in store.get_rollups(datetime(2024, 1, 15))] == [
+        ("2024-01", 5.0), ("2024-02", 500.0)]
+
+
+def test_adding_an_expense_a_poll_already_delivered(storage):
+    store = ExpenseStore(storage)
+    store.load()
+    store.get_summary()  # build the columnar table so it is kept current too
+    item = expense(datetime(2024, 1, 10))
+    apply = store.add_expense(dict(item))
+    store.apply_changes(store.fetch_changes())
+    apply()
+    assert [e["_id"] for e in store.get_expenses()] == [item["_id"]]
+    assert store.get_summary()["count"] == 1
+
+
+def test_a_delta_without_changes_leaves_the_cache_alone(storage):
+    item = expense(datetime(2024, 1, 10))
+    storage.add_expense(item)
+    store = ExpenseStore(storage)
+    store.load()
+    version = store.version
+    # As after a local-first sync: the same expense under a new revision
+    changes = {"revision": store.revision + 1, "expenses": [dict(item)], "deleted": [],
+               "budgets": {}}
+    assert not store.apply_changes(changes)
+    assert store.revision == changes["revision"] and store.version == version
+
+    changes = {"revision": store.revision + 1, "expenses": [dict(item, amount=99.0)],
+               "deleted": [], "budgets": {}}
+    assert store.apply_changes(changes)
+    assert store.get_expense(item["_id"])["amount"] == 99.0
@@ -0,0 +1,32 @@
+from bson.objectid import ObjectId
+
+from search_index import SearchIndex
+
+
+def expense(category, description, amount=10.0):
+    return {"_id": ObjectId(), "category": category, "amount": amount,
+            "description": description}
+
+
+def test_search_matches_any_field():
+    lunch, rent = expense("Food", "lunch at cafe"), expense("Housing", "rent", 950.0)
+    index = SearchIndex([lunch, rent])
+    assert index.search("CAFE") == {str(lunch["_id"])}
+    assert index.search("950") == {str(rent["_id"])}
+    assert index.search("ou") == {str(rent["_id"])}
+    assert index.search("missing") == set()
+
+
+def test_fields_with_the_same_value_can_be_edited_and_removed():
+    item = expense("Food", "food")
+    other = expense("Food", "groceries")
+    index = SearchIndex([item, other])
+
+    index.update(dict(item, description="dinner"))
+    assert index.search("dinner") == {str(item["_id"])}
+    assert index.search("food") == {str(item["_id"]), str(other["_id"])}
+
+    index.remove(item["_id"])
+    index.remove(other["_id"])
+    assert len(index) == 0
+    assert index.docs == {} and index.postings == {}
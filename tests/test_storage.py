@@ -0,0 +1,156 @@
+from datetime import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from mongo_storage import MongoStorage, new_documents
+from storage import DuplicateUserError, UnknownUserError
+
+
+def expense(day, category="Food", amount=10.0, description="", month=1):
+    return {"_id": ObjectId(), "date": datetime(2024, month, day), "category": category,
+            "amount": amount, "description": description}
+
+
+def ids(expenses):
+    return {str(e["_id"]) for e in expenses}
+
+
+def test_users(storage, make_user):
+    with pytest.raises(DuplicateUserError):
+        storage.create_user(make_user("alice"))
+    assert storage.find_user("nobody") is None
+    assert storage.get_credentials("alice")["password"] == "x"
+    storage.update_password("alice", "y")
+    assert storage.get_credentials("alice")["password"] == "y"
+    assert "password" not in storage.get_user_data()
+
+
+def test_crud(storage):
+    first, second = expense(1), expense(2, "Rent", 500.0)
+    storage.add_expense(first)
+    storage.insert_expenses([second])
+    assert [e["_id"] for e in storage.get_expenses()] == [second["_id"], first["_id"]]
+
+    storage.update_expense(first["_id"], {"amount": 12.5, "description": "lunch"})
+    updated = {str(e["_id"]): e for e in storage.get_expenses()}[str(first["_id"])]
+    assert updated["amount"] == 12.5 and updated["description"] == "lunch"
+
+    storage.update_expenses([first["_id"], second["_id"]], {"category": "Other"})
+    assert {e["category"] for e in storage.get_expenses()} == {"Other"}
+
+    storage.delete_expense(first["_id"])
+    assert ids(storage.get_expenses()) == {str(second["_id"])}
+    storage.delete_expenses([second["_id"]])
+    assert storage.get_expenses() == []
+
+    storage.update_budgets({"Food": 100.0})
+    assert storage.get_budgets() == {"Food": 100.0}
+
+
+def test_every_write_bumps_the_revision(storage):
+    item = expense(1)
+    revisions = [storage.get_revision(),
+                 storage.add_expense(item),
+                 storage.update_expense(item["_id"], {"amount": 1.0}),
+                 storage.update_budgets({"Food": 5.0}),
+                 storage.delete_expense(item["_id"])]
+    assert revisions == [0, 1, 2, 3, 4]
+    assert storage.get_revision() == 4
+
+
+def test_changes_since(storage):
+    kept, edited, removed = expense(1), expense(2), expense(3)
+    base = storage.insert_expenses([kept, edited, removed])
+    assert storage.changes_since(base) is None
+
+    storage.update_expense(edited["_id"], {"amount": 99.0})
+    added = expense(4)
+    storage.add_expense(added)
+    storage.delete_expense(removed["_id"])
+    storage.update_budgets({"Food": 20.0})
+
+    changes = storage.changes_since(base)
+    assert changes["revision"] == storage.get_revision()
+    assert ids(changes["expenses"]) == {str(edited["_id"]), str(added["_id"])}
+    assert changes["deleted"] == [str(removed["_id"])]
+    assert changes["budgets"] == {"Food": 20.0}
+    assert storage.changes_since(changes["revision"]) is None
+
+
+def test_deletes_leave_tombstones(storage):
+    item = expense(1)
+    storage.add_expense(item)
+    revision = storage.delete_expense(item["_id"])
+    changes = storage.changes_since(revision - 1)
+    assert changes["expenses"] == [] and changes["deleted"] == [str(item["_id"])]
+
+
+def test_iter_expenses_pages_in_date_order(storage):
+    # Equal dates exercise the (date, id) keyset tie-breaker across pages
+    expenses = [expense(day % 5 + 1, "Food" if day % 2 else "Rent") for day in range(23)]
+    storage.insert_expenses(expenses)
+
+    streamed = list(storage.iter_expenses(batch_size=4))
+    assert ids(streamed) == ids(expenses) and len(streamed) == len(expenses)
+    assert [e["date"] for e in streamed] == sorted(e["date"] for e in expenses)
+
+    food = list(storage.iter_expenses(category="Food", batch_size=3))
+    assert ids(food) == ids(e for e in expenses if e["category"] == "Food")
+
+    window = list(storage.iter_expenses(start=datetime(2024, 1, 2), end=datetime(2024, 1, 4),
+                                        batch_size=2))
+    assert ids(window) == ids(e for e in expenses
+                              if datetime(2024, 1, 2) <= e["date"] < datetime(2024, 1, 4))
+
+
+def test_summary(storage):
+    storage.insert_expenses([expense(1, amount=10.0), expense(2, "Rent", 500.0, month=2)])
+    summary = storage.get_summary(datetime(2024, 2, 1), datetime(2024, 3, 1))
+    assert summary == {"count": 2, "total": 510.0, "monthly": 500.0, "top_category": "Rent"}
+
+
+def test_other_users_are_not_visible(storage, open_storage, make_user):
+    storage.create_user(make_user("bob"))
+    storage.add_expense(expense(1))
+    bob = open_storage("bob")
+    assert bob.get_expenses() == []
+    assert bob.changes_since(0) is None
+
+
+def test_existing_ids(storage):
+    kept, removed = expense(1), expense(2)
+    storage.insert_expenses([kept, removed])
+    storage.delete_expense(removed["_id"])
+    assert storage.existing_ids([kept["_id"], removed["_id"], ObjectId()]) == {str(kept["_id"])}
+
+
+def test_changes_since_for_a_missing_user(open_storage):
+    assert open_storage("ghost").changes_since(0) is None
+
+
+def test_writes_for_a_missing_user_fail(open_storage):
+    ghost = open_storage("ghost")
+    with pytest.raises(UnknownUserError):
+        ghost.add_expense(expense(1))
+    with pytest.raises(UnknownUserError):
+        ghost.update_budgets({"Food": 1.0})
+    assert ghost.get_expenses() == []
+
+
+def test_write_whose_reservation_expired_is_published_again(storage):
+    if not isinstance(storage, MongoStorage):
+        pytest.skip("only MongoStorage reserves change numbers")
+    slow, fast = expense(1), expense(2)
+    reservation = storage._allocate_revision()
+    # The slow write outlives its reservation, and a later one publishes past it
+    storage.users_collection.update_one({"username": "alice"},
+                                        {"$set": {"pending_seqs.0.at": datetime(2000, 1, 1)}})
+    storage.add_expense(fast)
+    seen = storage.changes_since(0)
+    assert ids(seen["expenses"]) == {str(fast["_id"])}
+
+    storage.expenses_collection.insert_many(new_documents("alice", [slow], reservation))
+    revision = storage._publish_revision(reservation)
+    assert revision > seen["revision"] == reservation + 1
+    assert ids(storage.changes_since(seen["revision"])["expenses"]) == {str(slow["_id"])}
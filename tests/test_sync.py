@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from sqlite_storage import SQLiteStorage
+from sync import LocalFirstStorage, SyncWorker
+
+
+@pytest.fixture
+def replica(tmp_path, make_user):
+    """A local-first replica of "alice" whose server is another SQLite file"""
+    server_path = str(tmp_path / "server.db")
+    remotes = []
+
+    def remote_factory(username):
+        remote = SQLiteStorage(server_path, username)
+        remotes.append(remote)
+        return remote
+
+    # No prepare(): writes stay in the outbox until the test syncs by hand
+    local = LocalFirstStorage(str(tmp_path / "replica.db"), "alice", remote_factory)
+    local.create_user(make_user("alice"))
+    yield local
+    local.close()
+    for remote in remotes:
+        remote.close()
+
+
+def sync(local):
+    SyncWorker(local).sync_once()
+
+
+def conflicts(local):
+    return local._query("SELECT reason FROM sync_conflicts")
+
+
+def new_expense():
+    return {"_id": ObjectId(), "date": datetime(2024, 1, 1), "category": "Food",
+            "amount": 10.0, "description": ""}
+
+
+def test_offline_insert_then_update_reaches_the_server(replica):
+    item = new_expense()
+    replica.add_expense(item)
+    replica.update_expense(item["_id"], {"amount": 42.0})
+    sync(replica)
+
+    assert [e["amount"] for e in replica.remote.get_expenses()] == [42.0]
+    assert [e["amount"] for e in replica.get_expenses()] == [42.0]
+    assert conflicts(replica) == []
+
+
+def test_offline_insert_then_delete_stays_deleted(replica):
+    kept, removed = new_expense(), new_expense()
+    replica.insert_expenses([kept, removed])
+    replica.delete_expense(removed["_id"])
+    sync(replica)
+
+    assert [e["_id"] for e in replica.remote.get_expenses()] == [kept["_id"]]
+    assert [e["_id"] for e in replica.get_expenses()] == [kept["_id"]]
+
+
+def test_update_of_expense_deleted_on_server_is_a_conflict(replica):
+    item = new_expense()
+    replica.add_expense(item)
+    sync(replica)
+
+    replica.remote.delete_expense(item["_id"])
+    replica.update_expense(item["_id"], {"amount": 1.0})
+    sync(replica)
+
+    assert replica.remote.get_expenses() == []
+    assert replica.get_expenses() == []
+    assert [row["reason"] for row in conflicts(replica)] == [f"deleted on server: {item['_id']}"]
@@ -0,0 +1,125 @@
+"""Treeview that only materialises the rows on screen.
+
+A ttk.Treeview gets slower with every item it holds, so for long histories
+the table keeps just a window of rows (the visible page plus a small buffer)
+and drives its own scrollbar over the full result. Scrolling refills the
+window from the underlying sequence, which is sliced by position, so moving
+anywhere in a list of any length costs the same few inserts.
+"""
+from tkinter import ttk
+
+# Rows materialised below the visible page
+BUFFER_ROWS = 5
+# Rows moved per mouse wheel notch
+WHEEL_ROWS = 3
+
+
+class VirtualTreeview:
+    """A Treeview showing a window onto a (possibly huge) sequence of rows"""
+    def __init__(self, parent, columns, row_values, row_key, **tree_options):
+        self.row_values = row_values
+        self.row_key = row_key
+        self.rows = []
+        self.offset = 0
+        self.page_size = 20
+        self.selected = set()
+        self._window = []
+
+        self.tree = ttk.Treeview(parent, columns=columns, **tree_options)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._on_wheel)
+        self.tree.bind("<Up>", lambda e: self._move_focus(-1))
+        self.tree.bind("<Down>", lambda e: self._move_focus(1))
+        self.tree.bind("<Prior>", lambda e: self._move_focus(-self.page_size))
+        self.tree.bind("<Next>", lambda e: self._move_focus(self.page_size))
+        self.tree.bind("<Home>", lambda e: self._move_focus(-len(self.rows)))
+        self.tree.bind("<End>", lambda e: self._move_focus(len(self.rows)))
+
+    def set_rows(self, rows, keep_position=True):
+        """Show a new result; only the current window is rendered"""
+        self.rows = rows
+        if not keep_position:
+            self.offset = 0
+        if self.selected:
+            # Drop selected rows that are no longer part of the result
+            self.selected &= {str(self.row_key(row)) for row in rows}
+        self.render()
+
+    def selected_keys(self):
+        """Keys of the selected rows, including ones scrolled out of view"""
+        return list(self.selected)
+
+    def render(self):
+        """Refill the window at the current offset"""
+        total = len(self.rows)
+        self.offset = max(0, min(self.offset, total - self.page_size))
+        window = self.rows[self.offset:self.offset + self.page_size + BUFFER_ROWS]
+
+        self.tree.delete(*self.tree.get_children())
+        self._window = []
+        for row in window:
+            key = str(self.row_key(row))
+            self.tree.insert("", "end", iid=key, values=self.row_values(row))
+            self._window.append(key)
+        self.tree.selection_set([key for key in self._window if key in self.selected])
+        self.tree.yview_moveto(0)
+
+        if total:
+            self.scrollbar.set(self.offset / total,
+                               min(1.0, (self.offset + self.page_size) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_to(self, offset):
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages")"""
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.rows)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.page_size if args[2] == "pages" else 1)
+            self.scroll_to(self.offset + step)
+
+    def _on_resize(self, event):
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # One row's worth of height goes to the headings
+        page_size = max(1, event.height // rowheight - 1)
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.render()
+
+    def _on_select(self, event):
+        # Rows outside the window keep their selection state
+        self.selected = (self.selected - set(self._window)) | set(self.tree.selection())
+
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - WHEEL_ROWS)
+        else:
+            self.scroll_to(self.offset + WHEEL_ROWS)
+        return "break"
+
+    def _move_focus(self, step):
+        """Keyboard navigation across the whole result, not just the window"""
+        if not self.rows:
+            return "break"
+        focus = self.tree.focus()
+        index = self.offset + (self._window.index(focus) if focus in self._window else 0)
+        index = max(0, min(index + step, len(self.rows) - 1))
+
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.page_size:
+            self.offset = index - self.page_size + 1
+        key = str(self.row_key(self.rows[index]))
+        self.selected = {key}
+        self.render()
+        self.tree.focus(key)
+        return "break"